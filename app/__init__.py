@@ -1,36 +1,70 @@
+import os
+import click
 from flask import Flask, redirect, url_for, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, current_user
 from config import Config
-from datetime import datetime
 
 # Khởi tạo các extension
 db = SQLAlchemy()
 login_manager = LoginManager()
 
-def create_app():
+from .last_seen import last_seen_buffer
+from .presence import presence_tracker
+from .identity import identity_cache, register_invalidation_events
+from .passwords import password_hasher, HasherBusy
+from .counters import stat_counters, register_counter_events
+from .jobs import job_runner
+
+def create_app(config_class=Config):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
 
     # Init extensions
     db.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
+    last_seen_buffer.init_app(app)
+    presence_tracker.init_app(app)
+    identity_cache.init_app(app)
+    password_hasher.init_app(app)
+    stat_counters.init_app(app)
+    job_runner.init_app(app)
 
     # --- IMPORT MODEL USER (QUAN TRỌNG: Để tránh lỗi NameError) ---
     from .models import User
 
     # --- CẤU HÌNH LOGIN MANAGER ---
+    # Đọc từ cache danh tính trong RAM, chỉ query khi cache miss / hết hạn
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return identity_cache.get(int(user_id))
+
+    register_invalidation_events()
+
+    # Chỉ mục tìm kiếm không dấu tự cập nhật khi user / hồ sơ SV, GV thay đổi
+    from .search_index import register_search_events
+    register_search_events()
+
+    # Bộ đếm dashboard tự tăng / giảm khi thêm / xóa bản ghi qua ORM
+    register_counter_events()
+
+    # Nạp các module khai báo loại việc nền (@job_type) để thread điều phối biết cách chạy
+    from . import semester_close, grading, timetable_solver
 
     # --- TÍNH NĂNG: CẬP NHẬT THỜI GIAN HOẠT ĐỘNG (LAST SEEN) ---
+    # Chỉ ghi vào bộ đệm trong RAM, thread nền flush theo lô (xem app/last_seen.py)
     @app.before_request
     def update_last_seen():
         if current_user.is_authenticated:
-            current_user.last_seen = datetime.utcnow()
-            db.session.commit()
+            last_seen_buffer.touch(current_user.id)
+            presence_tracker.touch(current_user.id, current_user.role)
+
+    # --- PROCESS POOL BĂM MẬT KHẨU QUÁ TẢI: TỪ CHỐI NGAY, BÁO THỜI GIAN THỬ LẠI ---
+    @app.errorhandler(HasherBusy)
+    def hasher_busy(e):
+        return (f'Hệ thống đang bận, vui lòng thử lại sau {e.retry_after} giây.', 503,
+                {'Retry-After': str(e.retry_after)})
 
     # --- ĐĂNG KÝ BLUEPRINTS ---
     from .auth import auth as auth_blueprint
@@ -57,8 +91,80 @@ def create_app():
                 return redirect(url_for('student.dashboard'))
         return redirect(url_for('auth.login'))
 
-    # Tạo Database nếu chưa có
+    # --- LỆNH CLI BẢO TRÌ (flask <tên-lệnh>) ---
+    @app.cli.command('rebuild-seats')
+    def rebuild_seats_command():
+        """Tính lại sĩ số lớp (enrolled_count) từ bảng enrollments."""
+        from .seats import rebuild_seat_counts
+        rebuild_seat_counts()
+        print('Đã tính lại sĩ số các lớp.')
+
+    @app.cli.command('rebuild-schedule-masks')
+    def rebuild_schedule_masks_command():
+        """Dựng lại bitmap thời khóa biểu của lớp và sinh viên."""
+        from .bitmaps import rebuild_all_masks
+        rebuild_all_masks()
+        print('Đã dựng lại bitmap thời khóa biểu.')
+
+    @app.cli.command('rebuild-attendance-summary')
+    def rebuild_attendance_summary_command():
+        """Tính lại bảng tổng hợp điểm danh từ attendance_logs."""
+        from .attendance import rebuild_attendance_summary
+        rebuild_attendance_summary()
+        print('Đã tính lại bảng tổng hợp điểm danh.')
+
+    @app.cli.command('rebuild-gpa')
+    def rebuild_gpa_command():
+        """Tính lại GPA học kỳ / tích lũy của mọi sinh viên."""
+        from .transcript import rebuild_all_gpa
+        rebuild_all_gpa()
+        print('Đã tính lại GPA.')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Dựng lại chỉ mục tìm kiếm người dùng (không dấu)."""
+        from .search_index import rebuild_search_index
+        rebuild_search_index()
+        print('Đã dựng lại chỉ mục tìm kiếm.')
+
+    @app.cli.command('reconcile-counters')
+    def reconcile_counters_command():
+        """Đếm lại các số liệu của dashboard từ dữ liệu thật."""
+        stat_counters.reconcile()
+        print('Đã đối soát bộ đếm thống kê.')
+
+    @app.cli.command('rebuild-grade-stats')
+    def rebuild_grade_stats_command():
+        """Tính lại thống kê phổ điểm của mọi lớp."""
+        from .grade_analytics import rebuild_grade_stats
+        rebuild_grade_stats()
+        print('Đã tính lại thống kê phổ điểm.')
+
+    @app.cli.command('jobs-worker')
+    def jobs_worker_command():
+        """Chạy hàng đợi việc nền trong process riêng (dùng với JOB_RUNNER_IN_WEB=False)."""
+        print(f'Đang chạy việc nền với {job_runner.workers} thread...')
+        job_runner.serve()
+
+    @app.cli.command('recompute-grades')
+    @click.argument('semester_id', type=int)
+    def recompute_grades_command(semester_id):
+        """Tính lại điểm tổng kết mọi lớp của 1 học kỳ từ các cột điểm."""
+        from .grading import recompute_semester_totals
+        changed = recompute_semester_totals(semester_id)
+        db.session.commit()
+        print(f'Đã tính lại điểm tổng kết, {changed} lượt đăng ký thay đổi.')
+
+    # Tạo Database nếu chưa có, bổ sung cột / ràng buộc mới cho DB cũ (xem app/schema_upgrade.py)
     with app.app_context():
-        db.create_all()
+        from .schema_upgrade import upgrade_schema
+        for step in upgrade_schema():
+            app.logger.warning('Nâng cấp schema: %s', step)
+
+    # Process web nhận việc ngay khi khởi động, không chờ request đầu tiên. Lệnh `flask ...`
+    # (FLASK_RUN_FROM_CLI) thì không: lệnh chạy 1 lần sẽ thoát giữa chừng việc đã nhận,
+    # còn `flask jobs-worker` tự chạy vòng điều phối; `flask run` bắt đầu ở request đầu tiên
+    if os.environ.get('FLASK_RUN_FROM_CLI') != 'true':
+        job_runner.ensure_started()
 
     return app
\ No newline at end of file
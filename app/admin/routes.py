@@ -1,16 +1,33 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_file
 from flask_login import login_required, current_user
-from datetime import datetime, timedelta
+from datetime import datetime
 from . import admin
 from .. import db
-from ..models import User, Student, Teacher, Subject, Class, Semester, Schedule, Enrollment
+from ..models import User, Student, Teacher, Subject, Class, Semester, Schedule
 # Import hàm check trùng lịch mới từ utils
-from ..utils import admin_required, check_schedule_conflict
+from ..utils import admin_required, check_schedule_conflict, generate_email_prefix
+from ..presence import presence_tracker
+from ..identity import identity_cache
+from ..passwords import password_hasher
+from ..counters import stat_counters, semester_key
+from ..jobs import enqueue, job_dict, latest_jobs, RUNNING_STATES
+from ..grade_analytics import semester_stats
+from ..models import Job
+from ..bitmaps import refresh_class_mask, check_lesson_range
+from .. import occupancy
+from ..schedule_import import read_schedule_file, import_schedules, ImportFormatError
+from ..exports import semester_rows, transcript_rows, count_enrollments, export_response
+from ..pagination import keyset_page, approximate_count
+from ..search_index import user_match_clause, search_users
+from ..onboarding import (OnboardingError, read_student_file, onboard_students, credentials_csv,
+                          allocate_codes, assign_emails, format_code, new_student_password)
+from sqlalchemy import false
+from sqlalchemy.orm import contains_eager
+import io
 import unicodedata # Thêm thư viện này ở đầu file để xử lý tiếng Việt
-import re
 import string
 import secrets  # Thư viện sinh số ngẫu nhiên an toàn
-from ..models import Subject, GradeWeight
+from ..models import Subject, GradeWeight, SessionException
 
 
 
@@ -20,13 +37,27 @@ from ..models import Subject, GradeWeight
 @login_required
 @admin_required
 def dashboard():
+    # Số liệu đếm sẵn (app/counters.py): 1 query đọc bộ đếm thay vì COUNT(*) từng bảng
+    semesters = Semester.query.filter_by(is_active=True).order_by(Semester.start_date.desc()).all()
+    counts = stat_counters.read([s.id for s in semesters])
     stats = {
-        'total_students': Student.query.count(),
-        'total_teachers': Teacher.query.count(),
-        'total_classes': Class.query.count(),
-        'active_semesters': Semester.query.filter_by(is_active=True).count()
+        'total_students': counts['students'],
+        'total_teachers': counts['teachers'],
+        'total_users': counts['users'],
+        'total_subjects': counts['subjects'],
+        'total_classes': counts['classes'],
+        'active_semesters': counts['active_semesters'],
+        'active_classes': sum(counts[semester_key(s.id, 'classes')] for s in semesters),
+        'online_users': presence_tracker.counts()['total']
     }
-    return render_template('admin/dashboard.html', stats=stats)
+    semester_stats = [{
+        'semester': s,
+        'classes': counts[semester_key(s.id, 'classes')],
+        'enrollments': counts[semester_key(s.id, 'enrollments')],
+        'unscheduled_classes': counts[semester_key(s.id, 'unscheduled_classes')],
+        'ungraded': counts[semester_key(s.id, 'ungraded')]
+    } for s in semesters]
+    return render_template('admin/dashboard.html', stats=stats, semester_stats=semester_stats)
 
 
 # --- THEO DÕI NGƯỜI DÙNG ONLINE ---
@@ -34,142 +65,205 @@ def dashboard():
 @login_required
 @admin_required
 def active_users():
-    now = datetime.utcnow()
-    # Nếu dùng server_default trong model thì logic này vẫn chạy ổn với trường hợp xem user active gần đây
-    five_min_ago = now - timedelta(minutes=5)
-    online_users = User.query.filter(User.last_seen >= five_min_ago).order_by(User.last_seen.desc()).all()
-    return render_template('admin/active_users.html', online_users=online_users)
+    # Lấy danh sách online từ presence tracker (chỉ các user hoạt động trong 5 phút gần đây)
+    role = request.args.get('role')
+    online = presence_tracker.online(role)
+    users_by_id = {u.id: u for u in User.query.filter(User.id.in_([uid for uid, _, _ in online])).all()} \
+        if online else {}
+
+    online_users = []
+    for uid, user_role, seen_at in online:
+        user = users_by_id.get(uid)
+        if user:
+            online_users.append({
+                'full_name': user.full_name,
+                'email': user.email,
+                'role': user_role,
+                'last_seen': datetime.utcfromtimestamp(seen_at)  # Thời điểm thật, không chờ flush
+            })
+    return render_template('admin/active_users.html', online_users=online_users,
+                           counts=presence_tracker.counts(), current_role=role)
+
+
+# API: Số người online (dashboard gọi định kỳ)
+@admin.route('/api/online_count', methods=['GET'])
+@login_required
+@admin_required
+def online_count():
+    return jsonify(presence_tracker.counts())
 
 
-def generate_email_prefix(full_name):
-    """
-    Chuyển "Nguyễn Văn An" -> "annv"
-    """
-    # 1. Chuyển tiếng Việt có dấu thành không dấu
-    text = unicodedata.normalize('NFD', full_name)
-    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
-    text = text.replace('đ', 'd').replace('Đ', 'D')
+# API: Thống kê cache danh tính (hit/miss) của worker hiện tại
+@admin.route('/api/identity_cache_stats', methods=['GET'])
+@login_required
+@admin_required
+def identity_cache_stats():
+    return jsonify(identity_cache.stats())
 
-    # 2. Tách từ và xử lý
-    parts = text.lower().split()
-    if not parts: return "student"
 
-    # Tên (từ cuối cùng)
-    first_name = parts[-1]
+# API: Số liệu pool băm mật khẩu (độ trễ băm, thời gian chờ trong hàng) của worker hiện tại
+@admin.route('/api/password_hasher_stats', methods=['GET'])
+@login_required
+@admin_required
+def password_hasher_stats():
+    return jsonify(password_hasher.stats())
 
-    # Họ lót (các từ đầu) -> lấy chữ cái đầu
-    initials = "".join([p[0] for p in parts[:-1]])
 
-    return f"{first_name}{initials}"
+# --- 1. QUẢN LÝ SINH VIÊN ---
+MAJORS = [
+    {'code': 'GIT', 'name': 'CNTT - Kỹ sư phần mềm'},
+    {'code': 'GBA', 'name': 'Quản trị kinh doanh'},
+    {'code': 'GMM', 'name': 'Marketing số'},
+    {'code': 'GAI', 'name': 'Trí tuệ nhân tạo'},
+    {'code': 'NS', 'name': 'An toàn thông tin'},
+]
+COHORTS = ['K20', 'K21', 'K22', 'K23', 'K24', 'K25', 'K26']
 
 
-# --- 1. QUẢN LÝ SINH VIÊN ---
 @admin.route('/students', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def manage_students():
-    MAJORS = [
-        {'code': 'GIT', 'name': 'CNTT - Kỹ sư phần mềm'},
-        {'code': 'GBA', 'name': 'Quản trị kinh doanh'},
-        {'code': 'GMM', 'name': 'Marketing số'},
-        {'code': 'GAI', 'name': 'Trí tuệ nhân tạo'},
-        {'code': 'NS', 'name': 'An toàn thông tin'},
-    ]
-    COHORTS = ['K20', 'K21', 'K22', 'K23', 'K24', 'K25', 'K26']
-
     # --- XỬ LÝ POST: THÊM SINH VIÊN ---
     if request.method == 'POST':
-        full_name = request.form.get('full_name')
+        full_name = (request.form.get('full_name') or '').strip()
         major_code = request.form.get('major_code')
         cohort = request.form.get('cohort')
         class_name = request.form.get('class_name')
 
-        # 1. Tự động sinh Mã Sinh Viên (GIT001...)
-        last_student = Student.query.filter(Student.student_code.like(f"{major_code}%")) \
-            .order_by(Student.student_code.desc()).first()
-
-        if last_student:
-            try:
-                last_number = int(last_student.student_code[-3:])
-                new_number = last_number + 1
-            except ValueError:
-                new_number = 1
-        else:
-            new_number = 1
+        # 0. Kiểm tra dữ liệu TRƯỚC khi cấp mã (cấp mã commit ngay, lỗi sau đó sẽ làm nhảy số)
+        if not full_name or major_code not in {m['code'] for m in MAJORS} or cohort not in COHORTS:
+            flash('Lỗi: Vui lòng nhập họ tên, chọn ngành và khóa hợp lệ!', 'danger')
+            return redirect(url_for('admin.manage_students'))
 
-        new_student_code = f"{major_code}{str(new_number).zfill(3)}"
+        # 1. Tự động sinh Mã Sinh Viên (GIT001...) từ bộ đếm theo ngành (không trùng khi nhiều admin cùng thêm)
+        new_student_code = format_code(major_code, allocate_codes(major_code, 1))
 
-        # 2. Tự động sinh Email
-        email_prefix = generate_email_prefix(full_name)
-        email = f"{email_prefix}.{new_student_code.lower()}@vku.udn.vn"
+        # 2. Tự động sinh Email (trùng thì thêm số như khi nhập file, không bỏ mã vừa cấp)
+        email = assign_emails([full_name], [new_student_code])[0]
 
         # 3. Tự động sinh Mật khẩu: [MãSV] + [5 ký tự ngẫu nhiên]
         # Ví dụ: GIT001 + aB3xZ -> GIT001aB3xZ
-        random_chars = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(5))
-        generated_password = f"{new_student_code}{random_chars}"
-
-        if User.query.filter_by(email=email).first():
-            flash(f'Lỗi: Email {email} đã tồn tại!', 'danger')
-        else:
-            # 4. Tạo User
-            new_user = User(email=email, full_name=full_name, role='student')
-            new_user.set_password(generated_password)  # Lưu mật khẩu đã mã hóa
-            db.session.add(new_user)
-            db.session.commit()
-
-            # 5. Tạo Student
-            new_student = Student(
-                user_id=new_user.id,
-                student_code=new_student_code,
-                class_name=class_name,
-                major=next((m['name'] for m in MAJORS if m['code'] == major_code), major_code),
-                cohort=cohort
-            )
-            db.session.add(new_student)
-            db.session.commit()
+        generated_password = new_student_password(new_student_code)
+
+        # 4. Tạo User
+        new_user = User(email=email, full_name=full_name, role='student')
+        new_user.set_password(generated_password)  # Lưu mật khẩu đã mã hóa
+        db.session.add(new_user)
+        db.session.flush()
+
+        # 5. Tạo Student (commit chung 1 lần với User)
+        new_student = Student(
+            user_id=new_user.id,
+            student_code=new_student_code,
+            class_name=class_name,
+            major=next((m['name'] for m in MAJORS if m['code'] == major_code), major_code),
+            cohort=cohort
+        )
+        db.session.add(new_student)
+        db.session.commit()
 
-            # 6. THÔNG BÁO QUAN TRỌNG: Hiển thị mật khẩu ra cho Admin thấy
-            # Sử dụng HTML safe trong flash message ở frontend nếu cần, hoặc format text rõ ràng
-            flash_message = (
-                f"✅ Đã tạo thành công!<br>"
-                f"👤 SV: <b>{full_name}</b><br>"
-                f"📧 Email: <b>{email}</b><br>"
-                f"🔑 Mật khẩu: <b style='font-size: 1.2em; color: #d63384;'>{generated_password}</b>"
-            )
-            flash(flash_message, 'success')
+        # 6. THÔNG BÁO QUAN TRỌNG: Hiển thị mật khẩu ra cho Admin thấy
+        # Sử dụng HTML safe trong flash message ở frontend nếu cần, hoặc format text rõ ràng
+        flash_message = (
+            f"✅ Đã tạo thành công!<br>"
+            f"👤 SV: <b>{full_name}</b><br>"
+            f"📧 Email: <b>{email}</b><br>"
+            f"🔑 Mật khẩu: <b style='font-size: 1.2em; color: #d63384;'>{generated_password}</b>"
+        )
+        flash(flash_message, 'success')
 
         return redirect(url_for('admin.manage_students'))
 
-    # --- XỬ LÝ GET (Giữ nguyên như cũ) ---
-    query = Student.query.join(User)
-
-    f_major = request.args.get('major')
-    f_cohort = request.args.get('cohort')
-    f_class = request.args.get('class_name')
-    f_search = request.args.get('search')
-
-    if f_major: query = query.filter(Student.major == f_major)
-    if f_cohort: query = query.filter(Student.cohort == f_cohort)
-    if f_class: query = query.filter(Student.class_name.contains(f_class))
-    if f_search:
-        query = query.filter(
-            (User.full_name.contains(f_search)) |
-            (Student.student_code.contains(f_search)) |
-            (User.email.contains(f_search))
-        )
-
-    students = query.order_by(Student.student_code.desc()).all()
+    # --- XỬ LÝ GET: 1 trang theo con trỏ (keyset trên student_code) ---
+    query, filters = _student_list_query(request.args)
+    students, next_cursor = keyset_page(query, Student.student_code, request.args.get('cursor'), descending=True)
+    total = approximate_count(('students',) + tuple(sorted(filters.items())), query)
     all_majors_db = db.session.query(Student.major).distinct().all()
     all_cohorts_db = db.session.query(Student.cohort).distinct().all()
 
     return render_template('admin/students.html',
                            students=students,
+                           total=total,
+                           filters=filters,
+                           next_cursor=next_cursor,
+                           is_first_page=not request.args.get('cursor'),
                            all_majors=all_majors_db,
                            all_cohorts=all_cohorts_db,
                            majors_list=MAJORS,
                            cohorts_list=COHORTS)
 
 
+def _student_list_query(args):
+    """Query danh sách SV theo bộ lọc trên URL. Trả về (query, các bộ lọc đang dùng)."""
+    filters = {k: args.get(k) for k in ('major', 'cohort', 'class_name', 'search') if args.get(k)}
+    query = Student.query.join(User).options(contains_eager(Student.user))
+
+    if 'major' in filters: query = query.filter(Student.major == filters['major'])
+    if 'cohort' in filters: query = query.filter(Student.cohort == filters['cohort'])
+    if 'class_name' in filters: query = query.filter(Student.class_name.contains(filters['class_name']))
+    if 'search' in filters:
+        query = query.filter(_search_clause(filters['search'], 'student'))
+    return query, filters
+
+
+def _search_clause(text, role):
+    """
+    Họ tên / email / mã tìm qua chỉ mục không dấu (app/search_index.py) thay vì LIKE '%x%' trên 3 cột;
+    chỉ mục có cả hậu tố của mã nên mã vẫn khớp chuỗi con như trước (VD: '001' -> GIT001).
+    """
+    match = user_match_clause(text, role)
+    return false() if match is None else match  # Câu tìm không có chữ / số nào -> không khớp ai
+
+
+# API: Danh sách SV dạng JSON (cuộn vô hạn), cùng bộ lọc + con trỏ với trang HTML
+@admin.route('/api/students', methods=['GET'])
+@login_required
+@admin_required
+def api_students():
+    query, filters = _student_list_query(request.args)
+    students, next_cursor = keyset_page(query, Student.student_code, request.args.get('cursor'), descending=True)
+    return jsonify({
+        'success': True,
+        'items': [{
+            'id': s.id,
+            'student_code': s.student_code,
+            'full_name': s.user.full_name,
+            'email': s.user.email,
+            'class_name': s.class_name,
+            'cohort': s.cohort,
+            'major': s.major
+        } for s in students],
+        'next_cursor': next_cursor,
+        'approx_total': approximate_count(('students',) + tuple(sorted(filters.items())), query)
+    })
+
+
+# Nhập sinh viên hàng loạt từ file, trả về file CSV tài khoản (mật khẩu dạng rõ)
+@admin.route('/students/import', methods=['POST'])
+@login_required
+@admin_required
+def import_students():
+    upload = request.files.get('file')
+    if not upload:
+        flash('Chưa chọn file!', 'danger')
+        return redirect(url_for('admin.manage_students'))
+
+    try:
+        df = read_student_file(upload)
+        records = onboard_students(df, {m['code']: m['name'] for m in MAJORS})
+    except OnboardingError as e:
+        flash(f'Nhập sinh viên thất bại: {e}', 'danger')
+        return redirect(url_for('admin.manage_students'))
+
+    return send_file(
+        io.BytesIO(credentials_csv(records)),
+        mimetype='text/csv',
+        as_attachment=True,
+        download_name=f"tai_khoan_sinh_vien_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    )
+
+
 # ... (các import secrets, string, unicodedata đã có từ trước)
 
 # --- 2. QUẢN LÝ GIẢNG VIÊN ---
@@ -249,23 +343,10 @@ def manage_teachers():
 
         return redirect(url_for('admin.manage_teachers'))
 
-    # --- XỬ LÝ GET: LỌC & HIỂN THỊ ---
-    query = Teacher.query.join(User)
-
-    f_dept = request.args.get('department')
-    f_search = request.args.get('search')
-
-    if f_dept:
-        query = query.filter(Teacher.department == f_dept)
-
-    if f_search:
-        query = query.filter(
-            (User.full_name.contains(f_search)) |
-            (Teacher.teacher_code.contains(f_search)) |
-            (User.email.contains(f_search))
-        )
-
-    teachers = query.order_by(Teacher.teacher_code.asc()).all()
+    # --- XỬ LÝ GET: LỌC & HIỂN THỊ (1 trang theo con trỏ trên teacher_code) ---
+    query, filters = _teacher_list_query(request.args)
+    teachers, next_cursor = keyset_page(query, Teacher.teacher_code, request.args.get('cursor'))
+    total = approximate_count(('teachers',) + tuple(sorted(filters.items())), query)
 
     # Lấy danh sách khoa thực tế trong DB để làm bộ lọc (nếu muốn lọc theo dữ liệu cũ)
     # Hoặc dùng list DEPARTMENTS cố định cũng được. Ở đây tôi dùng DB distinct.
@@ -273,10 +354,58 @@ def manage_teachers():
 
     return render_template('admin/teachers.html',
                            teachers=teachers,
+                           total=total,
+                           filters=filters,
+                           next_cursor=next_cursor,
+                           is_first_page=not request.args.get('cursor'),
                            departments=db_departments,
                            dept_list=DEPARTMENTS)  # Truyền list cố định cho Modal
 
 
+def _teacher_list_query(args):
+    """Query danh sách GV theo bộ lọc trên URL. Trả về (query, các bộ lọc đang dùng)."""
+    filters = {k: args.get(k) for k in ('department', 'search') if args.get(k)}
+    query = Teacher.query.join(User).options(contains_eager(Teacher.user))
+
+    if 'department' in filters:
+        query = query.filter(Teacher.department == filters['department'])
+    if 'search' in filters:
+        query = query.filter(_search_clause(filters['search'], 'teacher'))
+    return query, filters
+
+
+# API: Gợi ý tìm kiếm người dùng (không phân biệt dấu), đã xếp hạng
+@admin.route('/api/search/users', methods=['GET'])
+@login_required
+@admin_required
+def search_users_api():
+    q = request.args.get('q', '')
+    role = request.args.get('role')
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    return jsonify({'success': True, 'items': search_users(q, role, limit)})
+
+
+# API: Danh sách GV dạng JSON (cuộn vô hạn)
+@admin.route('/api/teachers', methods=['GET'])
+@login_required
+@admin_required
+def api_teachers():
+    query, filters = _teacher_list_query(request.args)
+    teachers, next_cursor = keyset_page(query, Teacher.teacher_code, request.args.get('cursor'))
+    return jsonify({
+        'success': True,
+        'items': [{
+            'id': t.id,
+            'teacher_code': t.teacher_code,
+            'full_name': t.user.full_name,
+            'email': t.user.email,
+            'department': t.department
+        } for t in teachers],
+        'next_cursor': next_cursor,
+        'approx_total': approximate_count(('teachers',) + tuple(sorted(filters.items())), query)
+    })
+
+
 # --- HÀM HỖ TRỢ: SINH MÃ HỌC PHẦN TỰ ĐỘNG ---
 def generate_subject_code(name):
     """
@@ -433,26 +562,40 @@ def add_schedule():
         day = int(data.get('day'))
         start = int(data.get('start'))
         count = int(data.get('count'))
-        room = data.get('room')
+        room = (data.get('room') or '').strip()
         end = start + count - 1
     except (ValueError, TypeError):
         return jsonify({'success': False, 'msg': 'Dữ liệu không hợp lệ!'})
+    if not room:
+        return jsonify({'success': False, 'msg': 'Chưa nhập phòng học!'})
+    try:
+        check_lesson_range(day, start, end)
+    except ValueError as e:
+        return jsonify({'success': False, 'msg': str(e)})
 
     cls = Class.query.get(class_id)
     if not cls:
         return jsonify({'success': False, 'msg': 'Lớp học không tồn tại!'})
 
     # Gọi hàm check trùng từ utils.py
-    # Hàm trả về True nếu có trùng
-    is_conflict = check_schedule_conflict(class_id, day, start, end, room, cls.semester_id)
+    # Hàm trả về thông tin lớp gây trùng (None nếu hợp lệ)
+    conflict = check_schedule_conflict(class_id, day, start, end, room, cls.semester_id, cls.teacher_id)
 
-    if is_conflict:
-        return jsonify({'success': False, 'msg': f'TRÙNG LỊCH: Phòng {room} hoặc Giảng viên đã bận vào thời gian này!'})
+    if conflict:
+        if conflict['type'] == 'room':
+            msg = f'TRÙNG LỊCH: Phòng {room} đã có lớp "{conflict["class_name"]}" vào thời gian này!'
+        else:
+            msg = f'TRÙNG LỊCH: Giảng viên đang dạy lớp "{conflict["class_name"]}" vào thời gian này!'
+        return jsonify({'success': False, 'msg': msg, 'conflict': conflict})
 
     # Nếu không trùng -> Lưu
     new_sch = Schedule(class_id=class_id, day_of_week=day, start_lesson=start, end_lesson=end, room=room)
     db.session.add(new_sch)
+    db.session.flush()
+    refresh_class_mask(class_id)  # Cập nhật bitmap lớp + bitmap SV đã đăng ký
+    version = occupancy.mark_changed(cls.semester_id)
     db.session.commit()
+    occupancy.apply_added(cls.semester_id, version, new_sch, cls)
 
     return jsonify({'success': True, 'msg': 'Thêm lịch thành công!'})
 
@@ -465,12 +608,136 @@ def delete_schedule():
     sch_id = data.get('schedule_id')
     schedule = Schedule.query.get(sch_id)
     if schedule:
+        class_id, removed_id = schedule.class_id, schedule.id
+        semester_id = schedule.class_info.semester_id
         db.session.delete(schedule)
+        db.session.flush()
+        refresh_class_mask(class_id)
+        version = occupancy.mark_changed(semester_id)
         db.session.commit()
+        occupancy.apply_removed(semester_id, version, removed_id)
         return jsonify({'success': True})
     return jsonify({'success': False, 'msg': 'Không tìm thấy lịch trình'})
 
 
+def _commit_bulk_schedules(semester_id, class_ids):
+    """Cập nhật bitmap các lớp có lịch mới, báo các worker dựng lại chỉ mục rồi commit."""
+    for class_id in class_ids:
+        refresh_class_mask(class_id)
+    occupancy.mark_changed(semester_id)  # Các worker (kể cả worker này) sẽ dựng lại chỉ mục
+    db.session.commit()
+
+
+# API 5: Nhập thời khóa biểu hàng loạt từ file CSV/XLSX
+@admin.route('/api/schedule/import', methods=['POST'])
+@login_required
+@admin_required
+def import_schedule():
+    semester_id = request.form.get('semester_id', type=int)
+    upload = request.files.get('file')
+    if not semester_id or not upload:
+        return jsonify({'success': False, 'msg': 'Thiếu học kỳ hoặc file!'})
+
+    semester = Semester.query.get(semester_id)
+    if not semester or not semester.is_active:
+        return jsonify({'success': False, 'msg': 'Học kỳ không tồn tại hoặc đã kết thúc!'})
+
+    try:
+        df = read_schedule_file(upload)
+    except ImportFormatError as e:
+        return jsonify({'success': False, 'msg': str(e)})
+
+    report, inserted, class_ids = import_schedules(df, semester_id)
+    if inserted:
+        _commit_bulk_schedules(semester_id, class_ids)
+
+    return jsonify({
+        'success': True,
+        'msg': f'Đã nhập {inserted}/{len(report)} dòng lịch học.',
+        'inserted': inserted,
+        'errors': sum(1 for r in report if r['errors']),
+        'report': report
+    })
+
+
+# API 6: Tự động xếp lịch cho các lớp chưa có lịch trong học kỳ
+@admin.route('/api/schedule/solve', methods=['POST'])
+@login_required
+@admin_required
+def solve_schedule():
+    """
+    Body JSON: {semester_id, rooms: [...], lessons: {class_id: số tiết}, time_budget: giây, apply: bool}
+    Số tiết mặc định = số tín chỉ của môn. apply=false chỉ trả về phương án đề xuất.
+    Trả về job_id; phương án nằm ở job.result của /api/jobs/<job_id> khi việc xong.
+    """
+    data = request.json or {}
+    try:
+        semester_id = int(data.get('semester_id'))
+        time_budget = min(float(data.get('time_budget', 30)), 60.0)
+    except (ValueError, TypeError):
+        return jsonify({'success': False, 'msg': 'Dữ liệu không hợp lệ!'})
+
+    rooms = [str(r).strip() for r in data.get('rooms', []) if str(r).strip()]
+    lessons = data.get('lessons') or {}
+    if not rooms:
+        return jsonify({'success': False, 'msg': 'Cần ít nhất 1 phòng học!'})
+
+    semester = Semester.query.get(semester_id)
+    if not semester or not semester.is_active:
+        return jsonify({'success': False, 'msg': 'Học kỳ không tồn tại hoặc đã kết thúc!'})
+
+    # Giải tới time_budget giây -> chạy nền (app/timetable_solver.py), client hỏi kết quả qua API việc nền
+    job = enqueue('solve_timetable', {'semester_id': semester_id, 'rooms': rooms, 'lessons': lessons,
+                                      'time_budget': time_budget, 'apply': bool(data.get('apply'))},
+                  current_user.id)
+    return jsonify({
+        'success': True,
+        'msg': 'Đã đưa việc xếp lịch vào hàng đợi.',
+        'job_id': job.id,
+        'status_url': url_for('admin.job_status', job_id=job.id)
+    })
+
+
+# API 7: Ngày nghỉ lễ / buổi học bị hủy (ảnh hưởng danh sách buổi điểm danh)
+@admin.route('/api/calendar/exception/add', methods=['POST'])
+@login_required
+@admin_required
+def add_session_exception():
+    data = request.json or {}
+    try:
+        semester_id = int(data.get('semester_id'))
+        day = datetime.strptime(data.get('date'), '%Y-%m-%d').date()
+        schedule_id = int(data['schedule_id']) if data.get('schedule_id') else None
+    except (ValueError, TypeError):
+        return jsonify({'success': False, 'msg': 'Dữ liệu không hợp lệ!'})
+
+    semester = Semester.query.get(semester_id)
+    if not semester or not (semester.start_date <= day <= semester.end_date):
+        return jsonify({'success': False, 'msg': 'Ngày không thuộc học kỳ!'})
+    if schedule_id is not None:
+        sch = Schedule.query.get(schedule_id)
+        if not sch or sch.class_info.semester_id != semester_id:
+            return jsonify({'success': False, 'msg': 'Không tìm thấy lịch trình'})
+
+    exc = SessionException(semester_id=semester_id, schedule_id=schedule_id, date=day,
+                           reason=data.get('reason'))
+    db.session.add(exc)
+    db.session.commit()
+    return jsonify({'success': True, 'id': exc.id})
+
+
+@admin.route('/api/calendar/exception/delete', methods=['POST'])
+@login_required
+@admin_required
+def delete_session_exception():
+    exc = SessionException.query.get((request.json or {}).get('exception_id'))
+    if not exc:
+        return jsonify({'success': False, 'msg': 'Không tìm thấy ngày nghỉ'})
+    db.session.delete(exc)
+    db.session.commit()
+    return jsonify({'success': True})
+
+
 # Route chính: Quản lý lớp
 # app/admin/routes.py
 
@@ -543,6 +810,10 @@ def manage_classes():
 
 
 # --- 5. QUẢN LÝ HỌC KỲ ---
+# Việc nền theo học kỳ -> nhãn hiển thị
+SEMESTER_JOB_TYPES = {'close_semester': 'Kết thúc học kỳ', 'recompute_grades': 'Tính lại điểm'}
+
+
 @admin.route('/semesters', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -559,34 +830,114 @@ def manage_semesters():
         return redirect(url_for('admin.manage_semesters'))
 
     semesters = Semester.query.order_by(Semester.start_date.desc()).all()
-    return render_template('admin/semesters.html', semesters=semesters)
+    # Việc nền gần nhất (kết thúc HK / tính lại điểm) của từng học kỳ
+    jobs = latest_jobs(SEMESTER_JOB_TYPES, 'semester_id')
+    return render_template('admin/semesters.html', semesters=semesters, jobs=jobs,
+                           job_labels=SEMESTER_JOB_TYPES, running_states=RUNNING_STATES)
+
+
+def _enqueue_semester_job(semester, job_type_name):
+    """Đưa việc của học kỳ vào hàng đợi nền, trừ khi học kỳ đang có việc chưa xong."""
+    running = latest_jobs(SEMESTER_JOB_TYPES, 'semester_id').get(semester.id)
+    if running and running['status'] in RUNNING_STATES:
+        flash(f'Học kỳ {semester.name} đang có việc "{SEMESTER_JOB_TYPES[running["type"]]}" chưa xong, vui lòng chờ.',
+              'warning')
+        return
+    enqueue(job_type_name, {'semester_id': semester.id}, current_user.id)
+    flash(f'Đã đưa việc "{SEMESTER_JOB_TYPES[job_type_name]}" của học kỳ {semester.name} vào hàng đợi.', 'info')
 
 
 @admin.route('/semester/<int:id>/close', methods=['POST'])
 @login_required
 @admin_required
 def close_semester(id):
+    # Chạy nền (app/semester_close.py): request trả về ngay, trang học kỳ hỏi tiến độ qua API
     semester = Semester.query.get_or_404(id)
-    unfinished_classes = []
+    if not semester.is_active:
+        flash(f'Học kỳ {semester.name} đã kết thúc.', 'info')
+    else:
+        _enqueue_semester_job(semester, 'close_semester')
+    return redirect(url_for('admin.manage_semesters'))
 
-    for cls in semester.classes:
-        if not cls.enrollments: continue
-        # Nếu còn sinh viên chưa có điểm tổng kết (total_10 is None)
-        incomplete_count = Enrollment.query.filter_by(class_id=cls.id, total_10=None).count()
-        if incomplete_count > 0:
-            unfinished_classes.append(f"{cls.name} ({incomplete_count} SV chưa điểm)")
 
-    if unfinished_classes:
-        flash(f'KHÔNG THỂ KẾT THÚC! Lớp chưa đủ điểm: {", ".join(unfinished_classes)}', 'danger')
+@admin.route('/semester/<int:id>/recompute', methods=['POST'])
+@login_required
+@admin_required
+def recompute_semester(id):
+    # Tính lại điểm tổng kết cả học kỳ từ các cột điểm (VD: sau khi sửa trọng số)
+    semester = Semester.query.get_or_404(id)
+    if not semester.is_active:
+        flash(f'Học kỳ {semester.name} đã kết thúc, điểm đã chốt nên không tính lại.', 'warning')
     else:
-        semester.is_active = False
-        for cls in semester.classes:
-            cls.is_locked = True
-        db.session.commit()
-        flash(f'Đã kết thúc học kỳ {semester.name}.', 'success')
+        _enqueue_semester_job(semester, 'recompute_grades')
     return redirect(url_for('admin.manage_semesters'))
 
 
+# --- VIỆC CHẠY NỀN ---
+# API: Trạng thái / tiến độ 1 việc
+@admin.route('/api/jobs/<int:job_id>', methods=['GET'])
+@login_required
+@admin_required
+def job_status(job_id):
+    job = Job.query.get_or_404(job_id)
+    return jsonify({'success': True, 'job': job_dict(job)})
+
+
+# API: Danh sách việc gần đây (lọc theo loại / trạng thái)
+@admin.route('/api/jobs', methods=['GET'])
+@login_required
+@admin_required
+def list_jobs():
+    query = Job.query
+    if request.args.get('type'):
+        query = query.filter(Job.type == request.args['type'])
+    if request.args.get('status'):
+        query = query.filter(Job.status == request.args['status'])
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    return jsonify({'success': True, 'jobs': [job_dict(j) for j in query.order_by(Job.id.desc()).limit(limit).all()]})
+
+
+# API: Thống kê phổ điểm của học kỳ (tổng, từng môn, từng lớp), lọc theo môn nếu có subject_id
+@admin.route('/api/grade_stats', methods=['GET'])
+@login_required
+@admin_required
+def grade_stats_api():
+    semester_id = request.args.get('semester_id', type=int)
+    if not semester_id or not Semester.query.get(semester_id):
+        return jsonify({'success': False, 'msg': 'Học kỳ không tồn tại!'})
+
+    result = semester_stats(semester_id)
+    subject_id = request.args.get('subject_id', type=int)
+    if subject_id:
+        subject = next((s for s in result['subjects'] if s['subject_id'] == subject_id), None)
+        if subject is None:
+            return jsonify({'success': False, 'msg': 'Môn học không có lớp trong học kỳ này!'})
+        result = {**result, 'summary': subject, 'subjects': [subject],
+                  'classes': [c for c in result['classes'] if c['subject_id'] == subject_id]}
+    return jsonify({'success': True, **result})
+
+
+# Xuất kết quả mọi lượt đăng ký của học kỳ (CSV / XLSX, dạng luồng)
+@admin.route('/semester/<int:id>/export')
+@login_required
+@admin_required
+def export_semester(id):
+    semester = Semester.query.get_or_404(id)
+    return export_response(semester_rows(semester.id), request.args.get('format', 'csv'),
+                           f'ket_qua_hoc_ky_{semester.id}', semester.name,
+                           total_rows=count_enrollments(Class.semester_id == semester.id))
+
+
+# Xuất bảng điểm cá nhân của 1 sinh viên
+@admin.route('/student/<int:student_id>/transcript/export')
+@login_required
+@admin_required
+def export_student_transcript(student_id):
+    sv = Student.query.get_or_404(student_id)
+    return export_response(transcript_rows(sv.id), request.args.get('format', 'csv'),
+                           f'bang_diem_{sv.student_code}', sv.student_code)
+
+
 # --- 6. TẠO USER (DỰ PHÒNG) ---
 @admin.route('/create_user', methods=['GET', 'POST'])
 @login_required
@@ -0,0 +1,141 @@
+"""
+Bảng tổng hợp điểm danh theo (lớp, SV): số buổi có mặt / vắng / trễ / có phép.
+Được cập nhật dần mỗi khi lưu điểm danh 1 ngày, nên điểm chuyên cần, danh sách
+SV có nguy cơ cấm thi và báo cáo chỉ cần 1 lần đọc theo khóa chính thay vì
+quét toàn bộ attendance_logs.
+"""
+from sqlalchemy import insert, update, delete, bindparam, func
+from . import db
+from .models import AttendanceLog, AttendanceSummary
+
+STATUSES = ('present', 'absent', 'late', 'excused')
+# Điểm trừ chuyên cần theo trạng thái điểm danh
+ATTENDANCE_PENALTY = {'absent': 1.0, 'late': 0.5, 'excused': 0.5}
+# Vắng từ số buổi này trở lên thì đưa vào danh sách cảnh báo
+AT_RISK_ABSENCES = 3
+
+
+def apply_status_changes(class_id, changes):
+    """
+    Cập nhật bảng tổng hợp theo các thay đổi điểm danh của 1 ngày.
+    changes: list (student_id, trạng thái cũ hoặc None, trạng thái mới hoặc None).
+    Chưa commit.
+    """
+    deltas = {}
+    for sid, old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        d = deltas.setdefault(sid, dict.fromkeys(STATUSES, 0))
+        if old_status in d:
+            d[old_status] -= 1
+        if new_status in d:
+            d[new_status] += 1
+    deltas = {sid: d for sid, d in deltas.items() if any(d.values())}
+    if not deltas:
+        return
+
+    # Tạo dòng tổng hợp còn thiếu (SV mới được điểm danh lần đầu)
+    existing = {sid for (sid,) in db.session.query(AttendanceSummary.student_id).filter(
+        AttendanceSummary.class_id == class_id,
+        AttendanceSummary.student_id.in_(deltas.keys())
+    ).all()}
+    missing = [{'class_id': class_id, 'student_id': sid, 'present': 0, 'absent': 0, 'late': 0, 'excused': 0}
+               for sid in deltas if sid not in existing]
+    table = AttendanceSummary.__table__
+    if missing:
+        db.session.execute(insert(table), missing)
+
+    db.session.execute(
+        update(table)
+        .where(table.c.class_id == bindparam('cid'), table.c.student_id == bindparam('sid'))
+        .values(**{status: table.c[status] + bindparam(f'd_{status}') for status in STATUSES}),
+        [dict(cid=class_id, sid=sid, **{f'd_{k}': v for k, v in d.items()}) for sid, d in deltas.items()]
+    )
+
+
+def save_day(class_id, date, statuses):
+    """
+    Lưu điểm danh 1 ngày theo kiểu diff: chỉ INSERT / UPDATE / DELETE các dòng
+    thay đổi (executemany), đồng thời cập nhật bảng tổng hợp.
+    statuses: {student_id: trạng thái} của các SV đang trong lớp.
+    Chưa commit. Trả về: số dòng log đã ghi.
+    """
+    # Khóa các log của ngày này tới khi commit để 2 lần lưu đồng thời không cộng lệch bảng tổng hợp
+    existing = {sid: (log_id, status) for log_id, sid, status in db.session.query(
+        AttendanceLog.id, AttendanceLog.student_id, AttendanceLog.status
+    ).filter_by(class_id=class_id, date=date).with_for_update().all()}
+
+    to_insert, to_update, to_delete, changes = [], [], [], []
+    for sid, status in statuses.items():
+        log_id, old_status = existing.pop(sid, (None, None))
+        if log_id is None:
+            to_insert.append({'class_id': class_id, 'student_id': sid, 'date': date, 'status': status})
+        elif old_status != status:
+            to_update.append({'log_id': log_id, 'new_status': status})
+        changes.append((sid, old_status, status))
+    # SV có log cũ nhưng không còn trong lớp -> xóa log
+    for sid, (log_id, old_status) in existing.items():
+        to_delete.append(log_id)
+        changes.append((sid, old_status, None))
+
+    table = AttendanceLog.__table__
+    if to_insert:
+        db.session.execute(insert(table), to_insert)
+    if to_update:
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('log_id')).values(status=bindparam('new_status')),
+            to_update
+        )
+    if to_delete:
+        db.session.execute(delete(table).where(table.c.id.in_(to_delete)))
+
+    apply_status_changes(class_id, changes)
+    return len(to_insert) + len(to_update) + len(to_delete)
+
+
+def class_summary(class_id):
+    """{student_id: AttendanceSummary} của cả lớp (1 query)."""
+    return {row.student_id: row for row in AttendanceSummary.query.filter_by(class_id=class_id).all()}
+
+
+def attendance_score(summary):
+    """Điểm chuyên cần thang 10 từ 1 dòng tổng hợp (None = chưa điểm danh buổi nào)."""
+    if summary is None:
+        return 10.0
+    score = 10.0 - sum(ATTENDANCE_PENALTY[s] * getattr(summary, s) for s in ATTENDANCE_PENALTY)
+    return max(score, 0.0)
+
+
+def attendance_scores(class_id):
+    """Điểm chuyên cần của từng SV trong lớp: {student_id: score}. 1 query."""
+    return {sid: attendance_score(row) for sid, row in class_summary(class_id).items()}
+
+
+def at_risk_students(class_id, min_absences=AT_RISK_ABSENCES):
+    """student_id các SV vắng từ `min_absences` buổi trở lên."""
+    return [sid for (sid,) in db.session.query(AttendanceSummary.student_id).filter(
+        AttendanceSummary.class_id == class_id,
+        AttendanceSummary.absent >= min_absences
+    ).all()]
+
+
+def rebuild_attendance_summary(class_id=None):
+    """Tính lại bảng tổng hợp từ attendance_logs (backfill). Có thể giới hạn 1 lớp."""
+    delete_query = AttendanceSummary.query
+    log_query = db.session.query(AttendanceLog.class_id, AttendanceLog.student_id,
+                                 AttendanceLog.status, func.count())
+    if class_id is not None:
+        delete_query = delete_query.filter_by(class_id=class_id)
+        log_query = log_query.filter(AttendanceLog.class_id == class_id)
+    delete_query.delete(synchronize_session=False)
+
+    rows = {}
+    for cid, sid, status, count in log_query.group_by(
+            AttendanceLog.class_id, AttendanceLog.student_id, AttendanceLog.status).all():
+        row = rows.setdefault((cid, sid), {'class_id': cid, 'student_id': sid,
+                                           'present': 0, 'absent': 0, 'late': 0, 'excused': 0})
+        if status in STATUSES:
+            row[status] += count
+    if rows:
+        db.session.execute(insert(AttendanceSummary.__table__), list(rows.values()))
+    db.session.commit()
@@ -3,6 +3,8 @@ from flask_login import login_user, logout_user, login_required, current_user
 from . import auth
 from ..models import User
 from .. import db
+from ..identity import identity_cache
+from ..passwords import password_hasher
 from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 
@@ -36,7 +38,12 @@ def login():
             flash('Email hoặc mật khẩu không chính xác.', 'danger')
             return redirect(url_for('auth.login'))
 
-        # 4. Đăng nhập thành công
+        # 4. Hash tạo theo tham số cũ -> băm lại bằng tham số hiện tại (đã có mật khẩu rõ)
+        if password_hasher.needs_rehash(user.password_hash):
+            user.set_password(password)
+            db.session.commit()
+
+        # 5. Đăng nhập thành công
         login_user(user, remember=remember)
 
         # Chuyển hướng theo Role
@@ -65,8 +72,11 @@ def change_password():
         new_password = request.form.get('new_password')
         confirm_password = request.form.get('confirm_password')
 
+        # current_user là bản cache (không có password_hash) -> lấy bản ghi thật
+        user = User.query.get_or_404(current_user.id)
+
         # 1. Kiểm tra mật khẩu cũ
-        if not current_user.check_password(current_password):
+        if not user.check_password(current_password):
             flash('Mật khẩu hiện tại không đúng.', 'danger')
             return redirect(url_for('auth.change_password'))
 
@@ -76,8 +86,9 @@ def change_password():
             return redirect(url_for('auth.change_password'))
 
         # 3. Đổi mật khẩu
-        current_user.set_password(new_password)
+        user.set_password(new_password)
         db.session.commit()
+        identity_cache.invalidate(user.id)
         flash('Đổi mật khẩu thành công! Vui lòng đăng nhập lại.', 'success')
         return redirect(url_for('auth.logout'))
 
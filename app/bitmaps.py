@@ -0,0 +1,164 @@
+"""
+Bitmap thời khóa biểu tuần.
+Mỗi tuần có 7 thứ (2 -> 8) x 12 tiết = 84 ô, mỗi ô là 1 bit:
+    bit = (day_of_week - 2) * 12 + (lesson - 1)
+Hai lịch trùng nhau <=> (mask_a & mask_b) != 0.
+Mask được lưu trong DB dưới dạng chuỗi hex (84 bit vượt quá BIGINT của MySQL).
+"""
+from sqlalchemy import select, insert
+from sqlalchemy.dialects import mysql, sqlite
+from . import db
+from .models import Class, Enrollment, Schedule, StudentScheduleMask
+
+LESSONS_PER_DAY = 12
+FIRST_DAY = 2
+LAST_DAY = 8
+
+
+def check_lesson_range(day, start, end):
+    """Ném ValueError (thông báo hiển thị được cho người dùng) nếu buổi học nằm ngoài lưới tuần."""
+    if not (FIRST_DAY <= day <= LAST_DAY):
+        raise ValueError(f'Thứ phải từ {FIRST_DAY} đến {LAST_DAY} (Chủ Nhật = {LAST_DAY})!')
+    if not (1 <= start <= end <= LESSONS_PER_DAY):
+        raise ValueError(f'Tiết học phải trong khoảng 1 - {LESSONS_PER_DAY}, tiết bắt đầu không sau tiết kết thúc!')
+
+
+def lesson_bits(day, start, end):
+    """Mask của 1 buổi học: thứ `day`, từ tiết `start` tới tiết `end` (ngoài lưới thì ném ValueError)."""
+    check_lesson_range(day, start, end)
+    width = end - start + 1
+    return ((1 << width) - 1) << ((day - FIRST_DAY) * LESSONS_PER_DAY + start - 1)
+
+
+def schedules_mask(schedules):
+    """OR các buổi học (bỏ qua buổi đã hủy)."""
+    mask = 0
+    for s in schedules:
+        if not s.is_canceled:
+            mask |= lesson_bits(s.day_of_week, s.start_lesson, s.end_lesson)
+    return mask
+
+
+def to_hex(mask):
+    return format(mask, 'x')
+
+
+def from_hex(value):
+    return int(value, 16) if value else 0
+
+
+# ---------------------------------------------------------
+# MASK CỦA LỚP VÀ CỦA SINH VIÊN THEO HỌC KỲ
+# ---------------------------------------------------------
+
+def get_student_mask(student_id, semester_id, for_update=False):
+    """
+    Lấy bản ghi mask của SV trong học kỳ (1 query).
+    Nếu chưa có (lần đăng ký đầu / dữ liệu cũ) thì dựng từ các lớp đã đăng ký. 2 lượt đăng ký
+    đầu tiên chạy song song cùng INSERT: lượt sau bỏ qua (không lỗi khóa chính) rồi đọc lại.
+    """
+    query = StudentScheduleMask.query.filter_by(student_id=student_id, semester_id=semester_id)
+    if for_update:
+        query = query.with_for_update()
+    row = query.first()
+    if row is None:
+        db.session.execute(_insert_if_missing(StudentScheduleMask.__table__), {
+            'student_id': student_id, 'semester_id': semester_id,
+            'mask': to_hex(_enrolled_mask(student_id, semester_id)),
+        })
+        row = query.populate_existing().first()
+    return row
+
+
+def _insert_if_missing(table):
+    """INSERT không báo lỗi khi trùng khóa chính (MySQL / SQLite)."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        return stmt.on_duplicate_key_update({c.name: c for c in table.primary_key})
+    if dialect == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+
+def find_conflicting_class(student_id, semester_id, target_mask):
+    """Tìm lớp đã đăng ký gây trùng lịch (chỉ gọi khi phép AND báo trùng)."""
+    classes = Class.query.join(Enrollment).filter(
+        Enrollment.student_id == student_id,
+        Class.semester_id == semester_id
+    ).all()
+    return next((c for c in classes if from_hex(c.schedule_mask) & target_mask), None)
+
+
+def refresh_class_mask(class_id):
+    """
+    Tính lại mask của lớp sau khi thêm/xóa lịch, rồi cập nhật mask của
+    các SV đang học lớp đó. Chưa commit, gọi trước commit của route.
+    """
+    cls = Class.query.get(class_id)
+    if cls is None:
+        return
+    schedules = Schedule.query.filter_by(class_id=class_id).all()
+    cls.schedule_mask = to_hex(schedules_mask(schedules))
+    db.session.flush()
+
+    student_ids = select(Enrollment.student_id).where(Enrollment.class_id == class_id)
+    _rebuild_student_masks(cls.semester_id, student_ids)
+
+
+def rebuild_all_masks():
+    """Dựng lại toàn bộ mask của lớp và SV (dùng khi backfill dữ liệu cũ)."""
+    class_masks = {}
+    for s in Schedule.query.all():
+        if not s.is_canceled:
+            class_masks[s.class_id] = class_masks.get(s.class_id, 0) | \
+                lesson_bits(s.day_of_week, s.start_lesson, s.end_lesson)
+
+    for cls in Class.query.all():
+        cls.schedule_mask = to_hex(class_masks.get(cls.id, 0))
+    db.session.flush()
+
+    StudentScheduleMask.query.delete()
+    _rebuild_student_masks(None, None)
+    db.session.commit()
+
+
+def _enrolled_mask(student_id, semester_id):
+    rows = db.session.query(Class.schedule_mask).join(Enrollment).filter(
+        Enrollment.student_id == student_id,
+        Class.semester_id == semester_id
+    ).all()
+    mask = 0
+    for (value,) in rows:
+        mask |= from_hex(value)
+    return mask
+
+
+def _rebuild_student_masks(semester_id, student_ids):
+    """OR mask các lớp theo (SV, học kỳ) trong 1 query rồi ghi đè bảng mask."""
+    query = db.session.query(Enrollment.student_id, Class.semester_id, Class.schedule_mask) \
+        .join(Class, Class.id == Enrollment.class_id)
+    if semester_id is not None:
+        query = query.filter(Class.semester_id == semester_id)
+    if student_ids is not None:
+        query = query.filter(Enrollment.student_id.in_(student_ids))
+
+    masks = {}
+    for sid, sem_id, value in query.all():
+        masks[(sid, sem_id)] = masks.get((sid, sem_id), 0) | from_hex(value)
+
+    existing = {}
+    if masks:
+        existing = {
+            (r.student_id, r.semester_id): r
+            for r in StudentScheduleMask.query.filter(
+                StudentScheduleMask.student_id.in_({k[0] for k in masks}),
+                StudentScheduleMask.semester_id.in_({k[1] for k in masks})
+            ).all()
+        }
+    for (sid, sem_id), mask in masks.items():
+        row = existing.get((sid, sem_id))
+        if row is None:
+            db.session.add(StudentScheduleMask(student_id=sid, semester_id=sem_id, mask=to_hex(mask)))
+        else:
+            row.mask = to_hex(mask)
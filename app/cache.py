@@ -0,0 +1,33 @@
+"""
+Đồng bộ cache trong RAM giữa nhiều worker process.
+Mỗi cache có 1 khóa trong bảng cache_versions. Worker nào ghi dữ liệu thì
+tăng version (trong cùng transaction), các worker khác so version đang giữ
+với DB để biết cache của mình đã cũ.
+"""
+from sqlalchemy import update
+from . import db
+from .models import CacheVersion
+
+
+def get_version(key):
+    """Đọc version hiện tại của cache (0 nếu chưa có)."""
+    row = db.session.get(CacheVersion, key)
+    return row.version if row else 0
+
+
+def bump_version(key):
+    """
+    Tăng version của cache, trả về version mới.
+    Chưa commit: gọi trước commit của thao tác ghi dữ liệu tương ứng.
+    """
+    result = db.session.execute(
+        update(CacheVersion)
+        .where(CacheVersion.key == key)
+        .values(version=CacheVersion.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.session.add(CacheVersion(key=key, version=1))
+        db.session.flush()
+        return 1
+    return db.session.query(CacheVersion.version).filter_by(key=key).scalar()
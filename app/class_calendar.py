@@ -0,0 +1,74 @@
+"""
+Lịch các buổi học trong học kỳ (nguồn dùng chung cho điểm danh, báo cáo...).
+Ngày học được tính bằng số học: ngày đầu tiên đúng thứ rồi cộng 7 ngày,
+thay vì duyệt từng ngày của học kỳ. Kết quả được cache theo
+(thứ, ngày bắt đầu, ngày kết thúc) nên tự mất hiệu lực khi lịch học hoặc
+ngày của học kỳ thay đổi. Ngày nghỉ lễ / buổi hủy nằm ở bảng session_exceptions.
+"""
+from datetime import timedelta
+from functools import lru_cache
+from . import db
+from .models import SessionException
+
+
+@lru_cache(maxsize=4096)
+def occurrence_dates(day_of_week, start_date, end_date):
+    """Các ngày rơi vào thứ `day_of_week` (2 = Thứ 2 ... 8 = CN) trong [start_date, end_date]."""
+    # Python weekday(): 0=Thứ 2, ..., 6=CN. DB: 2=Thứ 2, ..., 8=CN
+    offset = (day_of_week - 2 - start_date.weekday()) % 7
+    first = start_date + timedelta(days=offset)
+    if first > end_date:
+        return ()
+    weeks = (end_date - first).days // 7
+    return tuple(first + timedelta(weeks=i) for i in range(weeks + 1))
+
+
+class ClassCalendar:
+    """Danh sách buổi học của 1 lớp, kiểm tra ngày hợp lệ trong O(1)"""
+
+    def __init__(self, sessions):
+        self.sessions = sessions  # list dict, đã sắp theo ngày
+        self.dates = {s['date'] for s in sessions}
+        self.values = {s['value'] for s in sessions}
+
+    def __contains__(self, value):
+        """Nhận cả date lẫn chuỗi 'YYYY-MM-DD'."""
+        return value in self.values if isinstance(value, str) else value in self.dates
+
+
+def load_exceptions(semester_id, schedule_ids):
+    """(ngày nghỉ lễ của học kỳ, {schedule_id: ngày hủy}) trong 1 query."""
+    holidays, canceled = set(), {}
+    rows = db.session.query(SessionException.schedule_id, SessionException.date).filter(
+        SessionException.semester_id == semester_id,
+        (SessionException.schedule_id.is_(None)) | (SessionException.schedule_id.in_(schedule_ids))
+    ).all()
+    for schedule_id, d in rows:
+        if schedule_id is None:
+            holidays.add(d)
+        else:
+            canceled.setdefault(schedule_id, set()).add(d)
+    return holidays, canceled
+
+
+def class_calendar(cls):
+    """Lịch buổi học của lớp trong học kỳ của nó, đã trừ ngày nghỉ / buổi hủy."""
+    semester = cls.semester
+    schedules = [s for s in cls.schedules if not s.is_canceled]
+    holidays, canceled = load_exceptions(semester.id, [s.id for s in schedules])
+
+    sessions = []
+    for sch in schedules:
+        skip = holidays | canceled.get(sch.id, set())
+        for d in occurrence_dates(sch.day_of_week, semester.start_date, semester.end_date):
+            if d in skip:
+                continue
+            sessions.append({
+                'date': d,
+                'value': d.strftime('%Y-%m-%d'),
+                'schedule': sch,
+                'display': f"Thứ {sch.day_of_week} - {d.strftime('%d/%m/%Y')} | "
+                           f"Tiết {sch.start_lesson}-{sch.end_lesson} | Phòng {sch.room}"
+            })
+    sessions.sort(key=lambda x: (x['date'], x['schedule'].start_lesson))
+    return ClassCalendar(sessions)
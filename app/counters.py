@@ -0,0 +1,402 @@
+"""
+Bộ đếm cho trang tổng quan admin (bảng stat_counters, mỗi số 1 dòng).
+Toàn trường: số SV, GV, tài khoản, môn, lớp, học kỳ đang mở. Theo học kỳ: số lớp,
+lượt đăng ký, lớp chưa xếp lịch (schedule_mask = '0'), lượt chưa có điểm tổng kết.
+- Event after_insert / after_delete (và after_update của cột liên quan) chỉ ghi mức
+  tăng / giảm vào session; commit thành công mới chuyển sang bộ đệm trong RAM,
+  rollback thì bỏ. Chỗ ghi bằng Core tự gọi add_deltas.
+- Thread nền cộng bộ đệm xuống DB bằng 1 câu UPDATE executemany mỗi N giây, nên
+  transaction đăng ký tín chỉ không phải khóa chung 1 dòng đếm.
+- Định kỳ (và khi thiếu dòng) đối soát lại bằng COUNT(*) thật để sửa sai lệch
+  (dữ liệu sửa ngoài app, worker dừng khi chưa flush...). Đối soát ghi mốc thời gian
+  (reconcile_fence) cùng transaction; mức thay đổi commit trước mốc đã nằm trong COUNT
+  nên worker khác bỏ chúng khi flush. Flush và đối soát khóa dòng mốc nên chạy nối tiếp.
+Dashboard đọc mọi số bằng 1 query.
+"""
+import atexit
+import os
+import threading
+import time
+from sqlalchemy import select, update, delete, insert, bindparam, func, case, event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+from . import db
+
+GLOBAL_KEYS = ('students', 'teachers', 'users', 'subjects', 'classes', 'active_semesters')
+SEMESTER_FIELDS = ('classes', 'enrollments', 'unscheduled_classes', 'ungraded')
+RECONCILED_AT = 'reconciled_at'
+RECONCILE_FENCE = 'reconcile_fence'  # mili giây, xem reconcile()
+_SESSION_KEY = 'stat_deltas'
+
+
+def semester_key(semester_id, field):
+    return f"semester:{semester_id}:{field}"
+
+
+def add_deltas(deltas, session=None):
+    """Ghi mức thay đổi {khóa: +/-n} vào transaction hiện tại (áp dụng khi commit)."""
+    pending = (session or db.session).info.setdefault(_SESSION_KEY, {})
+    for key, delta in deltas.items():
+        if delta:
+            pending[key] = pending.get(key, 0) + delta
+
+
+class StatCounters:
+    def __init__(self):
+        self.app = None
+        self.interval = 10
+        self.reconcile_interval = 3600
+        self._pending = {}  # thời điểm commit (ms) -> {khóa: mức thay đổi} chưa ghi xuống DB
+        self._fence = 0  # mốc đối soát gần nhất worker này thấy
+        self._lock = threading.Lock()
+        self._thread_pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('STAT_COUNTERS_FLUSH_INTERVAL', 10)
+        self.reconcile_interval = app.config.get('STAT_COUNTERS_RECONCILE_INTERVAL', 3600)
+        atexit.register(self.flush)
+
+    def merge(self, deltas, committed_at=None):
+        committed_at = committed_at or _now_ms()
+        with self._lock:
+            batch = self._pending.setdefault(committed_at, {})
+            for key, delta in deltas.items():
+                batch[key] = batch.get(key, 0) + delta
+        self._ensure_thread()
+
+    def _pending_totals(self):
+        """Tổng mức thay đổi chưa flush theo khóa (bỏ phần đã nằm trong lần đối soát gần nhất)."""
+        totals = {}
+        with self._lock:
+            for committed_at, batch in self._pending.items():
+                if committed_at < self._fence:
+                    continue
+                for key, delta in batch.items():
+                    totals[key] = totals.get(key, 0) + delta
+        return totals
+
+    # --- ĐỌC ---
+    def read(self, semester_ids=()):
+        """
+        Số toàn trường + số của các học kỳ: {khóa: giá trị}.
+        1 query; dòng nào chưa có (học kỳ mới, DB mới) thì đếm thật cho phạm vi đó.
+        """
+        self._ensure_thread()
+        keys = list(GLOBAL_KEYS) + [semester_key(s, f) for s in semester_ids for f in SEMESTER_FIELDS]
+        values = self._load(keys)
+
+        missing_global = any(k not in values for k in GLOBAL_KEYS)
+        missing = [s for s in semester_ids
+                   if any(semester_key(s, f) not in values for f in SEMESTER_FIELDS)]
+        if missing_global or missing:
+            # COUNT(*) bên dưới đã gồm các thay đổi đang chờ của worker này -> flush rồi đọc lại
+            self.flush()
+            values = self._load(keys)
+            if missing_global:
+                values.update(self._store(_global_counts()))
+            if missing:
+                values.update(self._store(_semester_counts(missing)))
+
+        # Thay đổi của worker này chưa kịp flush
+        pending = self._pending_totals()
+        for key in keys:
+            values[key] = values.get(key, 0) + pending.get(key, 0)
+        return values
+
+    @staticmethod
+    def _load(keys):
+        from .models import StatCounter
+        return dict(db.session.query(StatCounter.key, StatCounter.value).filter(StatCounter.key.in_(keys)).all())
+
+    # --- GHI ---
+    def flush(self):
+        """Cộng các mức thay đổi đang chờ vào bảng bằng 1 lần UPDATE. Trả về số khóa đã flush."""
+        with self._lock:
+            batches, self._pending = self._pending, {}
+        if not batches or self.app is None:
+            return 0
+
+        from .models import StatCounter
+        table = StatCounter.__table__
+        stmt = update(table).where(table.c.key == bindparam('k')) \
+            .values(value=table.c.value + bindparam('d'))
+        with self.app.app_context():
+            try:
+                fence = self._lock_fence()
+                pending = {}
+                for committed_at, batch in batches.items():
+                    if committed_at < fence:
+                        continue  # Đã nằm trong COUNT của lần đối soát sau khi commit
+                    for key, delta in batch.items():
+                        pending[key] = pending.get(key, 0) + delta
+                pending = {k: d for k, d in pending.items() if d}
+                # Khóa chưa có dòng thì bỏ qua: lần đọc / đối soát sau sẽ đếm thật
+                if pending:
+                    db.session.execute(stmt, [{'k': k, 'd': d} for k, d in pending.items()])
+                db.session.commit()
+                self._fence = fence
+            except Exception:
+                db.session.rollback()
+                for committed_at, batch in batches.items():
+                    self.merge(batch, committed_at)
+                raise
+            finally:
+                db.session.remove()
+        return len(pending)
+
+    def _lock_fence(self):
+        """Khóa dòng mốc đối soát tới hết transaction (tạo nếu chưa có). Trả về mốc (ms)."""
+        from .models import StatCounter
+        for _ in range(2):
+            fence = db.session.query(StatCounter.value).filter_by(key=RECONCILE_FENCE) \
+                .with_for_update().scalar()
+            if fence is not None:
+                return fence
+            try:
+                db.session.add(StatCounter(key=RECONCILE_FENCE, value=0))
+                db.session.flush()
+                return 0
+            except IntegrityError:
+                db.session.rollback()  # Worker khác vừa tạo -> đọc lại
+        raise RuntimeError('Không khóa được mốc đối soát bộ đếm')
+
+    def reconcile(self):
+        """
+        Đếm lại mọi số bằng COUNT(*) thật và ghi đè. Commit.
+        Mốc mới được ghi cùng transaction với số vừa đếm: mức thay đổi các worker khác
+        commit trước mốc (đã có trong COUNT) sẽ bị bỏ khi flush thay vì cộng thêm lần nữa.
+        """
+        from .models import Semester
+        self.flush()
+        self._lock_fence()
+        fence = _now_ms()
+        values = _global_counts()
+        semester_ids = [sid for (sid,) in db.session.query(Semester.id).all()]
+        values.update(_semester_counts(semester_ids))
+        self._store({**values, RECONCILE_FENCE: fence})
+        self._fence = fence
+        return values
+
+    def _store(self, values):
+        """Ghi đè giá trị tuyệt đối (xóa rồi thêm). Worker khác vừa ghi cùng lúc thì bỏ qua."""
+        from .models import StatCounter
+        table = StatCounter.__table__
+        try:
+            db.session.execute(delete(table).where(table.c.key.in_(list(values))))
+            db.session.execute(insert(table), [{'key': k, 'value': v} for k, v in values.items()])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+        return values
+
+    def _claim_reconcile(self):
+        """Chỉ 1 worker đối soát mỗi chu kỳ: UPDATE có điều kiện trên mốc thời gian lần trước."""
+        from .models import StatCounter
+        now = int(time.time())
+        last = db.session.query(StatCounter.value).filter_by(key=RECONCILED_AT).scalar()
+        if last is None:
+            try:
+                db.session.add(StatCounter(key=RECONCILED_AT, value=now))
+                db.session.commit()
+                return True
+            except IntegrityError:
+                db.session.rollback()
+                return False
+        if now - last < self.reconcile_interval:
+            return False
+        table = StatCounter.__table__
+        claimed = db.session.execute(
+            update(table).where(table.c.key == RECONCILED_AT, table.c.value == last).values(value=now)
+        ).rowcount == 1
+        db.session.commit()
+        return claimed
+
+    def _ensure_thread(self):
+        # Mỗi worker process (sau fork) cần thread flush riêng
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name='stat-counters-flush', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+                with self.app.app_context():
+                    try:
+                        if self._claim_reconcile():
+                            self.reconcile()
+                    finally:
+                        db.session.remove()
+            except Exception:
+                if self.app is not None:
+                    self.app.logger.exception('Cập nhật bộ đếm thống kê thất bại')
+
+
+stat_counters = StatCounters()
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+# --- ĐẾM THẬT (ĐỐI SOÁT) ---
+def _global_counts():
+    """Mọi số toàn trường trong 1 câu SELECT các subquery COUNT."""
+    from .models import Student, Teacher, User, Subject, Class, Semester
+    counts = [
+        select(func.count(Student.id)), select(func.count(Teacher.id)), select(func.count(User.id)),
+        select(func.count(Subject.id)), select(func.count(Class.id)),
+        select(func.count(Semester.id)).where(Semester.is_active == True),
+    ]
+    row = db.session.execute(select(*[c.scalar_subquery() for c in counts])).one()
+    return dict(zip(GLOBAL_KEYS, (int(v or 0) for v in row)))
+
+
+def _semester_counts(semester_ids):
+    """Số theo học kỳ: 2 query GROUP BY cho mọi học kỳ được hỏi."""
+    from .models import Class, Enrollment
+    values = {semester_key(s, f): 0 for s in semester_ids for f in SEMESTER_FIELDS}
+    if not semester_ids:
+        return values
+
+    for sid, classes, unscheduled in db.session.query(
+            Class.semester_id, func.count(Class.id),
+            func.sum(case((Class.schedule_mask == '0', 1), else_=0))
+    ).filter(Class.semester_id.in_(semester_ids)).group_by(Class.semester_id).all():
+        values[semester_key(sid, 'classes')] = int(classes or 0)
+        values[semester_key(sid, 'unscheduled_classes')] = int(unscheduled or 0)
+
+    for sid, enrollments, ungraded in db.session.query(
+            Class.semester_id, func.count(Enrollment.id),
+            func.sum(case((Enrollment.total_10.is_(None), 1), else_=0))
+    ).join(Class, Class.id == Enrollment.class_id) \
+            .filter(Class.semester_id.in_(semester_ids)).group_by(Class.semester_id).all():
+        values[semester_key(sid, 'enrollments')] = int(enrollments or 0)
+        values[semester_key(sid, 'ungraded')] = int(ungraded or 0)
+    return values
+
+
+# --- EVENT ORM ---
+_class_semesters = {}  # class_id -> semester_id (lớp không đổi học kỳ)
+
+
+def class_semester(connection, class_id):
+    semester_id = _class_semesters.get(class_id)
+    if semester_id is None:
+        from .models import Class
+        semester_id = connection.execute(select(Class.semester_id).where(Class.id == class_id)).scalar()
+        if semester_id is not None:
+            _class_semesters[class_id] = semester_id
+    return semester_id
+
+
+def register_counter_events():
+    """Giữ bộ đếm khớp với mọi thao tác thêm / xóa qua ORM (ở bất kỳ route nào)."""
+    from .models import Student, Teacher, User, Subject, Class, Semester, Enrollment
+    if event.contains(Session, 'after_commit', _on_commit):
+        return
+    event.listen(Session, 'after_commit', _on_commit)
+    event.listen(Session, 'after_rollback', _on_rollback)
+
+    for model, key in ((Student, 'students'), (Teacher, 'teachers'), (User, 'users'), (Subject, 'subjects')):
+        event.listen(model, 'after_insert', _simple_counter(key, 1))
+        event.listen(model, 'after_delete', _simple_counter(key, -1))
+    for evt, sign in (('after_insert', 1), ('after_delete', -1)):
+        event.listen(Class, evt, _class_counter(sign))
+        event.listen(Semester, evt, _semester_counter(sign))
+        event.listen(Enrollment, evt, _enrollment_counter(sign))
+    # before_update: dòng trong DB còn giá trị cũ để đọc khi history chưa nạp giá trị trước
+    event.listen(Class, 'before_update', _on_class_update)
+    event.listen(Semester, 'before_update', _on_semester_update)
+    event.listen(Enrollment, 'before_update', _on_enrollment_update)
+
+
+def _on_commit(session):
+    deltas = session.info.pop(_SESSION_KEY, None)
+    if deltas:
+        stat_counters.merge(deltas)
+
+
+def _on_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def _add(target, deltas):
+    add_deltas(deltas, object_session(target))
+
+
+def _simple_counter(key, sign):
+    def listener(mapper, connection, target):
+        _add(target, {key: sign})
+    return listener
+
+
+def _unscheduled(mask):
+    return 1 if (mask or '0') == '0' else 0
+
+
+def _class_counter(sign):
+    def listener(mapper, connection, target):
+        _add(target, {
+            'classes': sign,
+            semester_key(target.semester_id, 'classes'): sign,
+            semester_key(target.semester_id, 'unscheduled_classes'): sign * _unscheduled(target.schedule_mask),
+        })
+    return listener
+
+
+def _semester_counter(sign):
+    def listener(mapper, connection, target):
+        _add(target, {'active_semesters': sign if target.is_active is not False else 0})
+    return listener
+
+
+def _enrollment_counter(sign):
+    def listener(mapper, connection, target):
+        semester_id = class_semester(connection, target.class_id)
+        _add(target, {
+            semester_key(semester_id, 'enrollments'): sign,
+            semester_key(semester_id, 'ungraded'): sign if target.total_10 is None else 0,
+        })
+    return listener
+
+
+def _old_and_new(connection, target, attr):
+    """(giá trị đang lưu, giá trị sắp ghi) của 1 cột, None nếu cột không đổi. Gọi trong before_update."""
+    history = inspect(target).attrs[attr].history
+    if not history.has_changes():
+        return None
+    if history.deleted:
+        old = history.deleted[0]
+    else:
+        # Gán khi thuộc tính chưa nạp / đã expire (VD: sau commit) -> history không có giá trị cũ
+        model = type(target)
+        old = connection.execute(select(getattr(model, attr)).where(model.id == target.id)).scalar()
+    new = getattr(target, attr)
+    return None if old == new else (old, new)
+
+
+def _on_class_update(mapper, connection, target):
+    change = _old_and_new(connection, target, 'schedule_mask')
+    if change:
+        delta = _unscheduled(change[1]) - _unscheduled(change[0])
+        _add(target, {semester_key(target.semester_id, 'unscheduled_classes'): delta})
+
+
+def _on_semester_update(mapper, connection, target):
+    change = _old_and_new(connection, target, 'is_active')
+    if change:
+        _add(target, {'active_semesters': int(bool(change[1])) - int(change[0] is not False)})
+
+
+def _on_enrollment_update(mapper, connection, target):
+    change = _old_and_new(connection, target, 'total_10')
+    if change:
+        delta = int(change[1] is None) - int(change[0] is None)
+        _add(target, {semester_key(class_semester(connection, target.class_id), 'ungraded'): delta})
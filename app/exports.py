@@ -0,0 +1,170 @@
+"""
+Xuất bảng điểm dạng luồng (CSV / XLSX): bảng điểm 1 lớp, kết quả cả học kỳ, bảng điểm cá nhân.
+Dữ liệu đọc bằng select() theo cột với yield_per nên DB trả về từng khúc và không
+tạo ORM object; các hàm *_rows là generator, response yield CSV theo từng khúc
+dòng nên bộ nhớ không tăng theo số dòng. Header X-Total-Rows báo trước số dòng
+để client hiển thị tiến độ.
+Chỉ CSV được gửi dần trong lúc đọc dữ liệu. XLSX là file zip chỉ đọc được khi đã
+ghi xong, nên được ghi bằng workbook write_only của openpyxl (không giữ dòng trong
+RAM) vào file tạm rồi mới stream file đó: bộ nhớ vẫn cố định nhưng client chỉ nhận
+byte đầu tiên khi đã ghi hết các dòng.
+"""
+import csv
+import io
+import re
+import tempfile
+from flask import Response, stream_with_context
+from openpyxl import Workbook
+from sqlalchemy import select, func
+from . import db
+from .models import Class, Enrollment, GradeScore, Semester, Student, StudentTermGpa, Subject, User
+
+YIELD_PER = 1000
+CSV_FLUSH_ROWS = 500
+FILE_CHUNK = 64 * 1024
+FORMATS = ('csv', 'xlsx')
+
+TOTAL_HEADER = ['Tổng (10)', 'Tổng (4)', 'Chữ', 'Kết quả']
+
+SHEET_TITLE_MAX = 31  # Excel giới hạn tên sheet 31 ký tự
+_SHEET_TITLE_INVALID = re.compile(r'[\\/*?:\[\]]')
+
+
+def _stream(stmt):
+    """Chạy câu select, đọc theo khúc YIELD_PER dòng."""
+    return db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+
+
+def _result(total_10, passed):
+    if total_10 is None:
+        return ''
+    return 'Đạt' if passed else 'Trượt'
+
+
+# --- NGUỒN DỮ LIỆU ---
+def class_sheet_rows(class_id, weights):
+    """Bảng điểm 1 lớp: mỗi SV 1 dòng, mỗi cột điểm 1 cột (xoay từ các dòng grade_scores)."""
+    index = {w.id: i for i, w in enumerate(weights)}
+    stmt = select(Enrollment.id, Student.student_code, User.full_name,
+                  Enrollment.total_10, Enrollment.total_4, Enrollment.letter_grade, Enrollment.is_passed,
+                  GradeScore.grade_weight_id, GradeScore.value) \
+        .join(Student, Student.id == Enrollment.student_id) \
+        .join(User, User.id == Student.user_id) \
+        .outerjoin(GradeScore, GradeScore.enrollment_id == Enrollment.id) \
+        .where(Enrollment.class_id == class_id) \
+        .order_by(Student.student_code, Enrollment.id)
+
+    yield ['STT', 'MSSV', 'Họ tên'] + [f'{w.name} ({w.weight_percent}%)' for w in weights] + TOTAL_HEADER
+    current_id, row, stt = None, None, 0
+    for eid, code, name, t10, t4, letter, passed, weight_id, value in _stream(stmt):
+        if eid != current_id:
+            if row is not None:
+                yield row
+            stt += 1
+            current_id = eid
+            row = [stt, code, name] + [None] * len(weights) + [t10, t4, letter, _result(t10, passed)]
+        if weight_id in index:
+            row[3 + index[weight_id]] = value
+    if row is not None:
+        yield row
+
+
+def semester_rows(semester_id):
+    """Kết quả mọi lượt đăng ký của 1 học kỳ (chỉ điểm tổng kết, vì mỗi môn có cột điểm khác nhau)."""
+    stmt = select(Class.name, Subject.code, Subject.name, Subject.credits,
+                  Student.student_code, User.full_name, Student.class_name,
+                  Enrollment.total_10, Enrollment.total_4, Enrollment.letter_grade, Enrollment.is_passed) \
+        .join(Class, Class.id == Enrollment.class_id) \
+        .join(Subject, Subject.id == Class.subject_id) \
+        .join(Student, Student.id == Enrollment.student_id) \
+        .join(User, User.id == Student.user_id) \
+        .where(Class.semester_id == semester_id) \
+        .order_by(Class.name, Student.student_code)
+
+    yield ['Lớp học phần', 'Mã môn', 'Tên môn', 'Tín chỉ', 'MSSV', 'Họ tên', 'Lớp SH'] + TOTAL_HEADER
+    for cls, sub_code, sub_name, credits, code, name, class_name, t10, t4, letter, passed in _stream(stmt):
+        yield [cls, sub_code, sub_name, credits, code, name, class_name, t10, t4, letter, _result(t10, passed)]
+
+
+def transcript_rows(student_id):
+    """Bảng điểm cá nhân qua các học kỳ, cuối file là GPA học kỳ / tích lũy."""
+    stmt = select(Semester.name, Subject.code, Subject.name, Subject.credits, Class.name,
+                  Enrollment.total_10, Enrollment.total_4, Enrollment.letter_grade, Enrollment.is_passed) \
+        .join(Class, Class.id == Enrollment.class_id) \
+        .join(Semester, Semester.id == Class.semester_id) \
+        .join(Subject, Subject.id == Class.subject_id) \
+        .where(Enrollment.student_id == student_id) \
+        .order_by(Semester.start_date, Subject.code)
+
+    yield ['Học kỳ', 'Mã môn', 'Tên môn', 'Tín chỉ', 'Lớp học phần'] + TOTAL_HEADER
+    for sem, sub_code, sub_name, credits, cls, t10, t4, letter, passed in _stream(stmt):
+        yield [sem, sub_code, sub_name, credits, cls, t10, t4, letter, _result(t10, passed)]
+
+    gpa_stmt = select(Semester.name, StudentTermGpa.term_credits, StudentTermGpa.term_gpa,
+                      StudentTermGpa.cumulative_credits, StudentTermGpa.cumulative_gpa) \
+        .join(Semester, Semester.id == StudentTermGpa.semester_id) \
+        .where(StudentTermGpa.student_id == student_id) \
+        .order_by(Semester.start_date)
+    yield []
+    yield ['Học kỳ', 'Tín chỉ học kỳ', 'GPA học kỳ', 'Tín chỉ tích lũy', 'GPA tích lũy']
+    for row in _stream(gpa_stmt):
+        yield list(row)
+
+
+def count_enrollments(*criteria):
+    """Số lượt đăng ký thỏa điều kiện (cho header X-Total-Rows)."""
+    return db.session.query(func.count(Enrollment.id)).join(Class, Class.id == Enrollment.class_id) \
+        .filter(*criteria).scalar()
+
+
+# --- RESPONSE ---
+def _csv_chunks(rows):
+    buffer = io.StringIO()
+    buffer.write('﻿')  # BOM để Excel đọc đúng tiếng Việt
+    writer = csv.writer(buffer)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+def sheet_title(name):
+    """Tên sheet hợp lệ cho Excel: thay ký tự cấm \\ / * ? : [ ] bằng '-', cắt còn 31 ký tự."""
+    title = _SHEET_TITLE_INVALID.sub('-', str(name or '')).strip().strip("'")[:SHEET_TITLE_MAX].strip()
+    return title or 'Sheet1'
+
+
+def _xlsx_chunks(rows, title):
+    # Tạo workbook/sheet ngay (trước khi response bắt đầu) để lỗi tên sheet không làm đứt file giữa chừng
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_title(title))
+
+    def generate():
+        for row in rows:
+            sheet.append(row)
+        with tempfile.TemporaryFile() as tmp:
+            workbook.save(tmp)
+            tmp.seek(0)
+            while True:
+                chunk = tmp.read(FILE_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+    return generate()
+
+
+def export_response(rows, fmt, filename, sheet_title, total_rows=None):
+    """Response dạng luồng cho generator `rows`. fmt: 'csv' | 'xlsx'."""
+    if fmt == 'xlsx':
+        chunks = _xlsx_chunks(rows, sheet_title)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        fmt, chunks, mimetype = 'csv', _csv_chunks(rows), 'text/csv'
+
+    headers = {'Content-Disposition': f'attachment; filename="{filename}.{fmt}"'}
+    if total_rows is not None:
+        headers['X-Total-Rows'] = str(total_rows)
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
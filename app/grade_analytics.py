@@ -0,0 +1,189 @@
+"""
+Thống kê phân bố điểm tổng kết theo lớp / môn / học kỳ.
+Mỗi lớp lưu sẵn 1 dòng class_grade_stats: histogram điểm hệ 10 theo bước 0.01
+(điểm tổng kết đã làm tròn 2 chữ số nên histogram là chính xác), số SV có điểm,
+số SV đạt. Dòng chỉ được tính lại khi điểm tổng kết của lớp đó thay đổi
+(app/grading.py gọi refresh_class_stats); trang xem chỉ đọc, lớp chưa có dòng thì
+tính tạm trong bộ nhớ chứ không ghi.
+Thống kê của môn / học kỳ = cộng histogram các lớp, nên trung bình, trung vị, độ
+lệch chuẩn vẫn chính xác mà không đọc lại bảng enrollments. Kết quả theo học kỳ
+được giữ trong RAM, làm mới khi version của 1 lớp trong học kỳ thay đổi (mỗi lớp 1
+dòng cache_versions, nên các lần lưu điểm của các lớp khác nhau không tranh 1 dòng).
+"""
+import json
+import threading
+import numpy as np
+from sqlalchemy import delete, insert, select, func
+from . import db
+from .models import CacheVersion, Class, ClassGradeStats, Enrollment, Subject
+from .cache import bump_version
+
+BUCKET_EDGES = [4.0, 5.5, 7.0, 8.5]
+BUCKET_LABELS = ['< 4.0', '4.0 - 5.4', '5.5 - 6.9', '7.0 - 8.4', '>= 8.5']
+
+_lock = threading.Lock()
+_semesters = {}  # semester_id -> (version, kết quả semester_stats)
+
+
+def version_key(semester_id, class_id):
+    return f"grade_stats:{semester_id}:{class_id}"
+
+
+def _fingerprint(semester_id):
+    """(tổng version các lớp, số lớp) của học kỳ trong 1 query: đổi khi 1 lớp được tính lại / thêm / xóa lớp."""
+    prefix = f"grade_stats:{semester_id}:"
+    # ';' đứng ngay sau ':' trong bảng mã: [prefix, ...;) là mọi khóa bắt đầu bằng prefix
+    versions = select(func.coalesce(func.sum(CacheVersion.version), 0)) \
+        .where(CacheVersion.key >= prefix, CacheVersion.key < prefix[:-1] + ';')
+    classes = select(func.count(Class.id)).where(Class.semester_id == semester_id)
+    return tuple(db.session.execute(select(versions.scalar_subquery(), classes.scalar_subquery())).one())
+
+
+# --- TÍNH TỪ HISTOGRAM ---
+def summarize(histogram, graded, passed):
+    """histogram: {điểm x 100: số SV}. Trả về dict thống kê (None nếu chưa có điểm)."""
+    result = {'graded': graded, 'passed': passed, 'failed': graded - passed,
+              'pass_rate': round(passed / graded, 4) if graded else None,
+              'mean': None, 'median': None, 'std': None,
+              'bucket_labels': BUCKET_LABELS, 'buckets': [0] * len(BUCKET_LABELS)}
+    if not histogram:
+        return result
+
+    values = np.array(sorted(histogram), dtype=float) / 100
+    counts = np.array([histogram[k] for k in sorted(histogram)], dtype=float)
+    n = counts.sum()
+    mean = float((values * counts).sum() / n)
+
+    # Trung vị: giá trị tại vị trí giữa trên dãy đã sắp (trung bình 2 phần tử giữa nếu n chẵn)
+    cumulative = np.cumsum(counts)
+    lower = values[np.searchsorted(cumulative, (n + 1) // 2)]
+    upper = values[np.searchsorted(cumulative, n // 2 + 1)]
+
+    result.update({
+        'mean': round(mean, 2),
+        'median': round(float(lower + upper) / 2, 2),
+        'std': round(float(np.sqrt((counts * (values - mean) ** 2).sum() / n)), 2),
+        'buckets': np.bincount(np.digitize(values, BUCKET_EDGES), weights=counts,
+                               minlength=len(BUCKET_LABELS)).astype(int).tolist(),
+    })
+    return result
+
+
+def _merge(histograms):
+    merged = {}
+    for histogram in histograms:
+        for key, count in histogram.items():
+            merged[key] = merged.get(key, 0) + count
+    return merged
+
+
+# --- GHI (KHI ĐIỂM TỔNG KẾT CỦA LỚP THAY ĐỔI) ---
+def _compute_class_stats(class_ids):
+    """Dòng class_grade_stats (dict) của các lớp, tính từ điểm tổng kết. Không ghi gì."""
+    classes = db.session.query(Class.id, Class.semester_id, Class.subject_id) \
+        .filter(Class.id.in_(class_ids)).all()
+
+    stats = {cid: {'histogram': {}, 'graded': 0, 'passed': 0} for cid, _, _ in classes}
+    for cid, total_10, is_passed in db.session.query(Enrollment.class_id, Enrollment.total_10, Enrollment.is_passed) \
+            .filter(Enrollment.class_id.in_(class_ids), Enrollment.total_10.isnot(None)).all():
+        s = stats[cid]
+        key = int(round(total_10 * 100))
+        s['histogram'][key] = s['histogram'].get(key, 0) + 1
+        s['graded'] += 1
+        s['passed'] += 1 if is_passed else 0
+
+    return [{'class_id': cid, 'semester_id': sem_id, 'subject_id': sub_id,
+             'graded': stats[cid]['graded'], 'passed': stats[cid]['passed'],
+             'histogram': json.dumps(stats[cid]['histogram'])}
+            for cid, sem_id, sub_id in classes]
+
+
+def refresh_class_stats(class_ids):
+    """Tính lại dòng thống kê của các lớp từ điểm tổng kết, báo các worker làm mới. Chưa commit."""
+    class_ids = list(set(class_ids))
+    if not class_ids:
+        return
+    rows = _compute_class_stats(class_ids)
+    table = ClassGradeStats.__table__
+    db.session.execute(delete(table).where(table.c.class_id.in_(class_ids)))
+    if rows:
+        db.session.execute(insert(table), rows)
+    for row in rows:
+        bump_version(version_key(row['semester_id'], row['class_id']))
+
+
+def rebuild_grade_stats(batch_size=200):
+    """Tính lại thống kê mọi lớp (backfill), theo lô lớp."""
+    class_ids = [cid for (cid,) in db.session.query(Class.id).order_by(Class.id).all()]
+    for i in range(0, len(class_ids), batch_size):
+        refresh_class_stats(class_ids[i:i + batch_size])
+        db.session.commit()
+
+
+# --- ĐỌC ---
+def class_stats(class_id):
+    """Thống kê 1 lớp: đọc 1 dòng class_grade_stats (chưa có thì tính tạm, không ghi)."""
+    row = db.session.get(ClassGradeStats, class_id)
+    if row is None:
+        rows = _compute_class_stats([class_id])
+        if not rows:
+            return summarize({}, 0, 0)
+        row = ClassGradeStats(**rows[0])  # Không add vào session
+    return summarize(_load_histogram(row.histogram), row.graded, row.passed)
+
+
+def _load_histogram(text):
+    return {int(k): v for k, v in json.loads(text or '{}').items()}
+
+
+def semester_stats(semester_id):
+    """
+    Thống kê cả học kỳ, từng môn và từng lớp:
+    {'summary': ..., 'subjects': [...], 'classes': [...]}. Giữ trong RAM theo version.
+    """
+    version = _fingerprint(semester_id)
+    with _lock:
+        cached = _semesters.get(semester_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+    rows = db.session.query(ClassGradeStats, Class.name, Subject.id, Subject.code, Subject.name) \
+        .join(Class, Class.id == ClassGradeStats.class_id) \
+        .join(Subject, Subject.id == ClassGradeStats.subject_id) \
+        .filter(ClassGradeStats.semester_id == semester_id).all()
+
+    # Lớp chưa có dòng thống kê (lớp mới, chưa lưu điểm lần nào): tính tạm, không ghi trong request đọc
+    missing = db.session.query(Class.id, Class.name, Subject.id, Subject.code, Subject.name) \
+        .join(Subject, Subject.id == Class.subject_id) \
+        .outerjoin(ClassGradeStats, ClassGradeStats.class_id == Class.id) \
+        .filter(Class.semester_id == semester_id, ClassGradeStats.class_id.is_(None)).all()
+    if missing:
+        computed = {r['class_id']: ClassGradeStats(**r) for r in _compute_class_stats([m[0] for m in missing])}
+        rows += [(computed[cid], *info) for cid, *info in missing]
+    rows.sort(key=lambda r: (r[3], r[1]))  # Theo mã môn, tên lớp
+
+    classes, by_subject = [], {}
+    for stats, class_name, subject_id, subject_code, subject_name in rows:
+        histogram = _load_histogram(stats.histogram)
+        classes.append({'class_id': stats.class_id, 'class_name': class_name, 'subject_id': subject_id,
+                        **summarize(histogram, stats.graded, stats.passed)})
+        group = by_subject.setdefault(subject_id, {'code': subject_code, 'name': subject_name,
+                                                   'histograms': [], 'graded': 0, 'passed': 0})
+        group['histograms'].append(histogram)
+        group['graded'] += stats.graded
+        group['passed'] += stats.passed
+
+    subjects = [{'subject_id': sid, 'code': g['code'], 'name': g['name'],
+                 **summarize(_merge(g['histograms']), g['graded'], g['passed'])}
+                for sid, g in by_subject.items()]
+    result = {
+        'semester_id': semester_id,
+        'summary': summarize(_merge(h for g in by_subject.values() for h in g['histograms']),
+                             sum(g['graded'] for g in by_subject.values()),
+                             sum(g['passed'] for g in by_subject.values())),
+        'subjects': subjects,
+        'classes': classes,
+    }
+    with _lock:
+        _semesters[semester_id] = (version, result)
+    return result
@@ -0,0 +1,58 @@
+"""
+Tính điểm tổng kết theo vector (NumPy) cho cả lớp / cả học kỳ.
+Đầu vào là ma trận điểm (số SV x số cột điểm, NaN = chưa có điểm) và vector
+trọng số. Kết quả khớp từng giá trị với bản scalar calculate_gpa_vku /
+get_letter_grade trong app/utils.py.
+"""
+import numpy as np
+
+# Ngưỡng quy đổi thang 10 -> thang 4 (quy chế VKU), xét theo thứ tự từ cao xuống
+_GPA_LOWER = [8.5, 8.0, 7.0, 6.5, 5.5, 4.0]
+
+# Ngưỡng thang 4 -> điểm chữ
+LETTER_BINS = np.array([1.0, 2.0, 2.5, 3.0, 3.5, 3.7, 4.0])
+LETTERS = np.array(['F', 'D', 'C', 'C+', 'B', 'B+', 'A-', 'A'])
+
+
+def round2(values):
+    """
+    Làm tròn 2 chữ số giống round() của Python.
+    np.round nhân 100 rồi làm tròn nên có thể lệch ở các giá trị sát x.xx5;
+    chỉ những phần tử đó được tính lại bằng round().
+    """
+    values = np.asarray(values, dtype=float)
+    result = np.round(values, 2)
+    scaled = values * 100
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_half.any():
+        result[near_half] = [round(v, 2) for v in values[near_half].tolist()]
+    return result
+
+
+def gpa_4(total_10):
+    """Bản vector của calculate_gpa_vku."""
+    s = np.asarray(total_10, dtype=float)
+    conditions = [s >= t for t in _GPA_LOWER]
+    choices = [4.0, 3.7, 3.0 + (s - 7.0) * 0.25, 2.5, 2.0, 1.0]
+    return np.select(conditions, choices, default=0.0)
+
+
+def letter_grades(total_4):
+    """Bản vector của get_letter_grade."""
+    return LETTERS[np.digitize(total_4, LETTER_BINS)]
+
+
+def compute_totals(scores, weight_percents):
+    """
+    scores: ma trận (n, k), NaN = chưa có điểm. weight_percents: k phần trăm (VD: [10, 30, 60]).
+    Trả về 4 mảng: total_10, total_4, letter_grade, is_passed.
+    """
+    scores = np.asarray(scores, dtype=float).reshape(len(scores), len(weight_percents))
+    total = np.zeros(scores.shape[0])
+    # Cộng lần lượt từng cột (không dùng sum) để thứ tự cộng số thực giống hệt bản scalar
+    for j, percent in enumerate(weight_percents):
+        col = scores[:, j]
+        total = np.where(np.isnan(col), total, total + col * (percent / 100))
+    total_10 = round2(total)
+    total_4 = gpa_4(total_10)
+    return total_10, total_4, letter_grades(total_4), total_4 >= 1.0
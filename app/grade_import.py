@@ -0,0 +1,153 @@
+"""
+Nhập điểm của 1 lớp từ file CSV/XLSX (bảng điểm giảng viên đang giữ).
+Cột mã SV: student_code / mssv / mã sv. Các cột điểm khớp theo tên GradeWeight
+(không phân biệt hoa thường). File XLSX chỉ được đọc 1 sheet của lớp đang nhập: sheet
+trùng tên lớp, hoặc sheet duy nhất có cột mã SV; nhiều sheet bảng điểm (nhiều lớp) bị từ chối.
+Mọi bước kiểm tra chạy theo cột bằng pandas; khi lưu chỉ các ô thay đổi được
+chuyển cho save_class_grades (diff + executemany), không tạo ORM object cho từng ô.
+"""
+import pandas as pd
+from . import db
+from .models import Enrollment, GradeScore, Student, User
+from .grading import save_class_grades
+
+CODE_COLUMNS = ('student_code', 'mssv', 'mã sv')
+CSV_CHUNK_ROWS = 5000
+MIN_SCORE, MAX_SCORE = 0.0, 10.0
+
+
+class GradeImportError(ValueError):
+    """File không đọc được hoặc thiếu cột"""
+
+
+def _normalize(df, row_prefix):
+    """Chuẩn hóa tên cột + gắn số dòng gốc. Sheet không có cột mã SV thì bỏ qua (None)."""
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    code_col = next((c for c in CODE_COLUMNS if c in df.columns), None)
+    if code_col is None:
+        return None
+    df = df.rename(columns={code_col: 'student_code'})
+    df['_row'] = [f'{row_prefix}{i + 2}' for i in df.index]  # +2: dòng tiêu đề + đánh số từ 1
+    return df
+
+
+def _pick_sheet(sheets, class_name):
+    """Chọn sheet của lớp: trùng tên lớp, hoặc sheet duy nhất có cột mã SV."""
+    named = [name for name in sheets if str(name).strip().lower() == (class_name or '').strip().lower()]
+    if named:
+        return _normalize(sheets[named[0]], f'{named[0]}!')
+    frames = {name: _normalize(df, f'{name}!') for name, df in sheets.items()}
+    frames = {name: df for name, df in frames.items() if df is not None and not df.empty}
+    if len(frames) > 1:
+        raise GradeImportError(
+            f'File có {len(frames)} sheet bảng điểm ({", ".join(map(str, frames))}). '
+            f'Mỗi lần chỉ nhập được 1 lớp: đặt tên sheet là "{class_name}" hoặc xóa các sheet khác.')
+    return next(iter(frames.values()), None)
+
+
+def read_grade_file(file_storage, class_name=None):
+    """Đọc file upload thành 1 DataFrame (CSV đọc theo từng khúc, XLSX chỉ đọc sheet của lớp)."""
+    filename = (file_storage.filename or '').lower()
+    if filename.endswith('.xls'):
+        raise GradeImportError('Không hỗ trợ file .xls, vui lòng lưu lại dạng .xlsx hoặc .csv')
+    try:
+        if filename.endswith('.xlsx'):
+            sheets = pd.read_excel(file_storage, sheet_name=None, dtype=str)
+        else:
+            sheets = None
+            frames = [_normalize(chunk, '')
+                      for chunk in pd.read_csv(file_storage, dtype=str, chunksize=CSV_CHUNK_ROWS)]
+    except Exception as e:
+        raise GradeImportError(f'Không đọc được file: {e}')
+    if sheets is not None:
+        frames = [_pick_sheet(sheets, class_name)]
+
+    frames = [df for df in frames if df is not None and not df.empty]
+    if not frames:
+        raise GradeImportError(f'Không tìm thấy cột mã sinh viên ({", ".join(CODE_COLUMNS)})')
+    return pd.concat(frames, ignore_index=True)
+
+
+def preview_grades(class_id, weights, df):
+    """
+    Kiểm tra file và so với điểm đang lưu của lớp.
+    Trả về (report, changes, matched_columns):
+      report  - các dòng bị loại kèm lý do,
+      changes - các ô sẽ thay đổi (enrollment_id, weight_id, mã SV, họ tên, cột, điểm cũ, điểm mới).
+    """
+    columns = {w.name.strip().lower(): w for w in weights}
+    matched = [c for c in df.columns if c in columns]
+    if not matched:
+        raise GradeImportError('Không có cột nào khớp với tên cột điểm của môn học')
+
+    enrolled = pd.DataFrame(
+        db.session.query(Student.student_code, Enrollment.id, Student.user_id)
+        .join(Enrollment, Enrollment.student_id == Student.id)
+        .filter(Enrollment.class_id == class_id).all(),
+        columns=['student_code', 'enrollment_id', 'user_id']
+    )
+
+    # 1. Kiểm tra theo cột: mỗi mask là 1 loại lỗi trên toàn bộ file
+    codes = df['student_code'].fillna('').astype(str).str.strip()
+    has_code = codes != ''
+    checks = [
+        (~has_code, 'Thiếu mã sinh viên'),
+        (has_code & codes.duplicated(keep=False), 'Mã sinh viên bị lặp trong file'),
+        (has_code & ~codes.isin(enrolled['student_code']), 'Sinh viên không thuộc lớp'),
+    ]
+    values = pd.DataFrame(index=df.index)
+    for col in matched:
+        raw = df[col].fillna('').astype(str).str.strip().str.replace(',', '.', regex=False)
+        values[col] = pd.to_numeric(raw, errors='coerce')
+        name = columns[col].name
+        checks.append(((raw != '') & values[col].isna(), f'Cột "{name}": không phải số'))
+        checks.append(((values[col] < MIN_SCORE) | (values[col] > MAX_SCORE),
+                       f'Cột "{name}": điểm phải từ {MIN_SCORE:g} tới {MAX_SCORE:g}'))
+
+    errors = pd.Series([[] for _ in range(len(df))], index=df.index)
+    for mask, msg in checks:
+        for i in mask[mask].index:
+            errors[i].append(msg)
+    bad = errors.str.len() > 0
+    report = [{'row': r, 'student_code': c, 'errors': e}
+              for r, c, e in zip(df['_row'][bad], codes[bad], errors[bad])]
+
+    # 2. Dòng hợp lệ -> dạng dài (mã SV, cột, điểm), bỏ ô trống (giữ điểm cũ)
+    values['student_code'] = codes
+    cells = values[~bad].melt(id_vars='student_code', var_name='column', value_name='new_value') \
+        .dropna(subset=['new_value'])
+    cells['weight_id'] = cells['column'].map({c: columns[c].id for c in matched})
+    cells = cells.merge(enrolled, on='student_code')
+
+    # 3. Diff với điểm hiện có (1 query dạng tuple)
+    existing = pd.DataFrame(
+        db.session.query(GradeScore.enrollment_id, GradeScore.grade_weight_id, GradeScore.value)
+        .join(Enrollment, Enrollment.id == GradeScore.enrollment_id)
+        .filter(Enrollment.class_id == class_id).all(),
+        columns=['enrollment_id', 'weight_id', 'old_value']
+    )
+    cells = cells.merge(existing, on=['enrollment_id', 'weight_id'], how='left')
+    cells = cells[cells['old_value'].isna() | (cells['old_value'] != cells['new_value'])]
+
+    names = _full_names(cells['user_id'].unique().tolist())
+    changes = [
+        {'enrollment_id': int(eid), 'weight_id': int(wid), 'student_code': code,
+         'full_name': names.get(uid, ''), 'column': columns[col].name,
+         'old_value': None if pd.isna(old) else float(old), 'new_value': float(new)}
+        for eid, wid, code, uid, col, old, new in zip(
+            cells['enrollment_id'], cells['weight_id'], cells['student_code'], cells['user_id'],
+            cells['column'], cells['old_value'], cells['new_value'])
+    ]
+    return report, changes, [columns[c].name for c in matched]
+
+
+def _full_names(user_ids):
+    if not user_ids:
+        return {}
+    return dict(db.session.query(User.id, User.full_name).filter(User.id.in_(user_ids)).all())
+
+
+def apply_grade_changes(class_id, weights, changes):
+    """Ghi các ô thay đổi qua save_class_grades (tính lại tổng kết + GPA). Chưa commit."""
+    form = {f"score_{c['enrollment_id']}_{c['weight_id']}": str(c['new_value']) for c in changes}
+    return save_class_grades(class_id, weights, form)
@@ -0,0 +1,177 @@
+"""
+Lưu bảng điểm của cả lớp theo lô.
+Số query không phụ thuộc sĩ số lớp: đọc toàn bộ điểm và tổng hợp điểm danh của
+lớp bằng 1 query mỗi loại, so với dữ liệu form, rồi chỉ ghi những ô thay đổi bằng
+executemany (INSERT ô mới, UPDATE ô đổi giá trị, UPDATE tổng kết).
+Điểm tổng kết của cả lớp được tính 1 lượt bằng grade_engine (NumPy).
+"""
+from sqlalchemy import insert, update, bindparam
+from . import db
+from .models import Class, Enrollment, GradeScore, GradeWeight, Semester
+from .grade_engine import compute_totals
+from .attendance import attendance_scores
+from .transcript import refresh_student_gpa
+from .counters import add_deltas, class_semester, semester_key
+from .jobs import job_type, JobError
+from .grade_analytics import refresh_class_stats
+
+ATTENDANCE_WEIGHT_NAME = 'chuyên cần'
+NAN = float('nan')
+
+
+def _collect_total_changes(enrollments, matrix, weights):
+    """
+    Tính tổng kết cho cả ma trận điểm, so với giá trị đang lưu.
+    Trả về (danh sách tham số UPDATE, student_id có total_4 thay đổi, số lượt vừa có tổng kết).
+    """
+    if not enrollments:
+        return [], [], 0
+    totals, gpa_changed, newly_graded = [], [], 0
+    result = compute_totals(matrix, [w.weight_percent for w in weights])
+    for enroll, t10, t4, letter, passed in zip(enrollments, *(arr.tolist() for arr in result)):
+        if (enroll.total_10, enroll.total_4, enroll.letter_grade, enroll.is_passed) != (t10, t4, letter, passed):
+            totals.append({'enroll_id': enroll.id, 't10': t10, 't4': t4, 'letter': letter, 'passed': passed})
+            if enroll.total_4 != t4:
+                gpa_changed.append(enroll.student_id)
+            if enroll.total_10 is None:
+                newly_graded += 1
+    return totals, gpa_changed, newly_graded
+
+
+def _write_totals(totals, semester_id, newly_graded):
+    if not totals:
+        return
+    # UPDATE bằng Core không qua event ORM -> tự trừ bộ đếm "chưa có điểm" của dashboard
+    add_deltas({semester_key(semester_id, 'ungraded'): -newly_graded})
+    table = Enrollment.__table__
+    db.session.execute(
+        update(table).where(table.c.id == bindparam('enroll_id'))
+        .values(total_10=bindparam('t10'), total_4=bindparam('t4'),
+                letter_grade=bindparam('letter'), is_passed=bindparam('passed')),
+        totals
+    )
+
+
+def save_class_grades(class_id, weights, form):
+    """
+    Lưu điểm từ form (ô score_<enrollment_id>_<weight_id>) cho cả lớp.
+    Chưa commit. Trả về: số ô điểm đã thay đổi.
+    """
+    enrollments = Enrollment.query.filter_by(class_id=class_id).all()
+
+    # 1. Điểm hiện có: (enrollment_id, weight_id) -> (score_id, value)
+    existing = {
+        (eid, wid): (sid, value)
+        for sid, eid, wid, value in db.session.query(
+            GradeScore.id, GradeScore.enrollment_id, GradeScore.grade_weight_id, GradeScore.value
+        ).join(Enrollment, Enrollment.id == GradeScore.enrollment_id)
+        .filter(Enrollment.class_id == class_id).all()
+    }
+
+    # 2. Điểm chuyên cần tự tính từ bảng tổng hợp điểm danh (nếu môn có cột này)
+    att_weight = next((w for w in weights if w.name.lower() == ATTENDANCE_WEIGHT_NAME), None)
+    att_scores = attendance_scores(class_id) if att_weight else {}
+
+    to_insert, to_update, matrix = [], [], []
+    for enroll in enrollments:
+        row = []
+        for w in weights:
+            key = (enroll.id, w.id)
+            score_id, old_value = existing.get(key, (None, None))
+            new_value = old_value
+
+            if att_weight is not None and w.id == att_weight.id:
+                new_value = att_scores.get(enroll.student_id, 10.0)
+
+            # Form có dữ liệu => dùng dữ liệu form (ghi đè), nhập sai thì giữ nguyên
+            val_str = form.get(f"score_{enroll.id}_{w.id}")
+            if val_str is not None and val_str.strip() != '':
+                try:
+                    new_value = float(val_str)
+                except ValueError:
+                    pass
+
+            row.append(NAN if new_value is None else new_value)
+            if score_id is None:
+                to_insert.append({'enrollment_id': enroll.id, 'grade_weight_id': w.id, 'value': new_value})
+            elif new_value != old_value:
+                to_update.append({'score_id': score_id, 'new_value': new_value})
+        matrix.append(row)
+
+    # 3. Tổng kết cả lớp trong 1 lượt tính vector
+    totals, gpa_changed, newly_graded = _collect_total_changes(enrollments, matrix, weights)
+
+    # 4. Ghi theo lô
+    scores_table = GradeScore.__table__
+    if to_insert:
+        db.session.execute(insert(scores_table), to_insert)
+    if to_update:
+        db.session.execute(
+            update(scores_table).where(scores_table.c.id == bindparam('score_id'))
+            .values(value=bindparam('new_value')),
+            to_update
+        )
+    _write_totals(totals, class_semester(db.session.connection(), class_id), newly_graded)
+    if totals:
+        refresh_class_stats([class_id])  # Thống kê phổ điểm chỉ tính lại khi tổng kết của lớp đổi
+    # GPA học kỳ / tích lũy của SV có điểm hệ 4 thay đổi
+    refresh_student_gpa(gpa_changed)
+    return len(to_insert) + len(to_update)
+
+
+def recompute_semester_totals(semester_id):
+    """
+    Tính lại điểm tổng kết mọi enrollment của học kỳ từ grade_scores
+    (VD: sau khi sửa trọng số cột điểm). Mỗi môn 1 ma trận, 4 query cho cả học kỳ.
+    Lớp đã khóa (điểm đã chốt) được giữ nguyên. Chưa commit. Trả về: số enrollment đã thay đổi.
+    """
+    open_classes = (Class.semester_id == semester_id, Class.is_locked == False)
+    enrollments = Enrollment.query.join(Class, Class.id == Enrollment.class_id) \
+        .filter(*open_classes).all()
+    if not enrollments:
+        return 0
+    subject_of = dict(db.session.query(Class.id, Class.subject_id).filter(*open_classes).all())
+
+    weights_by_subject = {}
+    for w in GradeWeight.query.filter(GradeWeight.subject_id.in_(set(subject_of.values()))) \
+            .order_by(GradeWeight.order_index).all():
+        weights_by_subject.setdefault(w.subject_id, []).append(w)
+
+    scores = {
+        (eid, wid): value
+        for eid, wid, value in db.session.query(
+            GradeScore.enrollment_id, GradeScore.grade_weight_id, GradeScore.value
+        ).join(Enrollment, Enrollment.id == GradeScore.enrollment_id)
+        .join(Class, Class.id == Enrollment.class_id)
+        .filter(*open_classes).all()
+    }
+
+    by_subject = {}
+    for enroll in enrollments:
+        by_subject.setdefault(subject_of[enroll.class_id], []).append(enroll)
+
+    totals, gpa_changed, newly_graded = [], [], 0
+    for subject_id, group in by_subject.items():
+        weights = weights_by_subject.get(subject_id, [])
+        matrix = [[NAN if (v := scores.get((e.id, w.id))) is None else v for w in weights] for e in group]
+        changed, students, graded = _collect_total_changes(group, matrix, weights)
+        totals.extend(changed)
+        gpa_changed.extend(students)
+        newly_graded += graded
+
+    _write_totals(totals, semester_id, newly_graded)
+    changed_ids = {t['enroll_id'] for t in totals}
+    refresh_class_stats({e.class_id for e in enrollments if e.id in changed_ids})
+    refresh_student_gpa(gpa_changed)
+    return len(totals)
+
+
+@job_type('recompute_grades', concurrency=1, max_attempts=3)
+def recompute_grades_job(ctx, semester_id):
+    semester = db.session.get(Semester, semester_id)
+    if semester is None or not semester.is_active:
+        raise JobError('Học kỳ đã kết thúc, điểm đã chốt nên không tính lại.')
+    ctx.progress(10, 'Đang tính lại điểm tổng kết...')
+    changed = recompute_semester_totals(semester_id)
+    db.session.commit()
+    return f'Đã tính lại điểm tổng kết, {changed} lượt đăng ký thay đổi.'
@@ -0,0 +1,108 @@
+"""
+Cache danh tính người dùng cho login_manager.user_loader.
+Giữ trong RAM của mỗi process 1 bản tóm tắt của user (id, email, họ tên, vai trò,
+ID hồ sơ SV/GV) với TTL, nên request thông thường không tốn query nào để biết
+"ai đang đăng nhập". Bản ghi bị xóa khỏi cache khi User/Student/Teacher bị
+sửa hoặc xóa (event của SQLAlchemy) và khi đổi mật khẩu.
+"""
+import threading
+import time
+from flask_login import UserMixin
+from sqlalchemy import event
+from . import db
+
+
+class CachedIdentity(UserMixin):
+    """Bản tóm tắt của User dùng làm current_user (không gắn với session DB)"""
+
+    def __init__(self, id, email, full_name, role, student_profile_id=None, teacher_profile_id=None):
+        self.id = id
+        self.email = email
+        self.full_name = full_name
+        self.role = role
+        self.student_profile_id = student_profile_id
+        self.teacher_profile_id = teacher_profile_id
+
+
+class IdentityCache:
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._items = {}  # user_id -> (CachedIdentity, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', 300)
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is not None and item[1] > now:
+                self.hits += 1
+                return item[0]
+            self.misses += 1
+
+        identity = self._load(user_id)
+        if identity is not None:
+            with self._lock:
+                self._items[user_id] = (identity, now + self.ttl)
+        return identity
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._items.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._items),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+    @staticmethod
+    def _load(user_id):
+        """1 query lấy user kèm ID hồ sơ SV/GV."""
+        from .models import User, Student, Teacher
+        row = db.session.query(User.id, User.email, User.full_name, User.role, Student.id, Teacher.id) \
+            .outerjoin(Student, Student.user_id == User.id) \
+            .outerjoin(Teacher, Teacher.user_id == User.id) \
+            .filter(User.id == user_id).first()
+        return CachedIdentity(*row) if row else None
+
+
+identity_cache = IdentityCache()
+
+
+def register_invalidation_events():
+    """Xóa cache khi hồ sơ người dùng thay đổi (ở bất kỳ route nào)."""
+    from .models import User, Student, Teacher
+    if event.contains(User, 'after_update', _on_user_change):
+        return
+
+    for evt in ('after_update', 'after_delete'):
+        event.listen(User, evt, _on_user_change)
+        event.listen(Student, evt, _on_profile_change)
+        event.listen(Teacher, evt, _on_profile_change)
+    # Tạo hồ sơ SV/GV sau khi user đã đăng nhập (VD: create_user) cũng phải làm mới
+    event.listen(Student, 'after_insert', _on_profile_change)
+    event.listen(Teacher, 'after_insert', _on_profile_change)
+
+
+def _on_user_change(mapper, connection, target):
+    identity_cache.invalidate(target.id)
+
+
+def _on_profile_change(mapper, connection, target):
+    identity_cache.invalidate(target.user_id)
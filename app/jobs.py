@@ -0,0 +1,289 @@
+"""
+Hàng đợi việc chạy nền cục bộ (không cần Redis / broker ngoài).
+Việc được lưu trong bảng jobs của DB hiện có. Mỗi process web (hoặc 1 process riêng
+chạy `flask jobs-worker`) có 1 thread điều phối: định kỳ nhận việc đang chờ bằng
+UPDATE có điều kiện (1 việc chỉ 1 process nhận được) rồi chạy trong thread pool.
+- Mỗi loại việc khai báo bằng @job_type, kèm số việc cùng loại được chạy đồng thời
+  (tính trên mọi process: nhận việc trong transaction giữ khóa dòng job_type_locks
+  của loại việc, đếm rồi mới UPDATE) và số lần thử tối đa.
+- Process web khởi động thread điều phối ngay khi tạo app (và sau fork, ở request
+  đầu tiên); lệnh `flask ...` thì không, `flask jobs-worker` tự chạy vòng điều phối.
+- Lỗi bất ngờ thì thử lại sau RETRY_DELAY * 2^(lần thử - 1) giây; JobError là lỗi
+  nghiệp vụ (VD: học kỳ chưa đủ điểm), báo ngay, không thử lại.
+- Tiến độ giữ trong RAM, ghi xuống DB cùng nhịp sống (heartbeat) mỗi vòng điều phối
+  bằng connection riêng (không dính transaction của việc). Việc 'running' mất nhịp
+  sống quá JOB_STALE_SECONDS (process chết) được đưa lại hàng đợi.
+"""
+import json
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, insert, bindparam, func
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .models import Job, JobTypeLock
+
+RETRY_DELAY = 30
+MAX_MESSAGE_LEN = 500
+RUNNING_STATES = ('queued', 'running')
+JOB_TYPES = {}  # tên -> JobType
+
+
+class JobError(Exception):
+    """Lỗi nghiệp vụ: báo cho người dùng, không thử lại"""
+
+
+class JobType:
+    def __init__(self, name, fn, concurrency, max_attempts):
+        self.name = name
+        self.fn = fn
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+
+
+def job_type(name, concurrency=1, max_attempts=3):
+    """Đăng ký hàm fn(ctx, **params) -> thông báo kết quả làm 1 loại việc nền."""
+    def decorator(fn):
+        JOB_TYPES[name] = JobType(name, fn, concurrency, max_attempts)
+        return fn
+    return decorator
+
+
+class JobContext:
+    """Đối số đầu tiên của hàm xử lý việc"""
+
+    def __init__(self, runner, job_id, attempt):
+        self.runner = runner
+        self.job_id = job_id
+        self.attempt = attempt
+        self.result = None
+
+    def progress(self, percent, message=None):
+        """Báo tiến độ (0-100), được ghi xuống DB ở vòng điều phối kế tiếp."""
+        self.runner.report(self.job_id, percent, message)
+
+    def set_result(self, data):
+        """Kết quả chi tiết (dict JSON được) trả cho người gửi việc, ghi cùng lúc hoàn thành."""
+        self.result = data
+
+
+# --- GỬI VIỆC & XEM TRẠNG THÁI ---
+def enqueue(type_name, params=None, user_id=None):
+    """Thêm việc vào hàng đợi (commit ngay) và đánh thức thread điều phối. Trả về Job."""
+    spec = JOB_TYPES[type_name]
+    job = Job(type=type_name, params=json.dumps(params or {}), max_attempts=spec.max_attempts,
+              created_by=user_id, run_after=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    job_runner.wake()
+    return job
+
+
+def job_dict(job):
+    return {
+        'id': job.id,
+        'type': job.type,
+        'params': json.loads(job.params or '{}'),
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'result': json.loads(job.result) if job.result else None,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def latest_jobs(types, param, limit=200):
+    """Việc gần nhất theo giá trị 1 tham số (VD: semester_id -> việc mới nhất của học kỳ đó)."""
+    latest = {}
+    for job in Job.query.filter(Job.type.in_(types)).order_by(Job.id.desc()).limit(limit).all():
+        key = json.loads(job.params or '{}').get(param)
+        if key is not None and key not in latest:
+            latest[key] = job_dict(job)
+    return latest
+
+
+# --- THREAD ĐIỀU PHỐI ---
+class JobRunner:
+    def __init__(self):
+        self.app = None
+        self.enabled = True
+        self.workers = 2
+        self.poll_interval = 2
+        self.stale_after = 300
+        self._pool = None
+        self._pid = None
+        self._running = {}  # job_id -> (phần trăm, thông báo) của việc đang chạy trong process này
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('JOB_RUNNER_IN_WEB', True)
+        self.workers = app.config.get('JOB_WORKERS', self.workers)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', self.poll_interval)
+        self.stale_after = app.config.get('JOB_STALE_SECONDS', self.stale_after)
+        app.before_request(self.ensure_started)
+
+    @property
+    def worker_id(self):
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def ensure_started(self):
+        # Mỗi worker process (sau fork) cần thread điều phối và pool riêng
+        if not self.enabled or self._pid == os.getpid():
+            return
+        if self._start_pool():
+            threading.Thread(target=self.run_forever, name='job-dispatcher', daemon=True).start()
+
+    def serve(self):
+        """Chạy vòng điều phối ở foreground (process riêng: flask jobs-worker)."""
+        self._start_pool()
+        self.run_forever()
+
+    def _start_pool(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return False
+            self._pid = os.getpid()
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+            self._running = {}
+            return True
+
+    def wake(self):
+        self._wake.set()
+
+    def report(self, job_id, percent, message=None):
+        with self._lock:
+            if job_id in self._running:
+                old_message = self._running[job_id][1]
+                self._running[job_id] = (percent, message or old_message)
+
+    def run_forever(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self.dispatch()
+            except Exception:
+                self.app.logger.exception('Vòng điều phối việc nền thất bại')
+
+    def dispatch(self):
+        """1 vòng: ghi tiến độ + nhịp sống, thu hồi việc của process đã chết, nhận việc mới."""
+        table = Job.__table__
+        now = datetime.utcnow()
+        with self._lock:
+            running = dict(self._running)
+        with db.engine.begin() as conn:
+            if running:
+                conn.execute(
+                    update(table).where(table.c.id == bindparam('job_id'), table.c.status == 'running')
+                    .values(progress=bindparam('percent'), message=bindparam('msg'), heartbeat_at=now),
+                    [{'job_id': jid, 'percent': p, 'msg': m} for jid, (p, m) in running.items()]
+                )
+            self._recover_stale(conn, now)
+
+        free = self.workers - len(running)
+        if free <= 0:
+            return
+        with db.engine.begin() as conn:
+            active = dict(conn.execute(
+                select(table.c.type, func.count()).where(table.c.status == 'running').group_by(table.c.type)
+            ).all())
+            candidates = conn.execute(
+                select(table.c.id, table.c.type, table.c.params, table.c.attempts)
+                .where(table.c.status == 'queued', table.c.run_after <= now)
+                .order_by(table.c.id).limit(free * 5)
+            ).all()
+
+        for job_id, type_name, params, attempts in candidates:
+            spec = JOB_TYPES.get(type_name)
+            if free <= 0:
+                break
+            # Lọc nhanh theo số đếm ở trên; giới hạn thật được kiểm tra lại khi nhận việc
+            if spec is None or active.get(type_name, 0) >= spec.concurrency:
+                continue
+            if not self._claim(job_id, spec, now):
+                continue  # Process khác vừa nhận, hoặc loại việc đã đủ số việc đang chạy
+            active[type_name] = active.get(type_name, 0) + 1
+            free -= 1
+            with self._lock:
+                self._running[job_id] = (0, None)
+            self._pool.submit(self._execute, job_id, spec, json.loads(params or '{}'), attempts + 1)
+
+    def _claim(self, job_id, spec, now):
+        """
+        Nhận 1 việc nếu loại việc còn chỗ. Khóa dòng của loại việc trong job_type_locks
+        trước rồi mới đếm việc đang chạy, nên các process nhận việc cùng loại lần lượt
+        từng process một và không cùng vượt giới hạn concurrency.
+        """
+        table, locks = Job.__table__, JobTypeLock.__table__
+        try:
+            with db.engine.begin() as conn:
+                if conn.execute(select(locks.c.type).where(locks.c.type == spec.name).with_for_update()).first() is None:
+                    conn.execute(insert(locks).values(type=spec.name))  # Lần đầu: dòng vừa thêm cũng đang bị khóa
+                running = conn.execute(
+                    select(func.count()).select_from(table)
+                    .where(table.c.type == spec.name, table.c.status == 'running')
+                ).scalar()
+                if running >= spec.concurrency:
+                    return False
+                return conn.execute(
+                    update(table).where(table.c.id == job_id, table.c.status == 'queued')
+                    .values(status='running', worker=self.worker_id, attempts=table.c.attempts + 1,
+                            started_at=now, heartbeat_at=now, progress=0)
+                ).rowcount == 1
+        except IntegrityError:
+            return False  # Process khác vừa tạo dòng khóa -> vòng sau nhận lại
+
+    def _recover_stale(self, conn, now):
+        table = Job.__table__
+        stale = (table.c.status == 'running') & (table.c.heartbeat_at < now - timedelta(seconds=self.stale_after))
+        conn.execute(update(table).where(stale, table.c.attempts < table.c.max_attempts)
+                     .values(status='queued', worker=None, run_after=now,
+                             message='Process xử lý đã dừng, chờ chạy lại'))
+        conn.execute(update(table).where(stale)
+                     .values(status='failed', finished_at=now, message='Process xử lý đã dừng'))
+
+    def _execute(self, job_id, spec, params, attempt):
+        with self.app.app_context():
+            try:
+                ctx = JobContext(self, job_id, attempt)
+                message = spec.fn(ctx, **params)
+                self._finish(job_id, status='done', progress=100, message=message or 'Hoàn thành',
+                             result=json.dumps(ctx.result) if ctx.result is not None else None)
+            except JobError as e:
+                db.session.rollback()
+                self._finish(job_id, status='failed', message=str(e))
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.exception('Việc nền %s (%s) lỗi', job_id, spec.name)
+                if attempt < spec.max_attempts:
+                    delay = RETRY_DELAY * 2 ** (attempt - 1)
+                    self._finish(job_id, status='queued', worker=None,
+                                 run_after=datetime.utcnow() + timedelta(seconds=delay),
+                                 message=f'Lỗi: {e}. Thử lại sau {delay} giây')
+                else:
+                    self._finish(job_id, status='failed', message=f'Lỗi: {e}')
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._running.pop(job_id, None)
+                self.wake()  # Còn chỗ trống -> nhận việc tiếp ngay
+
+    def _finish(self, job_id, **values):
+        if values['status'] != 'queued':
+            values['finished_at'] = datetime.utcnow()
+        values['message'] = str(values['message'])[:MAX_MESSAGE_LEN]
+        table = Job.__table__
+        with db.engine.begin() as conn:
+            conn.execute(update(table).where(table.c.id == job_id).values(**values))
+
+
+job_runner = JobRunner()
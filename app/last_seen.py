@@ -0,0 +1,94 @@
+"""
+Ghi trễ (write-behind) thời gian hoạt động cuối (users.last_seen).
+Mỗi request chỉ ghi vào dict trong RAM, không đụng DB. Một thread nền gộp
+theo user và flush bằng 1 câu UPDATE executemany mỗi N giây và khi tắt app.
+Câu UPDATE chỉ tiến last_seen về phía trước nên nhiều worker cùng flush
+không ghi đè giá trị mới hơn bằng giá trị cũ.
+"""
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import update, bindparam, or_
+from . import db
+
+
+class LastSeenBuffer:
+    def __init__(self):
+        self.app = None
+        self.interval = 30
+        self._pending = {}  # user_id -> datetime mới nhất
+        self._lock = threading.Lock()
+        self._thread_pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('LAST_SEEN_FLUSH_INTERVAL', 30)
+        atexit.register(self.flush)
+
+    def touch(self, user_id, when=None):
+        """Ghi nhận user vừa hoạt động (chỉ trong RAM)."""
+        when = when or datetime.utcnow()
+        with self._lock:
+            current = self._pending.get(user_id)
+            if current is None or when > current:
+                self._pending[user_id] = when
+        self._ensure_thread()
+
+    def flush(self):
+        """Ghi toàn bộ giá trị đang chờ bằng 1 lần UPDATE. Trả về số user đã flush."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or self.app is None:
+            return 0
+
+        from .models import User
+        users = User.__table__
+        stmt = update(users) \
+            .where(users.c.id == bindparam('uid'),
+                   or_(users.c.last_seen.is_(None), users.c.last_seen < bindparam('ts'))) \
+            .values(last_seen=bindparam('ts'))
+        rows = [{'uid': uid, 'ts': ts} for uid, ts in pending.items()]
+
+        with self.app.app_context():
+            try:
+                db.session.execute(stmt, rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # Trả lại hàng đợi để lần sau flush tiếp (giữ giá trị mới hơn nếu có)
+                with self._lock:
+                    for uid, ts in pending.items():
+                        if uid not in self._pending or self._pending[uid] < ts:
+                            self._pending[uid] = ts
+                raise
+            finally:
+                db.session.remove()
+        return len(rows)
+
+    def pending_snapshot(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def _ensure_thread(self):
+        # Mỗi worker process (sau fork) cần thread flush riêng
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name='last-seen-flush', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                if self.app is not None:
+                    self.app.logger.exception('Flush last_seen thất bại')
+
+
+last_seen_buffer = LastSeenBuffer()
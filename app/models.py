@@ -1,7 +1,7 @@
 from . import db
 from flask_login import UserMixin
 from sqlalchemy.sql import func
-from werkzeug.security import generate_password_hash, check_password_hash
+from .passwords import password_hasher
 
 
 # --- 1. USER & AUTHENTICATION ---
@@ -22,11 +22,21 @@ class User(UserMixin, db.Model):
     student_profile = db.relationship('Student', backref='user', uselist=False)
     teacher_profile = db.relationship('Teacher', backref='user', uselist=False)
 
+    # Băm / kiểm tra trong process pool riêng (xem app/passwords.py), có thể ném HasherBusy
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    # Cùng giao diện với CachedIdentity (app/identity.py) để route dùng được cả 2
+    @property
+    def student_profile_id(self):
+        return self.student_profile.id if self.student_profile else None
+
+    @property
+    def teacher_profile_id(self):
+        return self.teacher_profile.id if self.teacher_profile else None
 
 
 class Student(db.Model):
@@ -99,6 +109,10 @@ class Class(db.Model):
     teacher_id = db.Column(db.Integer, db.ForeignKey('teachers.id'), nullable=False)
 
     max_students = db.Column(db.Integer, default=60)
+    # Sĩ số hiện tại (phi chuẩn hóa), chỉ cập nhật qua app/seats.py
+    enrolled_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bitmap 84 bit (hex) các tiết lớp đã xếp lịch, xem app/bitmaps.py
+    schedule_mask = db.Column(db.String(21), nullable=False, default='0', server_default='0')
     is_locked = db.Column(db.Boolean, default=False)
 
     # QUAN TRỌNG: cascade='all, delete-orphan' để xử lý xóa lịch khi xóa lớp
@@ -119,6 +133,25 @@ class Schedule(db.Model):
     is_canceled = db.Column(db.Boolean, default=False)
 
 
+class SessionException(db.Model):
+    """Ngày nghỉ lễ (cả học kỳ) hoặc buổi bị hủy của 1 lịch học cụ thể"""
+    __tablename__ = 'session_exceptions'
+    id = db.Column(db.Integer, primary_key=True)
+    semester_id = db.Column(db.Integer, db.ForeignKey('semesters.id'), nullable=False)
+    # NULL = nghỉ lễ, áp dụng cho mọi lớp trong học kỳ
+    schedule_id = db.Column(db.Integer, db.ForeignKey('schedules.id', ondelete='CASCADE'), nullable=True)
+    date = db.Column(db.Date, nullable=False)
+    reason = db.Column(db.String(150))
+
+
+class StudentScheduleMask(db.Model):
+    """Bitmap thời khóa biểu của SV trong 1 học kỳ (OR mask các lớp đã đăng ký)"""
+    __tablename__ = 'student_schedule_masks'
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), primary_key=True)
+    semester_id = db.Column(db.Integer, db.ForeignKey('semesters.id'), primary_key=True)
+    mask = db.Column(db.String(21), nullable=False, default='0')
+
+
 class AttendanceLog(db.Model):
     __tablename__ = 'attendance_logs'
     id = db.Column(db.Integer, primary_key=True)
@@ -127,6 +160,20 @@ class AttendanceLog(db.Model):
     date = db.Column(db.Date, nullable=False, server_default=func.current_date())
     status = db.Column(db.String(20), default='present')
 
+    # Mỗi SV chỉ có 1 log / lớp / ngày (2 tab cùng lưu cũng không nhân đôi)
+    __table_args__ = (db.UniqueConstraint('class_id', 'student_id', 'date', name='unique_attendance'),)
+
+
+class AttendanceSummary(db.Model):
+    """Số buổi theo từng trạng thái điểm danh của SV trong lớp (cập nhật dần, xem app/attendance.py)"""
+    __tablename__ = 'attendance_summaries'
+    class_id = db.Column(db.Integer, db.ForeignKey('classes.id'), primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), primary_key=True)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    excused = db.Column(db.Integer, nullable=False, default=0)
+
 
 # --- 4. GRADE & ENROLLMENT ---
 class Enrollment(db.Model):
@@ -145,6 +192,22 @@ class Enrollment(db.Model):
     __table_args__ = (db.UniqueConstraint('student_id', 'class_id', name='unique_enrollment'),)
 
 
+class StudentTermGpa(db.Model):
+    """GPA học kỳ và GPA tích lũy (tính tới hết học kỳ đó) của SV, xem app/transcript.py"""
+    __tablename__ = 'student_term_gpa'
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), primary_key=True)
+    semester_id = db.Column(db.Integer, db.ForeignKey('semesters.id'), primary_key=True)
+
+    term_points = db.Column(db.Float, nullable=False, default=0)  # Tổng (điểm hệ 4 x tín chỉ)
+    term_credits = db.Column(db.Integer, nullable=False, default=0)
+    term_gpa = db.Column(db.Float, nullable=False, default=0)
+    cumulative_points = db.Column(db.Float, nullable=False, default=0)
+    cumulative_credits = db.Column(db.Integer, nullable=False, default=0)
+    cumulative_gpa = db.Column(db.Float, nullable=False, default=0)
+
+    semester = db.relationship('Semester')
+
+
 class GradeScore(db.Model):
     """Bảng lưu điểm thực tế của sinh viên"""
     __tablename__ = 'grade_scores'
@@ -154,4 +217,82 @@ class GradeScore(db.Model):
     # Điểm này thuộc về cột điểm nào (VD: Điểm này là của cột "Giữa kỳ")
     grade_weight_id = db.Column(db.Integer, db.ForeignKey('grade_weights.id'), nullable=False)
     weight_config = db.relationship('GradeWeight', backref='scores')
-    value = db.Column(db.Float, nullable=True)  # Giá trị điểm (VD: 8.5)
\ No newline at end of file
+    value = db.Column(db.Float, nullable=True)  # Giá trị điểm (VD: 8.5)
+
+
+# --- 5. HẠ TẦNG CACHE ---
+class CacheVersion(db.Model):
+    """Số phiên bản của từng cache trong RAM, dùng để báo các worker khác làm mới"""
+    __tablename__ = 'cache_versions'
+    key = db.Column(db.String(100), primary_key=True)  # VD: "occupancy:3"
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+# --- 6. BỘ ĐẾM MÃ ---
+class CodeSequence(db.Model):
+    """Số thứ tự đã cấp lớn nhất theo tiền tố mã (VD: GIT -> 125 tức là đã cấp tới GIT125)"""
+    __tablename__ = 'code_sequences'
+    prefix = db.Column(db.String(20), primary_key=True)
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+
+
+# --- 7. CHỈ MỤC TÌM KIẾM ---
+class UserSearchToken(db.Model):
+    """Từ đã bỏ dấu, chữ thường của họ tên / mã / email (mỗi từ 1 dòng), tìm theo tiền tố"""
+    __tablename__ = 'user_search_tokens'
+    __table_args__ = (db.Index('ix_user_search_tokens_role_token', 'role', 'token'),)
+    token = db.Column(db.String(50), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    role = db.Column(db.String(10), nullable=False)
+
+
+# --- 8. BỘ ĐẾM THỐNG KÊ ---
+class StatCounter(db.Model):
+    """Số liệu đếm sẵn cho dashboard (VD: "students", "semester:3:ungraded"), xem app/counters.py"""
+    __tablename__ = 'stat_counters'
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+# --- 9. VIỆC CHẠY NỀN ---
+class Job(db.Model):
+    """Việc chạy nền (kết thúc học kỳ, tính lại điểm...), xem app/jobs.py"""
+    __tablename__ = 'jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    status = db.Column(db.Enum('queued', 'running', 'done', 'failed'), nullable=False, default='queued')
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    message = db.Column(db.String(500))
+    result = db.Column(db.Text)  # JSON kết quả chi tiết (VD: phương án xếp lịch)
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False)  # Chờ tới thời điểm này mới chạy (thử lại sau lỗi)
+    worker = db.Column(db.String(100))  # host:pid đang chạy việc
+    heartbeat_at = db.Column(db.DateTime)
+
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index('ix_jobs_status_run_after', 'status', 'run_after'),)
+
+
+class JobTypeLock(db.Model):
+    """1 dòng / loại việc, khóa (FOR UPDATE) khi nhận việc để giữ giới hạn chạy đồng thời, xem app/jobs.py"""
+    __tablename__ = 'job_type_locks'
+    type = db.Column(db.String(50), primary_key=True)
+
+
+# --- 10. THỐNG KÊ ĐIỂM ---
+class ClassGradeStats(db.Model):
+    """Phân bố điểm tổng kết của 1 lớp, tính lại khi điểm lớp thay đổi (xem app/grade_analytics.py)"""
+    __tablename__ = 'class_grade_stats'
+    class_id = db.Column(db.Integer, db.ForeignKey('classes.id', ondelete='CASCADE'), primary_key=True)
+    semester_id = db.Column(db.Integer, db.ForeignKey('semesters.id'), nullable=False, index=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
+    graded = db.Column(db.Integer, nullable=False, default=0)  # Số SV đã có điểm tổng kết
+    passed = db.Column(db.Integer, nullable=False, default=0)
+    histogram = db.Column(db.Text, nullable=False, default='{}')  # JSON {điểm hệ 10 x 100: số SV}
@@ -0,0 +1,113 @@
+"""
+Chỉ mục chiếm dụng PHÒNG / GIẢNG VIÊN theo học kỳ (nằm trong RAM).
+Dựng 1 lần cho mỗi học kỳ bằng 1 query, sau đó cập nhật dần khi thêm/xóa lịch.
+Các worker khác biết chỉ mục đã cũ nhờ version trong bảng cache_versions.
+"""
+import threading
+from . import db
+from .models import Class, Schedule
+from .bitmaps import lesson_bits
+from .cache import get_version, bump_version
+
+_lock = threading.Lock()
+_indexes = {}  # semester_id -> SemesterOccupancy
+
+
+def version_key(semester_id):
+    return f"occupancy:{semester_id}"
+
+
+class SemesterOccupancy:
+    """Bitmap phòng -> tiết và giảng viên -> tiết của 1 học kỳ"""
+
+    def __init__(self, semester_id, version):
+        self.semester_id = semester_id
+        self.version = version
+        self.class_info = {}  # class_id -> (teacher_id, class_name)
+        # owner -> {schedule_id: (class_id, mask)} và owner -> OR các mask
+        self.room_entries, self.room_masks = {}, {}
+        self.teacher_entries, self.teacher_masks = {}, {}
+
+    def add(self, schedule_id, class_id, teacher_id, class_name, mask, room):
+        self.class_info[class_id] = (teacher_id, class_name)
+        self.room_entries.setdefault(room, {})[schedule_id] = (class_id, mask)
+        self.room_masks[room] = self.room_masks.get(room, 0) | mask
+        self.teacher_entries.setdefault(teacher_id, {})[schedule_id] = (class_id, mask)
+        self.teacher_masks[teacher_id] = self.teacher_masks.get(teacher_id, 0) | mask
+
+    def remove(self, schedule_id):
+        for entries, masks in ((self.room_entries, self.room_masks),
+                               (self.teacher_entries, self.teacher_masks)):
+            for owner, items in entries.items():
+                if items.pop(schedule_id, None) is not None:
+                    masks[owner] = 0
+                    for _, m in items.values():
+                        masks[owner] |= m
+                    break
+
+    def find_conflict(self, teacher_id, mask, room):
+        """Trả về dict mô tả lớp gây trùng, hoặc None nếu hợp lệ."""
+        for kind, entries, masks, owner in (
+                ('room', self.room_entries, self.room_masks, room),
+                ('teacher', self.teacher_entries, self.teacher_masks, teacher_id)):
+            if masks.get(owner, 0) & mask:
+                for class_id, m in entries[owner].values():
+                    if m & mask:
+                        return {'type': kind, 'class_id': class_id,
+                                'class_name': self.class_info[class_id][1]}
+        return None
+
+
+def _build(semester_id, version):
+    index = SemesterOccupancy(semester_id, version)
+    rows = db.session.query(Schedule.id, Schedule.class_id, Schedule.day_of_week,
+                            Schedule.start_lesson, Schedule.end_lesson, Schedule.room,
+                            Class.teacher_id, Class.name) \
+        .join(Class, Class.id == Schedule.class_id) \
+        .filter(Class.semester_id == semester_id, Schedule.is_canceled == False).all()
+    for sch_id, class_id, day, start, end, room, teacher_id, name in rows:
+        index.add(sch_id, class_id, teacher_id, name, lesson_bits(day, start, end), room)
+    return index
+
+
+def get_index(semester_id):
+    """Lấy chỉ mục của học kỳ, dựng lại nếu worker khác đã thay đổi lịch."""
+    version = get_version(version_key(semester_id))
+    with _lock:
+        index = _indexes.get(semester_id)
+        if index is not None and index.version == version:
+            return index
+    index = _build(semester_id, version)
+    with _lock:
+        _indexes[semester_id] = index
+    return index
+
+
+def mark_changed(semester_id):
+    """Tăng version trước khi commit thay đổi lịch. Trả về version mới."""
+    return bump_version(version_key(semester_id))
+
+
+def apply_added(semester_id, version, schedule, cls):
+    """Cập nhật chỉ mục của worker hiện tại sau khi commit lịch mới."""
+    _apply(semester_id, version, lambda index: index.add(
+        schedule.id, cls.id, cls.teacher_id, cls.name,
+        lesson_bits(schedule.day_of_week, schedule.start_lesson, schedule.end_lesson),
+        schedule.room))
+
+
+def apply_removed(semester_id, version, schedule_id):
+    _apply(semester_id, version, lambda index: index.remove(schedule_id))
+
+
+def _apply(semester_id, version, change):
+    with _lock:
+        index = _indexes.get(semester_id)
+        if index is None:
+            return
+        if index.version == version - 1:
+            change(index)
+            index.version = version
+        else:
+            # Bỏ lỡ thay đổi của worker khác -> bỏ chỉ mục, lần sau dựng lại
+            del _indexes[semester_id]
@@ -0,0 +1,204 @@
+"""
+Nhập sinh viên hàng loạt từ file CSV/XLSX (cột: full_name, major_code, cohort, class_name).
+- Mã SV được cấp theo khối liên tiếp cho từng ngành từ bảng code_sequences
+  (khóa 1 dòng rồi tăng 1 lần), nên nhiều admin nhập cùng lúc không bị trùng mã.
+- Email sinh bằng generate_email_prefix, trùng thì thêm số ngay trong bộ nhớ.
+- Mật khẩu được băm song song trong pool của password_hasher; User / Student ghi bằng INSERT theo lô.
+"""
+import csv
+import io
+import secrets
+import string
+
+import pandas as pd
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .models import User, Student, CodeSequence
+from .utils import generate_email_prefix
+from .passwords import password_hasher
+from .search_index import reindex_users
+from .counters import add_deltas
+
+REQUIRED_COLUMNS = ['full_name', 'major_code', 'cohort']
+EMAIL_DOMAIN = 'vku.udn.vn'
+INSERT_BATCH = 500
+MAX_REPORTED_ERRORS = 10
+CREDENTIAL_FIELDS = ['student_code', 'full_name', 'email', 'password', 'class_name', 'major', 'cohort']
+
+
+class OnboardingError(ValueError):
+    """File không đọc được, thiếu cột hoặc có dòng không hợp lệ"""
+
+
+# --- CẤP MÃ ---
+def format_code(prefix, number):
+    """GIT + 7 -> GIT007"""
+    return f"{prefix}{str(number).zfill(3)}"
+
+
+def _max_existing_number(prefix):
+    codes = db.session.query(Student.student_code).filter(Student.student_code.like(f"{prefix}%")).all()
+    numbers = [int(code[len(prefix):]) for (code,) in codes if code[len(prefix):].isdigit()]
+    return max(numbers, default=0)
+
+
+def allocate_codes(prefix, count):
+    """
+    Giữ 1 khối `count` số thứ tự liên tiếp cho tiền tố mã, trả về số đầu tiên.
+    Commit ngay để không giữ khóa trong lúc băm mật khẩu; nếu bước sau lỗi thì
+    khối đó bị bỏ trống (mã có thể nhảy số nhưng không bao giờ trùng).
+    """
+    for _ in range(3):
+        seq = CodeSequence.query.filter_by(prefix=prefix).with_for_update().first()
+        if seq is not None:
+            first = seq.last_value + 1
+            seq.last_value += count
+            db.session.commit()
+            return first
+        # Lần đầu dùng tiền tố này: khởi tạo từ mã lớn nhất đang có
+        try:
+            db.session.add(CodeSequence(prefix=prefix, last_value=_max_existing_number(prefix)))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # Admin khác vừa tạo dòng này -> đọc lại
+    raise RuntimeError(f'Không cấp được mã cho tiền tố {prefix}')
+
+
+def new_student_password(student_code):
+    """Mật khẩu mặc định: [MãSV] + 5 ký tự ngẫu nhiên (VD: GIT001aB3xZ)"""
+    random_chars = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(5))
+    return f"{student_code}{random_chars}"
+
+
+# --- ĐỌC & KIỂM TRA FILE ---
+def read_student_file(file_storage):
+    """Đọc file upload thành DataFrame chuỗi (cột đã chuẩn hóa về chữ thường)."""
+    filename = (file_storage.filename or '').lower()
+    if filename.endswith('.xls'):
+        raise OnboardingError('Không hỗ trợ file .xls, vui lòng lưu lại dạng .xlsx hoặc .csv')
+    try:
+        if filename.endswith('.xlsx'):
+            df = pd.read_excel(file_storage, dtype=str)
+        else:
+            df = pd.read_csv(file_storage, dtype=str)
+    except Exception as e:
+        raise OnboardingError(f'Không đọc được file: {e}')
+
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise OnboardingError(f'Thiếu cột: {", ".join(missing)}')
+    if df.empty:
+        raise OnboardingError('File không có dòng dữ liệu nào')
+    return df
+
+
+def _validate(df, majors):
+    """Chuẩn hóa các cột và kiểm tra theo cột. Có dòng lỗi thì từ chối cả file."""
+    data = pd.DataFrame({c: df[c].fillna('').astype(str).str.strip() for c in REQUIRED_COLUMNS})
+    data['major_code'] = data['major_code'].str.upper()
+    data['cohort'] = data['cohort'].str.upper()
+    class_names = df['class_name'].fillna('').astype(str).str.strip() if 'class_name' in df.columns else ''
+    # Lớp sinh hoạt mặc định giống form thêm 1 SV: K24 + GIT -> 24GIT
+    data['class_name'] = class_names
+    default_class = data['cohort'].str.lstrip('K') + data['major_code']
+    data.loc[data['class_name'] == '', 'class_name'] = default_class
+
+    checks = [
+        (data['full_name'] == '', 'Thiếu họ tên'),
+        (~data['major_code'].isin(majors), 'Mã ngành không hợp lệ'),
+        (data['cohort'] == '', 'Thiếu khóa'),
+    ]
+    errors = []
+    for mask, msg in checks:
+        errors += [(i + 2, msg) for i in mask[mask].index]  # +2: dòng tiêu đề + đánh số từ 1
+    if errors:
+        errors.sort()
+        shown = '; '.join(f'Dòng {row}: {msg}' for row, msg in errors[:MAX_REPORTED_ERRORS])
+        more = f' (và {len(errors) - MAX_REPORTED_ERRORS} lỗi khác)' if len(errors) > MAX_REPORTED_ERRORS else ''
+        raise OnboardingError(f'{shown}{more}')
+    return data
+
+
+def assign_emails(names, codes):
+    """Email theo mẫu <tên><họ lót>.<mã sv>@vku.udn.vn; trùng thì thêm số sau phần tên."""
+    prefixes = [generate_email_prefix(n) for n in names]
+    candidates = [f"{p}.{c.lower()}@{EMAIL_DOMAIN}" for p, c in zip(prefixes, codes)]
+    taken = set()
+    for i in range(0, len(candidates), INSERT_BATCH):
+        batch = candidates[i:i + INSERT_BATCH]
+        taken.update(e for (e,) in db.session.query(User.email).filter(User.email.in_(batch)).all())
+
+    emails = []
+    for prefix, code, email in zip(prefixes, codes, candidates):
+        n = 1
+        while email in taken:
+            n += 1
+            email = f"{prefix}{n}.{code.lower()}@{EMAIL_DOMAIN}"
+        taken.add(email)
+        emails.append(email)
+    return emails
+
+
+# --- NHẬP HÀNG LOẠT ---
+def onboard_students(df, majors):
+    """
+    Tạo tài khoản cho mọi dòng trong file. majors: {mã ngành: tên ngành}.
+    Trả về list dict thông tin đăng nhập (mật khẩu dạng rõ) theo thứ tự file.
+    """
+    # Mọi kiểm tra chạy trước khi cấp mã (allocate_codes commit ngay); email trùng được
+    # đổi tên trong bộ nhớ nên sau bước cấp mã không còn lý do từ chối dòng nào
+    data = _validate(df, majors)
+
+    # 1. Cấp mã: mỗi ngành 1 khối liên tiếp
+    codes = [None] * len(data)
+    for major_code, idx in data.groupby('major_code', sort=False).groups.items():
+        first = allocate_codes(major_code, len(idx))
+        for offset, i in enumerate(idx):
+            codes[data.index.get_loc(i)] = format_code(major_code, first + offset)
+
+    # 2. Mật khẩu + email
+    passwords = [new_student_password(code) for code in codes]
+    hashes = password_hasher.hash_many(passwords)
+    emails = assign_emails(data['full_name'].tolist(), codes)
+
+    records = [
+        {'student_code': code, 'full_name': name, 'email': email, 'password': password,
+         'password_hash': pw_hash, 'class_name': class_name, 'major': majors[major_code], 'cohort': cohort}
+        for code, name, email, password, pw_hash, class_name, major_code, cohort in zip(
+            codes, data['full_name'], emails, passwords, hashes,
+            data['class_name'], data['major_code'], data['cohort'])
+    ]
+
+    # 3. INSERT theo lô: users trước, đọc lại id theo email, rồi students
+    try:
+        for i in range(0, len(records), INSERT_BATCH):
+            batch = records[i:i + INSERT_BATCH]
+            db.session.execute(insert(User.__table__), [
+                {'email': r['email'], 'password_hash': r['password_hash'],
+                 'full_name': r['full_name'], 'role': 'student'} for r in batch
+            ])
+            user_ids = dict(db.session.query(User.email, User.id)
+                            .filter(User.email.in_([r['email'] for r in batch])).all())
+            db.session.execute(insert(Student.__table__), [
+                {'user_id': user_ids[r['email']], 'student_code': r['student_code'],
+                 'class_name': r['class_name'], 'major': r['major'], 'cohort': r['cohort']} for r in batch
+            ])
+            # INSERT bằng Core không qua event ORM -> tự cập nhật chỉ mục tìm kiếm và bộ đếm dashboard
+            reindex_users(user_ids.values())
+            add_deltas({'users': len(batch), 'students': len(batch)})
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        raise OnboardingError(f'Lỗi ghi dữ liệu (trùng email / mã?): {e.orig}')
+    return records
+
+
+def credentials_csv(records):
+    """File CSV thông tin đăng nhập (utf-8-sig để Excel đọc đúng tiếng Việt)."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CREDENTIAL_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(records)
+    return buffer.getvalue().encode('utf-8-sig')
@@ -0,0 +1,77 @@
+"""
+Phân trang keyset (seek) cho các danh sách dài (sinh viên, giảng viên).
+Thay vì OFFSET (DB phải đọc rồi bỏ qua mọi dòng phía trước), trang sau được lấy
+bằng điều kiện `khóa > khóa cuối của trang trước` trên 1 cột duy nhất có index
+(student_code, teacher_code). Con trỏ là giá trị khóa đó (mã hóa base64) nên vẫn
+đúng khi có dòng mới được thêm giữa 2 lần tải trang và dùng chung được với bộ lọc.
+Tổng số dòng chỉ là số gần đúng: cache trong RAM theo bộ lọc, hết hạn sau COUNT_TTL giây.
+"""
+import base64
+import json
+import threading
+import time
+
+PAGE_SIZE = 50
+COUNT_TTL = 60
+MAX_CACHED_COUNTS = 1000
+
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+def decode_cursor(cursor, value_type=(str, int)):
+    """Giá trị khóa trong con trỏ, None nếu con trỏ hỏng hoặc giá trị không đúng kiểu `value_type`."""
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    # Con trỏ bị sửa thành list / object / bool -> về trang đầu thay vì lỗi SQL khi so sánh
+    if isinstance(value, bool) or not isinstance(value, value_type):
+        return None
+    return value
+
+
+def _key_type(key_col):
+    try:
+        return key_col.type.python_type
+    except NotImplementedError:
+        return (str, int)
+
+
+def keyset_page(query, key_col, cursor=None, descending=False, per_page=PAGE_SIZE):
+    """
+    Lấy 1 trang theo cột khóa `key_col` (phải duy nhất để không mất / lặp dòng).
+    Trả về (items, next_cursor); next_cursor = None nếu là trang cuối.
+    """
+    after = decode_cursor(cursor, _key_type(key_col)) if cursor else None
+    if after is not None:
+        query = query.filter(key_col < after if descending else key_col > after)
+    rows = query.order_by(key_col.desc() if descending else key_col.asc()).limit(per_page + 1).all()
+
+    items = rows[:per_page]
+    next_cursor = encode_cursor(getattr(items[-1], key_col.key)) if len(rows) > per_page else None
+    return items, next_cursor
+
+
+_counts = {}  # khóa bộ lọc -> (số dòng, thời điểm hết hạn)
+_counts_lock = threading.Lock()
+
+
+def approximate_count(key, query):
+    """COUNT(*) của query, dùng lại kết quả đã đếm cho cùng `key` trong COUNT_TTL giây."""
+    now = time.time()
+    with _counts_lock:
+        cached = _counts.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+
+    total = query.order_by(None).count()
+    with _counts_lock:
+        if len(_counts) >= MAX_CACHED_COUNTS:
+            for k in [k for k, (_, expires) in _counts.items() if expires <= now]:
+                del _counts[k]
+            if len(_counts) >= MAX_CACHED_COUNTS:
+                _counts.clear()
+        _counts[key] = (total, now + COUNT_TTL)
+    return total
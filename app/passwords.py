@@ -0,0 +1,157 @@
+"""
+Dịch vụ băm / kiểm tra mật khẩu chạy trong process pool riêng.
+scrypt / pbkdf2 tốn CPU nên không chạy trên thread xử lý request. Số việc đang
+chờ trong pool bị giới hạn: vượt ngưỡng thì báo HasherBusy ngay (kèm số giây nên
+thử lại) thay vì để request xếp hàng tới timeout. Tham số băm cấu hình qua
+PASSWORD_HASH_METHOD; hash cũ khác tham số được băm lại khi user đăng nhập.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Băm hàng loạt: mỗi việc gửi vào pool gồm chừng này mật khẩu
+BULK_CHUNK = 16
+
+
+class HasherBusy(Exception):
+    """Pool băm mật khẩu đang quá tải"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Password hasher busy, retry after {retry_after}s')
+        self.retry_after = retry_after
+
+
+def _timed(fn, *args):
+    """Chạy trong process con: trả về (thời điểm bắt đầu, kết quả)."""
+    return time.time(), fn(*args)
+
+
+def _hash_chunk(passwords, method):
+    return [generate_password_hash(p, method=method) for p in passwords]
+
+
+class PasswordHasher:
+    def __init__(self):
+        self.method = 'scrypt:32768:8:1'
+        self._prefix = self.method  # Tiền tố đầy đủ werkzeug ghi vào hash, tính ở init_app
+        self.workers = os.cpu_count() or 1
+        self.max_pending = 32
+        self.retry_after = 5
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        # Số liệu: tổng / lớn nhất của thời gian chờ trong hàng và thời gian băm (giây)
+        self._stats = {'tasks': 0, 'rejected': 0, 'wait_total': 0.0, 'wait_max': 0.0,
+                       'run_total': 0.0, 'run_max': 0.0}
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        # 'scrypt' / 'pbkdf2' là tên rút gọn: werkzeug ghi tham số mặc định vào hash
+        # (VD: scrypt:32768:8:1), nên lấy tiền tố thật bằng 1 lần băm thử
+        self._prefix = generate_password_hash('probe', method=self.method).split('$', 1)[0]
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS') or self.workers
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        self.retry_after = app.config.get('PASSWORD_HASH_RETRY_AFTER', self.retry_after)
+
+    def _get_pool(self):
+        # Pool tạo lười và tạo lại sau fork (mỗi worker process có pool riêng)
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _acquire(self, force=False):
+        with self._lock:
+            if not force and self._pending >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise HasherBusy(self.retry_after)
+            self._pending += 1
+
+    def _finish(self, submitted, future):
+        """Chờ kết quả 1 việc, ghi số liệu, trả chỗ trong hàng đợi."""
+        try:
+            started, result = future.result()
+            finished = time.time()
+            with self._lock:
+                s = self._stats
+                s['tasks'] += 1
+                s['wait_total'] += started - submitted
+                s['wait_max'] = max(s['wait_max'], started - submitted)
+                s['run_total'] += finished - started
+                s['run_max'] = max(s['run_max'], finished - started)
+            return result
+        finally:
+            self._release(1)
+
+    def _release(self, count):
+        with self._lock:
+            self._pending -= count
+
+    def _run(self, fn, *args):
+        self._acquire()
+        submitted = time.time()
+        try:
+            future = self._get_pool().submit(_timed, fn, *args)
+        except Exception:
+            self._release(1)
+            raise
+        return self._finish(submitted, future)
+
+    def hash(self, password):
+        """Băm 1 mật khẩu theo tham số đang cấu hình. Có thể ném HasherBusy."""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """Kiểm tra mật khẩu. Có thể ném HasherBusy."""
+        return self._run(check_password_hash, password_hash, password)
+
+    def hash_many(self, passwords):
+        """
+        Băm hàng loạt (tạo tài khoản theo lô), giữ nguyên thứ tự.
+        Không bị từ chối, nhưng chỉ giữ tối đa `workers` việc trong pool cùng lúc
+        để request đăng nhập vẫn chen vào được giữa các lô.
+        """
+        pool = self._get_pool()
+        results, window = [], deque()
+        try:
+            for i in range(0, len(passwords), BULK_CHUNK):
+                if len(window) >= self.workers:
+                    results.extend(self._finish(*window.popleft()))
+                self._acquire(force=True)
+                window.append((time.time(), pool.submit(_timed, _hash_chunk, passwords[i:i + BULK_CHUNK], self.method)))
+            while window:
+                results.extend(self._finish(*window.popleft()))
+        finally:
+            # Lỗi giữa chừng: trả chỗ cho các việc chưa lấy kết quả
+            self._release(len(window))
+        return results
+
+    def needs_rehash(self, password_hash):
+        """Hash được tạo với tham số khác cấu hình hiện tại (VD: vừa tăng cost)."""
+        return password_hash.split('$', 1)[0] != self._prefix
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            pending = self._pending
+        tasks = s['tasks'] or 1
+        return {
+            'method': self.method,
+            'workers': self.workers,
+            'pending': pending,
+            'max_pending': self.max_pending,
+            'tasks': s['tasks'],
+            'rejected': s['rejected'],
+            'avg_queue_wait_ms': round(s['wait_total'] / tasks * 1000, 2),
+            'max_queue_wait_ms': round(s['wait_max'] * 1000, 2),
+            'avg_hash_ms': round(s['run_total'] / tasks * 1000, 2),
+            'max_hash_ms': round(s['run_max'] * 1000, 2),
+        }
+
+
+password_hasher = PasswordHasher()
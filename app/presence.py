@@ -0,0 +1,147 @@
+"""
+Theo dõi người dùng online theo cửa sổ trượt (mặc định 5 phút).
+Mỗi phút là 1 "ô" chứa tập user đã hoạt động trong phút đó. Các ô được lưu
+trong 1 file SQLite cục bộ (WAL) để mọi worker trên cùng máy dùng chung.
+Request chỉ ghi vào bộ đệm trong RAM (mỗi user 1 lần / phút / worker); thread nền
+ghi xuống file mỗi vài giây và xóa ô cũ hơn cửa sổ, nên file bị khóa cũng không
+làm request lỗi. Truy vấn online chỉ tốn O(số user đang online).
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+
+class PresenceTracker:
+    def __init__(self):
+        self.app = None
+        self.path = None
+        self.window = 5  # phút
+        self.interval = 5  # giây giữa 2 lần ghi xuống file
+        self.timeout = 5  # giây chờ khi file đang bị process khác khóa
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._minute = None
+        self._seen = set()  # user đã ghi nhận trong phút hiện tại (của worker này)
+        self._pending = {}  # (phút, user_id) -> (role, seen_at) chưa ghi xuống file
+        self._thread_pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.window = app.config.get('PRESENCE_WINDOW_MINUTES', 5)
+        self.interval = app.config.get('PRESENCE_FLUSH_INTERVAL', 5)
+        self.path = app.config.get('PRESENCE_DB_PATH') or \
+            os.path.join(app.instance_path, 'presence.sqlite3')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS presence (
+                minute INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                seen_at REAL NOT NULL,
+                PRIMARY KEY (minute, user_id)
+            )
+        ''')
+        conn.commit()
+        atexit.register(self.flush_logged)
+
+    def _conn(self):
+        # sqlite3 connection không dùng chung giữa các thread -> mỗi thread 1 connection
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def touch(self, user_id, role):
+        """Ghi nhận user đang online (chỉ trong RAM). Mỗi user chỉ 1 lần / phút / worker."""
+        now = time.time()
+        minute = int(now // 60)
+        with self._lock:
+            if minute != self._minute:
+                self._minute, self._seen = minute, set()
+            if user_id in self._seen:
+                return
+            self._seen.add(user_id)
+            self._pending[(minute, user_id)] = (role, now)
+        self._ensure_thread()
+
+    def flush(self):
+        """Ghi các lượt đang chờ và xóa ô cũ trong 1 transaction. Trả về số dòng đã ghi."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [(minute, uid, role, seen_at) for (minute, uid), (role, seen_at) in pending.items()]
+        conn = self._conn()
+        try:
+            conn.executemany('INSERT OR REPLACE INTO presence (minute, user_id, role, seen_at) VALUES (?, ?, ?, ?)',
+                             rows)
+            conn.execute('DELETE FROM presence WHERE minute <= ?', (int(time.time() // 60) - self.window,))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            # Giữ lại để lần sau ghi tiếp (bỏ các ô đã ra khỏi cửa sổ)
+            oldest = int(time.time() // 60) - self.window
+            with self._lock:
+                for key, value in pending.items():
+                    if key[0] > oldest:
+                        self._pending.setdefault(key, value)
+            raise
+        return len(rows)
+
+    def flush_logged(self):
+        try:
+            self.flush()
+        except sqlite3.Error as e:
+            # VD: "database is locked" quá timeout -> ghi log, lần sau thử lại
+            self.app.logger.warning('Ghi trạng thái online thất bại: %s', e)
+
+    def _ensure_thread(self):
+        # Mỗi worker process (sau fork) cần thread ghi riêng
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name='presence-flush', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush_logged()
+            except Exception:
+                self.app.logger.exception('Ghi trạng thái online thất bại')
+
+    def _since(self):
+        return int(time.time() // 60) - self.window + 1
+
+    def online(self, role=None):
+        """Danh sách (user_id, role, seen_at) đang online, mới nhất trước."""
+        sql = 'SELECT user_id, role, MAX(seen_at) FROM presence WHERE minute >= ?'
+        params = [self._since()]
+        if role:
+            sql += ' AND role = ?'
+            params.append(role)
+        sql += ' GROUP BY user_id, role ORDER BY MAX(seen_at) DESC'
+        return self._conn().execute(sql, params).fetchall()
+
+    def counts(self):
+        """Số user online theo vai trò: {'total': n, 'admin': a, 'teacher': t, 'student': s}"""
+        rows = self._conn().execute(
+            'SELECT role, COUNT(DISTINCT user_id) FROM presence WHERE minute >= ? GROUP BY role',
+            (self._since(),)
+        ).fetchall()
+        result = {'admin': 0, 'teacher': 0, 'student': 0}
+        result.update(dict(rows))
+        result['total'] = sum(result.values())
+        return result
+
+
+presence_tracker = PresenceTracker()
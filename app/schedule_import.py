@@ -0,0 +1,133 @@
+"""
+Nhập thời khóa biểu hàng loạt từ file CSV/XLSX.
+Cột bắt buộc: class (tên lớp hoặc ID), day, start, count, room.
+Trùng phòng / trùng giảng viên được phát hiện bằng 1 lượt sweep-line: sắp mọi buổi
+theo (thứ, tiết bắt đầu), mỗi (thứ, phòng) và (thứ, giảng viên) giữ tiết kết thúc
+muộn nhất của các buổi đã nhận. Buổi chỉ được nhận khi không trùng cả phòng lẫn
+giảng viên, nên dòng bị loại không chặn các dòng sau. Lịch đã có trong DB được đưa
+vào cùng lượt quét nên được ưu tiên giữ lại.
+"""
+import pandas as pd
+from sqlalchemy import insert
+from . import db
+from .models import Class, Schedule
+from .bitmaps import LESSONS_PER_DAY, FIRST_DAY, LAST_DAY
+
+REQUIRED_COLUMNS = ['class', 'day', 'start', 'count', 'room']
+
+
+class ImportFormatError(ValueError):
+    """File không đọc được hoặc thiếu cột"""
+
+
+def read_schedule_file(file_storage):
+    """Đọc file upload thành DataFrame (cột đã chuẩn hóa về chữ thường)."""
+    filename = (file_storage.filename or '').lower()
+    if filename.endswith('.xls'):
+        raise ImportFormatError('Không hỗ trợ file .xls, vui lòng lưu lại dạng .xlsx hoặc .csv')
+    try:
+        if filename.endswith('.xlsx'):
+            df = pd.read_excel(file_storage, dtype=str)
+        else:
+            df = pd.read_csv(file_storage, dtype=str)
+    except Exception as e:
+        raise ImportFormatError(f'Không đọc được file: {e}')
+
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise ImportFormatError(f'Thiếu cột: {", ".join(missing)}')
+    return df
+
+
+def _sweep(intervals, report):
+    """
+    intervals: list (day, start, end, room, teacher_id, row_idx, class_name), row_idx = None với lịch đã có.
+    Trả về row_idx của các dòng được nhận (không giao với buổi đã nhận cùng phòng / cùng GV).
+    """
+    # Cùng tiết bắt đầu: lịch cũ (row_idx None) đứng trước, sau đó theo thứ tự dòng trong file
+    intervals.sort(key=lambda x: (x[0], x[1], x[5] is not None, x[5] or 0))
+    active = {}  # ('room' | 'teacher', thứ, phòng / GV) -> (tiết kết thúc muộn nhất, tên lớp)
+    accepted = []
+    for day, start, end, room, teacher_id, row_idx, class_name in intervals:
+        groups = (('room', day, room), ('teacher', day, teacher_id))
+        if row_idx is not None:
+            for group in groups:
+                active_end, active_name = active.get(group, (0, None))
+                if start <= active_end:
+                    what = 'phòng' if group[0] == 'room' else 'giảng viên'
+                    report[row_idx]['errors'].append(f'Trùng {what} với lớp "{active_name}"')
+            if report[row_idx]['errors']:
+                continue
+            accepted.append(row_idx)
+        # Lịch cũ luôn được giữ (kể cả khi dữ liệu cũ đã chồng nhau)
+        for group in groups:
+            if end > active.get(group, (0, None))[0]:
+                active[group] = (end, class_name)
+    return accepted
+
+
+def import_schedules(df, semester_id):
+    """
+    Kiểm tra toàn bộ file và lưu các dòng hợp lệ trong 1 transaction.
+    Chưa commit. Trả về: (report, số dòng đã lưu, tập class_id có lịch mới).
+    report là list dict theo từng dòng.
+    """
+    classes = Class.query.filter_by(semester_id=semester_id).all()
+    by_id = {str(c.id): c for c in classes}
+    by_name = {c.name.strip().lower(): c for c in classes}
+
+    # 1. Chuẩn hóa kiểu dữ liệu theo cột (vector hóa bằng pandas)
+    class_keys = df['class'].fillna('').astype(str).str.strip()
+    days = pd.to_numeric(df['day'], errors='coerce')
+    starts = pd.to_numeric(df['start'], errors='coerce')
+    counts = pd.to_numeric(df['count'], errors='coerce')
+    rooms = df['room'].fillna('').astype(str).str.strip()
+
+    report = []
+    parsed = []  # (row_idx, cls, day, start, end, room) của các dòng qua bước 1
+    for i, (key, day, start, count, room) in enumerate(zip(class_keys, days, starts, counts, rooms)):
+        row = {'row': i + 2, 'class': key, 'errors': []}  # +2: dòng tiêu đề + đánh số từ 1
+        report.append(row)
+
+        cls = by_id.get(key) or by_name.get(key.lower())
+        if cls is None:
+            row['errors'].append('Lớp không tồn tại trong học kỳ')
+        if pd.isna(day) or pd.isna(start) or pd.isna(count):
+            row['errors'].append('Thứ / tiết / số tiết không hợp lệ')
+        elif day % 1 or start % 1 or count % 1:
+            row['errors'].append('Thứ / tiết / số tiết phải là số nguyên')
+        else:
+            day, start, count = int(day), int(start), int(count)
+            end = start + count - 1
+            if not (FIRST_DAY <= day <= LAST_DAY):
+                row['errors'].append('Thứ phải từ 2 tới 8')
+            if count < 1 or start < 1 or end > LESSONS_PER_DAY:
+                row['errors'].append(f'Tiết học phải nằm trong 1-{LESSONS_PER_DAY}')
+        if not room:
+            row['errors'].append('Thiếu phòng')
+
+        if not row['errors']:
+            parsed.append((i, cls, day, start, end, room))
+
+    # 2. Sweep-line trên lịch cũ + lịch mới
+    existing = db.session.query(Schedule.day_of_week, Schedule.start_lesson, Schedule.end_lesson,
+                                Schedule.room, Class.teacher_id, Class.name) \
+        .join(Class, Class.id == Schedule.class_id) \
+        .filter(Class.semester_id == semester_id, Schedule.is_canceled == False).all()
+
+    intervals = [(d, s, e, r, t, None, n) for d, s, e, r, t, n in existing]
+    intervals += [(d, s, e, r, c.teacher_id, i, c.name) for i, c, d, s, e, r in parsed]
+    accepted = set(_sweep(intervals, report))
+
+    # 3. Lưu tất cả dòng hợp lệ bằng 1 câu INSERT nhiều giá trị
+    rows = [
+        {'class_id': c.id, 'day_of_week': d, 'start_lesson': s, 'end_lesson': e, 'room': r}
+        for i, c, d, s, e, r in parsed if i in accepted
+    ]
+    if rows:
+        db.session.execute(insert(Schedule), rows)
+
+    for row in report:
+        row['status'] = 'error' if row['errors'] else 'ok'
+    return report, len(rows), {r['class_id'] for r in rows}
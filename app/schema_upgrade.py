@@ -0,0 +1,109 @@
+"""
+Nâng cấp schema của DB đang chạy lên phiên bản hiện tại (idempotent, chạy lại bao nhiêu lần cũng được).
+db.create_all() chỉ tạo bảng còn thiếu, không sửa bảng đã có, nên cột / ràng buộc mới
+của bảng cũ được bổ sung ở đây bằng ALTER, kèm tính lại dữ liệu (backfill):
+- classes.enrolled_count   -> đếm lại từ enrollments
+- classes.schedule_mask    -> dựng lại bitmap lớp và bitmap SV
+- jobs.result              -> để trống (chỉ việc mới có kết quả chi tiết)
+- unique_attendance        -> xóa log điểm danh trùng (giữ bản ghi mới nhất) rồi mới tạo khóa
+Bảng mới tổng hợp từ dữ liệu cũ (tổng hợp điểm danh, GPA, phổ điểm, chỉ mục tìm kiếm) được
+backfill ngay khi vừa tạo. Các bảng còn lại tự tính khi được đọc lần đầu.
+"""
+from sqlalchemy import inspect, text, func
+from sqlalchemy.exc import DBAPIError
+from . import db
+from .models import AttendanceLog
+
+NEW_COLUMNS = (
+    ('classes', 'enrolled_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('classes', 'schedule_mask', "VARCHAR(21) NOT NULL DEFAULT '0'"),
+    ('jobs', 'result', 'TEXT'),
+)
+
+
+def _columns(table):
+    return {c['name'] for c in inspect(db.engine).get_columns(table)}
+
+
+def _has_index(table, name):
+    inspector = inspect(db.engine)
+    return any(i['name'] == name for i in inspector.get_indexes(table)) or \
+        any(c['name'] == name for c in inspector.get_unique_constraints(table))
+
+
+def _run_ddl(sql, done_check):
+    """Chạy 1 câu DDL; worker khác vừa chạy trước (done_check() đúng) thì bỏ qua lỗi."""
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text(sql))
+    except DBAPIError:
+        if not done_check():
+            raise
+
+
+def _remove_duplicate_attendance():
+    """Giữ log có id lớn nhất (ghi sau cùng) của mỗi (lớp, SV, ngày). Trả về số dòng đã xóa."""
+    groups = db.session.query(AttendanceLog.class_id, AttendanceLog.student_id, AttendanceLog.date,
+                              func.max(AttendanceLog.id)) \
+        .group_by(AttendanceLog.class_id, AttendanceLog.student_id, AttendanceLog.date) \
+        .having(func.count(AttendanceLog.id) > 1).all()
+    removed = 0
+    for class_id, student_id, day, keep_id in groups:
+        removed += AttendanceLog.query.filter(
+            AttendanceLog.class_id == class_id, AttendanceLog.student_id == student_id,
+            AttendanceLog.date == day, AttendanceLog.id != keep_id
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+def upgrade_schema():
+    """Tạo bảng còn thiếu, bổ sung cột / ràng buộc mới vào bảng cũ rồi backfill. Trả về các bước đã làm."""
+    existing = set(inspect(db.engine).get_table_names())
+    db.create_all()
+    if not existing:
+        return []  # DB mới: create_all đã tạo đủ
+
+    steps = []
+    added = set()
+    for table, column, ddl in NEW_COLUMNS:
+        if column not in _columns(table):
+            _run_ddl(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}',
+                     lambda: column in _columns(table))
+            added.add(column)
+            steps.append(f'Thêm cột {table}.{column}')
+
+    if 'enrolled_count' in added:
+        from .seats import rebuild_seat_counts
+        rebuild_seat_counts()
+        steps.append('Tính lại sĩ số lớp')
+    if 'schedule_mask' in added:
+        from .bitmaps import rebuild_all_masks
+        rebuild_all_masks()
+        steps.append('Dựng lại bitmap thời khóa biểu')
+
+    new_summary = 'attendance_summaries' not in existing
+    if not _has_index('attendance_logs', 'unique_attendance'):
+        removed = _remove_duplicate_attendance()
+        _run_ddl('CREATE UNIQUE INDEX unique_attendance ON attendance_logs (class_id, student_id, date)',
+                 lambda: _has_index('attendance_logs', 'unique_attendance'))
+        steps.append(f'Xóa {removed} log điểm danh trùng, thêm khóa unique_attendance')
+        new_summary = new_summary or removed > 0
+
+    if new_summary:
+        from .attendance import rebuild_attendance_summary
+        rebuild_attendance_summary()
+        steps.append('Tính lại bảng tổng hợp điểm danh')
+    if 'student_term_gpa' not in existing:
+        from .transcript import rebuild_all_gpa
+        rebuild_all_gpa()
+        steps.append('Tính lại GPA')
+    if 'class_grade_stats' not in existing:
+        from .grade_analytics import rebuild_grade_stats
+        rebuild_grade_stats()
+        steps.append('Tính lại thống kê phổ điểm')
+    if 'user_search_tokens' not in existing:
+        from .search_index import rebuild_search_index
+        rebuild_search_index()
+        steps.append('Dựng chỉ mục tìm kiếm')
+    return steps
@@ -0,0 +1,188 @@
+"""
+Chỉ mục tìm kiếm người dùng không phân biệt dấu.
+Mỗi từ của họ tên, mã SV/GV và phần trước @ của email được bỏ dấu (giống
+generate_email_prefix), chuyển chữ thường rồi lưu 1 dòng trong user_search_tokens.
+Mã SV / GV được lưu thêm mọi hậu tố ('git001' -> 'it001', 't001', '001', ...) nên tìm
+tiền tố trên chỉ mục cũng khớp được chuỗi con của mã (VD: '001' -> GIT001).
+Token chỉ gồm [a-z0-9] nên tìm tiền tố 'ngu' là điều kiện khoảng
+`'ngu' <= token < 'ngu{'` trên khóa chính (token, user_id) / index (role, token):
+1 lần quét khoảng trên index thay vì LIKE '%x%' quét cả bảng users. Trang danh sách SV / GV
+ghép điều kiện khớp chỉ mục thẳng vào query (subquery, không giới hạn số kết quả) để
+phân trang keyset và đếm tổng vẫn đúng; ô gợi ý chấm điểm, xếp hạng và LIMIT ngay trong
+SQL nên không kéo mọi dòng khớp về Python. Chỉ mục được cập nhật qua event của ORM;
+các chỗ ghi bằng Core (INSERT theo lô) tự gọi reindex_users.
+"""
+import re
+import unicodedata
+from sqlalchemy import select, delete, insert, event, inspect, and_, case, func, union_all
+from . import db
+from .models import User, Student, Teacher, UserSearchToken
+
+MAX_TOKEN_LEN = 50
+MAX_QUERY_WORDS = 5
+MIN_PREFIX_LEN = 2  # Ô gợi ý: từ ngắn hơn chỉ khớp trọn token (tiền tố 1 ký tự khớp gần hết bảng)
+REINDEX_BATCH = 500
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    """'Nguyễn Văn Đạt' -> 'nguyen van dat' (bỏ dấu, chữ thường, ký tự khác chữ/số thành khoảng trắng)."""
+    text = unicodedata.normalize('NFD', text or '')
+    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+    text = text.replace('đ', 'd').replace('Đ', 'D').lower()
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def tokens_for(full_name, email, code=None):
+    local_part = (email or '').split('@', 1)[0]
+    words = set(normalize(full_name).split()) | set(normalize(local_part).split())
+    if code:
+        words |= {word[i:] for word in normalize(code).split() for i in range(len(word))}
+    return {w[:MAX_TOKEN_LEN] for w in words}
+
+
+# --- GHI CHỈ MỤC ---
+def _reindex(connection, user_ids):
+    """Tính lại token của các user (đọc + ghi qua `connection`, dùng được trong event flush)."""
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return
+    users = connection.execute(
+        select(User.id, User.role, User.full_name, User.email, Student.student_code, Teacher.teacher_code)
+        .outerjoin(Student, Student.user_id == User.id)
+        .outerjoin(Teacher, Teacher.user_id == User.id)
+        .where(User.id.in_(user_ids))
+    ).all()
+
+    table = UserSearchToken.__table__
+    connection.execute(delete(table).where(table.c.user_id.in_(user_ids)))
+    rows = [{'token': token, 'user_id': uid, 'role': role}
+            for uid, role, name, email, s_code, t_code in users
+            for token in tokens_for(name, email, s_code or t_code)]
+    if rows:
+        connection.execute(insert(table), rows)
+
+
+def reindex_users(user_ids):
+    """Cập nhật chỉ mục cho các user vừa ghi bằng Core. Chưa commit."""
+    _reindex(db.session.connection(), user_ids)
+
+
+def rebuild_search_index():
+    """Dựng lại toàn bộ chỉ mục (backfill), theo lô user."""
+    user_ids = [uid for (uid,) in db.session.query(User.id).order_by(User.id).all()]
+    for i in range(0, len(user_ids), REINDEX_BATCH):
+        reindex_users(user_ids[i:i + REINDEX_BATCH])
+        db.session.commit()
+
+
+def register_search_events():
+    """Giữ chỉ mục đồng bộ khi thêm / sửa user và hồ sơ SV/GV qua ORM."""
+    if event.contains(User, 'after_insert', _on_user_insert):
+        return
+    event.listen(User, 'after_insert', _on_user_insert)
+    event.listen(User, 'after_update', _on_user_update)
+    for model in (Student, Teacher):
+        event.listen(model, 'after_insert', _on_profile_insert)
+        event.listen(model, 'after_update', _on_profile_update)
+
+
+def _changed(target, *attrs):
+    state = inspect(target)
+    return any(state.attrs[a].history.has_changes() for a in attrs)
+
+
+def _on_user_insert(mapper, connection, target):
+    _reindex(connection, [target.id])
+
+
+def _on_user_update(mapper, connection, target):
+    # Bỏ qua các lần cập nhật không đụng tới cột được đánh chỉ mục (VD: đổi mật khẩu)
+    if _changed(target, 'full_name', 'email', 'role'):
+        _reindex(connection, [target.id])
+
+
+def _on_profile_insert(mapper, connection, target):
+    _reindex(connection, [target.user_id])
+
+
+def _on_profile_update(mapper, connection, target):
+    code_attr = 'student_code' if isinstance(target, Student) else 'teacher_code'
+    if _changed(target, code_attr, 'user_id'):
+        _reindex(connection, [target.user_id])
+
+
+# --- TRA CỨU ---
+def _query_words(query):
+    # Từ dài nhất thường lọc mạnh nhất -> chạy trước để tập ứng viên nhỏ sớm
+    return sorted(set(normalize(query).split()), key=len, reverse=True)[:MAX_QUERY_WORDS]
+
+
+def _prefix_hits(word, role, *columns, exact_only=False):
+    t = UserSearchToken.__table__
+    # '{' đứng ngay sau 'z' trong bảng mã: [word, word + '{') là mọi token bắt đầu bằng word
+    stmt = select(*columns).where(t.c.token == word) if exact_only else \
+        select(*columns).where(t.c.token >= word, t.c.token < word + '{')
+    return stmt.where(t.c.role == role) if role else stmt
+
+
+def user_match_clause(query, role=None):
+    """
+    Điều kiện "User.id khớp mọi từ trong câu tìm" dạng subquery trên chỉ mục, không giới hạn
+    số kết quả (dùng cho trang danh sách có phân trang). None nếu câu tìm không có từ nào.
+    """
+    t = UserSearchToken.__table__
+    words = _query_words(query)
+    if not words:
+        return None
+    return and_(*(User.id.in_(_prefix_hits(word, role, t.c.user_id)) for word in words))
+
+
+def search_user_ids(query, role=None, limit=20):
+    """
+    [(user_id, điểm)] xếp theo điểm giảm dần. Mọi từ trong câu tìm phải khớp
+    (tiền tố của 1 token, từ ngắn hơn MIN_PREFIX_LEN phải khớp trọn); khớp trọn từ được
+    2 điểm, khớp tiền tố được 1 điểm.
+    """
+    words = _query_words(query)
+    if not words:
+        return []
+
+    t = UserSearchToken.__table__
+    # Điểm của từng từ cho mỗi user (1 dòng / user / từ), rồi cộng lại: user có đủ len(words)
+    # dòng là khớp mọi từ. Gom nhóm, xếp hạng và LIMIT chạy trong DB.
+    per_word = union_all(*(
+        _prefix_hits(word, role, t.c.user_id,
+                     func.max(case((t.c.token == word, 2), else_=1)).label('score'),
+                     exact_only=len(word) < MIN_PREFIX_LEN).group_by(t.c.user_id)
+        for word in words
+    )).subquery()
+    score = func.sum(per_word.c.score)
+    stmt = select(per_word.c.user_id, score) \
+        .group_by(per_word.c.user_id) \
+        .having(func.count() == len(words)) \
+        .order_by(score.desc(), per_word.c.user_id) \
+        .limit(limit)
+    return [(uid, int(total)) for uid, total in db.session.execute(stmt)]
+
+
+def search_users(query, role=None, limit=20):
+    """Kết quả cho ô gợi ý: list dict đã xếp hạng."""
+    ranked = search_user_ids(query, role, limit)
+    if not ranked:
+        return []
+    rows = {r.id: r for r in db.session.execute(
+        select(User.id, User.role, User.full_name, User.email, Student.student_code, Teacher.teacher_code)
+        .outerjoin(Student, Student.user_id == User.id)
+        .outerjoin(Teacher, Teacher.user_id == User.id)
+        .where(User.id.in_([uid for uid, _ in ranked]))
+    ).all()}
+    return [{
+        'id': uid,
+        'role': rows[uid].role,
+        'full_name': rows[uid].full_name,
+        'email': rows[uid].email,
+        'code': rows[uid].student_code or rows[uid].teacher_code,
+        'score': score
+    } for uid, score in ranked if uid in rows]
@@ -0,0 +1,37 @@
+"""
+Giữ chỗ đăng ký tín chỉ.
+Sĩ số lớp được lưu sẵn ở cột classes.enrolled_count (phi chuẩn hóa) và chỉ
+được tăng bằng 1 câu UPDATE có điều kiện, nên không bao giờ vượt max_students
+kể cả khi hàng nghìn sinh viên bấm đăng ký cùng lúc.
+"""
+from sqlalchemy import update, select, func
+from . import db
+from .models import Class, Enrollment
+
+
+def reserve_seat(class_id):
+    """
+    Giữ 1 chỗ trong lớp (nguyên tử).
+    Trả về: True nếu còn chỗ và đã tăng sĩ số, False nếu lớp đã đầy.
+    Lưu ý: chưa commit. Dòng lớp bị khóa tới khi commit/rollback,
+    rollback sẽ tự trả lại chỗ đã giữ.
+    """
+    result = db.session.execute(
+        update(Class)
+        .where(Class.id == class_id, Class.enrolled_count < Class.max_students)
+        .values(enrolled_count=Class.enrolled_count + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def rebuild_seat_counts():
+    """Tính lại enrolled_count từ bảng enrollments (dùng khi backfill dữ liệu cũ)."""
+    real_count = select(func.count(Enrollment.id)) \
+        .where(Enrollment.class_id == Class.id) \
+        .scalar_subquery()
+    db.session.execute(
+        update(Class).values(enrolled_count=real_count)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
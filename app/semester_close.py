@@ -0,0 +1,69 @@
+"""
+Kết thúc học kỳ (chạy nền qua app/jobs.py).
+Trong 1 transaction: khóa mọi lớp của học kỳ bằng 1 câu UPDATE, kiểm tra lớp còn SV
+chưa có điểm tổng kết bằng 1 query GROUP BY, còn thiếu thì rollback (mở khóa lại),
+đủ thì đóng học kỳ rồi commit. Khóa trước rồi mới kiểm tra nên không có lượt đăng ký
+/ lưu điểm nào chen vào giữa 2 bước.
+"""
+from sqlalchemy import update, func
+from . import db
+from .models import Class, Enrollment, Semester
+from .counters import add_deltas
+from .jobs import job_type, JobError
+
+MAX_LISTED_CLASSES = 10
+
+
+class SemesterCloseError(JobError):
+    """Học kỳ chưa đủ điều kiện kết thúc"""
+
+
+def unfinished_classes(semester_id):
+    """[(tên lớp, số SV chưa có điểm tổng kết)] của học kỳ, 1 query GROUP BY."""
+    return db.session.query(Class.name, func.count(Enrollment.id)) \
+        .join(Enrollment, Enrollment.class_id == Class.id) \
+        .filter(Class.semester_id == semester_id, Enrollment.total_10.is_(None)) \
+        .group_by(Class.id, Class.name) \
+        .order_by(Class.name).all()
+
+
+def close_semester(semester_id, report=None):
+    """
+    Kết thúc học kỳ. report(percent, message): callback báo tiến độ.
+    Trả về số lớp đã khóa; ném SemesterCloseError nếu còn lớp chưa đủ điểm.
+    """
+    report = report or (lambda percent, message: None)
+    try:
+        report(20, 'Đang khóa lớp...')
+        locked = db.session.execute(
+            update(Class).where(Class.semester_id == semester_id).values(is_locked=True)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        report(50, 'Đang kiểm tra điểm tổng kết...')
+        unfinished = unfinished_classes(semester_id)
+        if unfinished:
+            shown = ', '.join(f"{name} ({count} SV chưa điểm)" for name, count in unfinished[:MAX_LISTED_CLASSES])
+            more = f' và {len(unfinished) - MAX_LISTED_CLASSES} lớp khác' if len(unfinished) > MAX_LISTED_CLASSES else ''
+            raise SemesterCloseError(f'KHÔNG THỂ KẾT THÚC! Lớp chưa đủ điểm: {shown}{more}')
+
+        report(80, 'Đang đóng học kỳ...')
+        closed = db.session.execute(
+            update(Semester).where(Semester.id == semester_id, Semester.is_active == True)
+            .values(is_active=False).execution_options(synchronize_session=False)
+        ).rowcount
+        if not closed:
+            raise SemesterCloseError('Học kỳ không tồn tại hoặc đã kết thúc')
+        # UPDATE bằng Core không qua event ORM -> tự trừ bộ đếm dashboard
+        add_deltas({'active_semesters': -1})
+        db.session.commit()
+        return locked
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+@job_type('close_semester', concurrency=1, max_attempts=2)
+def close_semester_job(ctx, semester_id):
+    locked = close_semester(semester_id, ctx.progress)
+    return f'Đã kết thúc học kỳ, khóa {locked} lớp.'
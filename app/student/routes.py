@@ -1,11 +1,17 @@
 from flask import render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from sqlalchemy import and_
+from sqlalchemy.orm import joinedload, contains_eager
+from sqlalchemy.exc import IntegrityError
 from . import student
 from .. import db
 # Import gọn gàng, không lặp lại
-from ..models import Class, Enrollment, Schedule, Semester, GradeWeight, GradeScore
+from ..models import Class, Enrollment, Schedule, Semester, GradeWeight, GradeScore, StudentTermGpa
 from ..utils import student_required, check_schedule_conflict
+from ..seats import reserve_seat
+from ..bitmaps import from_hex, to_hex, get_student_mask, find_conflicting_class
+from ..exports import transcript_rows, export_response
+from ..timetable import student_grid
 
 
 # --- DASHBOARD ---
@@ -20,7 +26,7 @@ def dashboard():
     enrolled_count = 0
     if active_semester:
         enrolled_count = Enrollment.query.join(Class).filter(
-            Enrollment.student_id == current_user.student_profile.id,
+            Enrollment.student_id == current_user.student_profile_id,
             Class.semester_id == active_semester.id
         ).count()
 
@@ -38,7 +44,7 @@ def registration():
         flash('Hiện tại không có học kỳ nào mở đăng ký.', 'warning')
         return redirect(url_for('student.dashboard'))
 
-    student_id = current_user.student_profile.id
+    student_id = current_user.student_profile_id
 
     if request.method == 'POST':
         class_id = request.form.get('class_id')
@@ -54,56 +60,54 @@ def registration():
             flash(f'Bạn đã đăng ký lớp {target_class.name} rồi!', 'warning')
             return redirect(url_for('student.registration'))
 
-        # B. Kiểm tra sĩ số
-        current_count = len(target_class.enrollments)
-        if current_count >= target_class.max_students:
+        # B. Kiểm tra nhanh sĩ số (chỉ đọc cột đếm, chốt chỗ thật ở bước D)
+        if target_class.enrolled_count >= target_class.max_students:
             flash('Lớp đã đầy sĩ số!', 'danger')
             return redirect(url_for('student.registration'))
 
-        # C. KIỂM TRA TRÙNG LỊCH
-        current_enrollments = Enrollment.query.join(Class).filter(
-            Enrollment.student_id == student_id,
-            Class.semester_id == semester.id
-        ).all()
-
-        target_schedules = target_class.schedules
+        # C. KIỂM TRA TRÙNG LỊCH: 1 phép AND giữa bitmap của SV và của lớp
+        target_mask = from_hex(target_class.schedule_mask)
+        student_mask = get_student_mask(student_id, target_class.semester_id, for_update=True)
         conflict_found = False
 
-        for enrollment in current_enrollments:
-            enrolled_class = enrollment.class_info
-            for enrolled_sched in enrolled_class.schedules:
-                for target_sched in target_schedules:
-                    if enrolled_sched.day_of_week == target_sched.day_of_week:
-                        if (target_sched.start_lesson <= enrolled_sched.end_lesson) and \
-                                (target_sched.end_lesson >= enrolled_sched.start_lesson):
-                            flash(f'LỖI: Trùng lịch với lớp "{enrolled_class.name}"', 'danger')
-                            conflict_found = True
-                            break
-                if conflict_found: break
-            if conflict_found: break
+        if from_hex(student_mask.mask) & target_mask:
+            conflict_class = find_conflicting_class(student_id, target_class.semester_id, target_mask)
+            conflict_name = conflict_class.name if conflict_class else ''
+            flash(f'LỖI: Trùng lịch với lớp "{conflict_name}"', 'danger')
+            conflict_found = True
 
         # D. LƯU ĐĂNG KÝ VÀ TỰ ĐỘNG GÁN ĐIỂM CHUYÊN CẦN
         if not conflict_found:
-            # 1. Tạo Enrollment
-            new_enroll = Enrollment(student_id=student_id, class_id=class_id)
-            db.session.add(new_enroll)
-            db.session.commit()  # Commit để có ID
-
-            # 2. Tìm cột điểm "Chuyên cần" (nếu có)
+            # 1. Tìm cột điểm "Chuyên cần" (nếu có) trước khi giữ chỗ để transaction ngắn nhất
             attendance_weight = GradeWeight.query.filter_by(
                 subject_id=target_class.subject_id,
                 name="Chuyên cần"
             ).first()
 
-            # 3. Gán điểm 10 mặc định
-            if attendance_weight:
-                init_score = GradeScore(
-                    enrollment_id=new_enroll.id,
-                    grade_weight_id=attendance_weight.id,
-                    value=10.0
-                )
-                db.session.add(init_score)
+            # 2. Giữ chỗ nguyên tử: UPDATE ... WHERE enrolled_count < max_students
+            if not reserve_seat(target_class.id):
+                db.session.rollback()
+                flash('Lớp đã đầy sĩ số!', 'danger')
+                return redirect(url_for('student.registration'))
+
+            # 3. Tạo Enrollment + điểm chuyên cần mặc định + cập nhật bitmap SV trong cùng transaction
+            new_enroll = Enrollment(student_id=student_id, class_id=target_class.id)
+            db.session.add(new_enroll)
+            student_mask.mask = to_hex(from_hex(student_mask.mask) | target_mask)
+            try:
+                db.session.flush()  # Flush để có ID
+                if attendance_weight:
+                    db.session.add(GradeScore(
+                        enrollment_id=new_enroll.id,
+                        grade_weight_id=attendance_weight.id,
+                        value=10.0
+                    ))
                 db.session.commit()
+            except IntegrityError:
+                # Bấm đăng ký 2 lần cùng lúc -> unique_enrollment chặn, rollback trả lại chỗ
+                db.session.rollback()
+                flash(f'Bạn đã đăng ký lớp {target_class.name} rồi!', 'warning')
+                return redirect(url_for('student.registration'))
 
             flash(f'Đăng ký thành công lớp: {target_class.name}', 'success')
 
@@ -124,7 +128,7 @@ def registration():
 @login_required
 @student_required
 def schedule():
-    student_id = current_user.student_profile.id
+    student_id = current_user.student_profile_id
 
     all_semesters = Semester.query.order_by(Semester.start_date.desc()).all()
     semester_id = request.args.get('semester_id', type=int)
@@ -137,15 +141,11 @@ def schedule():
         if not current_semester and all_semesters:
             current_semester = all_semesters[0]
 
-    enrollments = []
-    if current_semester:
-        enrollments = Enrollment.query.join(Class).filter(
-            Enrollment.student_id == student_id,
-            Class.semester_id == current_semester.id
-        ).all()
+    # Lưới 12 tiết x 7 thứ dựng sẵn (cache theo SV + học kỳ), template chỉ việc in ra
+    grid = student_grid(student_id, current_semester.id) if current_semester else None
 
     return render_template('student/schedule.html',
-                           enrollments=enrollments,
+                           grid=grid,
                            semesters=all_semesters,
                            current_semester=current_semester)
 
@@ -155,75 +155,57 @@ def schedule():
 @login_required
 @student_required
 def view_grades():
-    student_id = current_user.student_profile.id
+    student_id = current_user.student_profile_id
 
-    enrollments = Enrollment.query.filter_by(student_id=student_id) \
-        .join(Class).join(Semester) \
+    # 1. GPA học kỳ + tích lũy đã tính sẵn (app/transcript.py), chỉ có khi đã có điểm được lưu
+    term_rows = StudentTermGpa.query.filter_by(student_id=student_id) \
+        .join(Semester).options(contains_eager(StudentTermGpa.semester)) \
         .order_by(Semester.start_date.desc()).all()
 
-    transcript_data = []
-    total_accumulated_points = 0
-    total_accumulated_credits = 0
-    temp_group = {}
+    # 2. Chi tiết điểm: 1 query eager-load lớp, môn, học kỳ và các cột điểm
+    enrollments = Enrollment.query.filter_by(student_id=student_id).options(
+        joinedload(Enrollment.class_info).joinedload(Class.subject),
+        joinedload(Enrollment.class_info).joinedload(Class.semester),
+        joinedload(Enrollment.scores).joinedload(GradeScore.weight_config)
+    ).all()
 
+    by_semester = {}
+    semesters = {row.semester_id: row.semester for row in term_rows}
     for enroll in enrollments:
-        sem_id = enroll.class_info.semester_id
-
-        if sem_id not in temp_group:
-            temp_group[sem_id] = {
-                'semester': enroll.class_info.semester,
-                'enrollments': [],
-                'term_points': 0,
-                'term_credits': 0
-            }
-
-        # --- PHẦN QUAN TRỌNG: LẤY CHI TIẾT ĐIỂM (CC, GK, CK...) ---
-        detail_scores = []
-        # enroll.scores là quan hệ 1-nhiều sang bảng GradeScore
-        for score in enroll.scores:
-            detail_scores.append({
-                # Cần đảm bảo model GradeScore có backref='weight_config' sang GradeWeight
-                'name': score.weight_config.name,
-                'val': score.value,
-                'percent': score.weight_config.weight_percent
-            })
-
         # Sắp xếp theo % trọng số (hoặc theo order_index nếu bạn join thêm)
-        detail_scores.sort(key=lambda x: x['percent'])
-
-        # Gán vào thuộc tính tạm để Template sử dụng
-        enroll.detail_scores_display = detail_scores
-        # -----------------------------------------------------------
-
-        temp_group[sem_id]['enrollments'].append(enroll)
-
-        if enroll.total_4 is not None:
-            credits = enroll.class_info.subject.credits
-            points = enroll.total_4 * credits
-            temp_group[sem_id]['term_points'] += points
-            temp_group[sem_id]['term_credits'] += credits
-            total_accumulated_points += points
-            total_accumulated_credits += credits
-
-    for sem_id, data in temp_group.items():
-        term_gpa = 0.0
-        if data['term_credits'] > 0:
-            term_gpa = round(data['term_points'] / data['term_credits'], 2)
-
-        transcript_data.append({
-            'semester': data['semester'],
-            'enrollments': data['enrollments'],
-            'term_gpa': term_gpa,
-            'term_credits': data['term_credits']
-        })
-
-    transcript_data.sort(key=lambda x: x['semester'].start_date, reverse=True)
-
-    cumulative_gpa = 0.0
-    if total_accumulated_credits > 0:
-        cumulative_gpa = round(total_accumulated_points / total_accumulated_credits, 2)
+        enroll.detail_scores_display = sorted(
+            ({'name': score.weight_config.name, 'val': score.value, 'percent': score.weight_config.weight_percent}
+             for score in enroll.scores),
+            key=lambda x: x['percent']
+        )
+        by_semester.setdefault(enroll.class_info.semester_id, []).append(enroll)
+        semesters.setdefault(enroll.class_info.semester_id, enroll.class_info.semester)
+
+    # Học kỳ vừa đăng ký (chưa có điểm) chưa có dòng GPA -> hiển thị 0 tín chỉ
+    term_by_semester = {row.semester_id: row for row in term_rows}
+    transcript_data = [{
+        'semester': sem,
+        'enrollments': by_semester.get(sem_id, []),
+        'term_gpa': term_by_semester[sem_id].term_gpa if sem_id in term_by_semester else 0.0,
+        'term_credits': term_by_semester[sem_id].term_credits if sem_id in term_by_semester else 0
+    } for sem_id, sem in sorted(semesters.items(), key=lambda item: item[1].start_date, reverse=True)]
+
+    # Dòng mới nhất chứa số liệu tích lũy của toàn khóa
+    latest = term_rows[0] if term_rows else None
+    cumulative_gpa = latest.cumulative_gpa if latest else 0.0
+    total_credits = latest.cumulative_credits if latest else 0
 
     return render_template('student/grades.html',
                            transcript=transcript_data,
                            cumulative_gpa=cumulative_gpa,
-                           total_credits=total_accumulated_credits)
\ No newline at end of file
+                           total_credits=total_credits)
+
+
+# --- XUẤT BẢNG ĐIỂM CÁ NHÂN (CSV / XLSX) ---
+@student.route('/grades/export')
+@login_required
+@student_required
+def export_transcript():
+    student_id = current_user.student_profile_id
+    return export_response(transcript_rows(student_id), request.args.get('format', 'csv'),
+                           f'bang_diem_ca_nhan_{student_id}', 'Bảng điểm')
@@ -1,12 +1,20 @@
-from flask import render_template, request, redirect, url_for, flash
+from flask import render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 from . import teacher
 from .. import db
 # Import đầy đủ các Model cần thiết
-from ..models import Class, Enrollment, GradeWeight, GradeScore, AttendanceLog, Semester, Student, Subject
+from ..models import Class, Enrollment, GradeWeight, GradeScore, Semester
 # Import các hàm tiện ích
-from ..utils import teacher_required, calculate_gpa_vku, get_letter_grade, get_valid_class_dates
+from ..utils import teacher_required
+from ..class_calendar import class_calendar
+from ..grading import save_class_grades
+from ..attendance import save_day, class_summary, AT_RISK_ABSENCES
+from ..grade_import import GradeImportError, read_grade_file, preview_grades, apply_grade_changes
+from ..exports import class_sheet_rows, export_response
+from ..grade_analytics import class_stats
+from ..timetable import teacher_grid
 
 
 # --- 1. DASHBOARD ---
@@ -14,7 +22,7 @@ from ..utils import teacher_required, calculate_gpa_vku, get_letter_grade, get_v
 @login_required
 @teacher_required
 def dashboard():
-    teacher_id = current_user.teacher_profile.id
+    teacher_id = current_user.teacher_profile_id
     # Hiển thị tất cả lớp (cả lớp cũ và mới)
     my_classes = Class.query.filter_by(teacher_id=teacher_id).order_by(Class.id.desc()).all()
     return render_template('teacher/dashboard.html', classes=my_classes)
@@ -25,13 +33,11 @@ def dashboard():
 @login_required
 @teacher_required
 def schedule():
-    teacher_id = current_user.teacher_profile.id
+    teacher_id = current_user.teacher_profile_id
 
-    # Chỉ lấy lớp thuộc Học kỳ đang hoạt động
-    my_classes = Class.query.join(Semester).filter(
-        Class.teacher_id == teacher_id,
-        Semester.is_active == True
-    ).all()
+    # Chỉ lấy lịch các lớp thuộc Học kỳ đang hoạt động (lưới dựng sẵn, cache theo GV)
+    active_ids = [sid for (sid,) in db.session.query(Semester.id).filter(Semester.is_active == True).all()]
+    grid = teacher_grid(teacher_id, active_ids)
 
     # Logic tính ngày tháng cho tuần hiện tại
     today = datetime.now().date()
@@ -43,7 +49,7 @@ def schedule():
         week_dates[db_day] = current_day.strftime('%d/%m')
 
     return render_template('teacher/schedule.html',
-                           my_classes=my_classes,
+                           grid=grid,
                            week_dates=week_dates,
                            today_db=today.weekday() + 2)
 
@@ -56,7 +62,7 @@ def take_attendance(class_id):
     current_class = Class.query.get_or_404(class_id)
 
     # Validate quyền và trạng thái lớp
-    if current_class.teacher_id != current_user.teacher_profile.id:
+    if current_class.teacher_id != current_user.teacher_profile_id:
         flash('Bạn không có quyền truy cập lớp này.', 'danger')
         return redirect(url_for('teacher.dashboard'))
 
@@ -73,50 +79,48 @@ def take_attendance(class_id):
         flash('Lớp chưa có thời khóa biểu!', 'danger')
         return redirect(url_for('teacher.dashboard'))
 
-    # Chuẩn bị danh sách các buổi học để hiển thị dropdown
-    semester = current_class.semester
-    sessions = []
-    for sch in schedules:
-        dates = get_valid_class_dates(sch, semester)
-        for d in dates:
-            session_info = {
-                'date_obj': d,
-                'value': d.strftime('%Y-%m-%d'),
-                'display': f"Thứ {sch.day_of_week} - {d.strftime('%d/%m/%Y')} | Tiết {sch.start_lesson}-{sch.end_lesson} | Phòng {sch.room}"
-            }
-            sessions.append(session_info)
-
-    sessions.sort(key=lambda x: x['date_obj'])
-    valid_values = [s['value'] for s in sessions]
+    # Chuẩn bị danh sách các buổi học để hiển thị dropdown (đã trừ ngày nghỉ / buổi hủy)
+    calendar = class_calendar(current_class)
+    sessions = calendar.sessions
     today_str = datetime.now().strftime('%Y-%m-%d')
 
     # XỬ LÝ POST: LƯU ĐIỂM DANH
     if request.method == 'POST':
         selected_date_str = request.form.get('attendance_date')
 
-        if selected_date_str not in valid_values:
+        if selected_date_str not in calendar:
             flash('Ngày chọn không hợp lệ hoặc không có lịch học!', 'danger')
             return redirect(url_for('teacher.take_attendance', class_id=class_id))
 
         selected_date = datetime.strptime(selected_date_str, '%Y-%m-%d').date()
 
-        # Xóa log cũ của ngày hôm đó để lưu mới (tránh trùng lặp)
-        AttendanceLog.query.filter_by(class_id=class_id, date=selected_date).delete()
+        statuses = {
+            enroll.student_id: request.form.get(f'status_{enroll.student_id}', 'present')
+            for enroll in Enrollment.query.filter_by(class_id=class_id).all()
+        }
+
+        # Chỉ ghi các dòng thay đổi. Nếu tab khác vừa lưu cùng ngày (trùng unique_attendance)
+        # thì rollback và chạy lại 1 lần: lần 2 sẽ thấy log đã có và chuyển thành UPDATE.
+        for attempt in range(2):
+            try:
+                save_day(class_id, selected_date, statuses)
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if attempt == 1:
+                    flash('Không lưu được điểm danh, vui lòng thử lại.', 'danger')
+                    return redirect(url_for('teacher.take_attendance', class_id=class_id))
 
-        for enroll in current_class.enrollments:
-            sid = enroll.student_id
-            status = request.form.get(f'status_{sid}', 'present')
-            log = AttendanceLog(class_id=class_id, student_id=sid, date=selected_date, status=status)
-            db.session.add(log)
-
-        db.session.commit()
         flash(f'Đã lưu điểm danh ngày {selected_date.strftime("%d/%m/%Y")}.', 'success')
         return redirect(url_for('teacher.take_attendance', class_id=class_id))
 
     return render_template('teacher/attendance.html',
                            current_class=current_class,
                            sessions=sessions,
-                           today_str=today_str)
+                           today_str=today_str,
+                           summary=class_summary(class_id),
+                           at_risk_absences=AT_RISK_ABSENCES)
 
 
 # --- 4. NHẬP ĐIỂM (ĐÃ SỬA CHO CẤU TRÚC ĐỘNG) ---
@@ -127,7 +131,7 @@ def input_grades(class_id):
     current_class = Class.query.get_or_404(class_id)
 
     # 1. Kiểm tra quyền
-    if current_class.teacher_id != current_user.teacher_profile.id:
+    if current_class.teacher_id != current_user.teacher_profile_id:
         return redirect(url_for('teacher.dashboard'))
 
     # 2. Lấy cấu hình cột điểm của môn học này
@@ -140,72 +144,8 @@ def input_grades(class_id):
             flash('Lớp đã khóa hoặc học kỳ đã kết thúc.', 'danger')
             return redirect(url_for('teacher.input_grades', class_id=class_id))
 
-        # Duyệt qua từng sinh viên
-        for enroll in current_class.enrollments:
-            sid = enroll.student_id
-
-            # --- TỰ ĐỘNG TÍNH ĐIỂM CHUYÊN CẦN TỪ LOG (NẾU CÓ CỘT NÀY) ---
-            # Tìm xem môn này có cột nào tên là "Chuyên cần" không
-            att_weight = next((w for w in weights if w.name.lower() == "chuyên cần"), None)
-
-            if att_weight:
-                # Tính toán điểm dựa trên log
-                logs = AttendanceLog.query.filter_by(class_id=class_id, student_id=sid).all()
-                calc_score = 10.0
-                for log in logs:
-                    if log.status == 'absent':
-                        calc_score -= 1.0  # Vắng trừ 1
-                    elif log.status == 'late':
-                        calc_score -= 0.5  # Muộn trừ 0.5
-                    elif log.status == 'excused':
-                        calc_score -= 0.5  # Có phép trừ 0.5 (tùy quy chế)
-
-                if calc_score < 0: calc_score = 0
-
-                # Lưu vào bảng GradeScore
-                att_score_record = GradeScore.query.filter_by(enrollment_id=enroll.id,
-                                                              grade_weight_id=att_weight.id).first()
-                if not att_score_record:
-                    att_score_record = GradeScore(enrollment_id=enroll.id, grade_weight_id=att_weight.id)
-                    db.session.add(att_score_record)
-                att_score_record.value = calc_score
-
-            # --- LƯU CÁC CỘT ĐIỂM KHÁC TỪ FORM ---
-            total_subject_score = 0
-            total_percent = 0
-
-            for w in weights:
-                # Nếu là Chuyên cần thì đã tính ở trên rồi, nhưng vẫn lấy từ form nếu muốn cho phép sửa tay
-                # Ở đây tôi ưu tiên lấy từ form nếu người dùng nhập, nếu không nhập thì giữ nguyên logic tính toán
-
-                input_name = f"score_{enroll.id}_{w.id}"  # VD: score_101_5
-                val_str = request.form.get(input_name)
-
-                # Tìm bản ghi điểm trong DB
-                score_record = GradeScore.query.filter_by(enrollment_id=enroll.id, grade_weight_id=w.id).first()
-                if not score_record:
-                    score_record = GradeScore(enrollment_id=enroll.id, grade_weight_id=w.id)
-                    db.session.add(score_record)
-
-                # Nếu là chuyên cần và form trống => dùng điểm tự tính (đã gán ở trên).
-                # Nếu form có dữ liệu => dùng dữ liệu form (ghi đè)
-                if val_str is not None and val_str.strip() != '':
-                    try:
-                        score_record.value = float(val_str)
-                    except ValueError:
-                        pass  # Giữ nguyên giá trị cũ nếu nhập sai
-
-                # --- CỘNG DỒN TÍNH TỔNG KẾT ---
-                if score_record.value is not None:
-                    total_subject_score += score_record.value * (w.weight_percent / 100)
-                    total_percent += w.weight_percent
-
-            # --- TÍNH TỔNG KẾT (Chỉ tính khi tổng trọng số cấu hình là 100%) ---
-            # Hoặc logic: Tính dựa trên các cột đã có điểm
-            enroll.total_10 = round(total_subject_score, 2)
-            enroll.total_4 = calculate_gpa_vku(enroll.total_10)
-            enroll.letter_grade = get_letter_grade(enroll.total_4)
-            enroll.is_passed = (enroll.total_4 >= 1.0)
+        # Lưu cả lớp theo lô: số query cố định, chỉ ghi các ô thay đổi (xem app/grading.py)
+        save_class_grades(class_id, weights, request.form)
 
         db.session.commit()
         flash('Đã lưu bảng điểm thành công.', 'success')
@@ -219,33 +159,9 @@ def input_grades(class_id):
     for s in all_scores:
         scores_map[(s.enrollment_id, s.grade_weight_id)] = s.value
 
-    # 2. Logic biểu đồ thống kê
-    stats_10 = {'< 4.0': 0, '4.0 - 5.4': 0, '5.5 - 6.9': 0, '7.0 - 8.4': 0, '>= 8.5': 0}
-    pass_count = 0
-    fail_count = 0
-    total_students = len(current_class.enrollments)
-
-    for enroll in current_class.enrollments:
-        if enroll.total_10 is not None:
-            s = enroll.total_10
-            if enroll.is_passed:
-                pass_count += 1
-            else:
-                fail_count += 1
-
-            if s < 4.0:
-                stats_10['< 4.0'] += 1
-            elif s < 5.5:
-                stats_10['4.0 - 5.4'] += 1
-            elif s < 7.0:
-                stats_10['5.5 - 6.9'] += 1
-            elif s < 8.5:
-                stats_10['7.0 - 8.4'] += 1
-            else:
-                stats_10['>= 8.5'] += 1
-
-    labels = list(stats_10.keys())
-    data = list(stats_10.values())
+    # 2. Biểu đồ thống kê: đọc phổ điểm đã tính sẵn của lớp (app/grade_analytics.py)
+    stats = class_stats(class_id)
+    total_students = current_class.enrolled_count  # Sĩ số đếm sẵn, không nạp cả danh sách enrollment
 
     return render_template('teacher/grades.html',
                            # Lưu ý: Bạn cần update file html này theo code Frontend tôi gửi ở turn trước
@@ -253,6 +169,74 @@ def input_grades(class_id):
                            current_class=current_class,  # Truyền cả 2 tên để tương thích template cũ/mới
                            weights=weights,
                            scores_map=scores_map,
-                           labels=labels, data=data,
-                           pass_count=pass_count, fail_count=fail_count,
-                           total_students=total_students)
\ No newline at end of file
+                           labels=stats['bucket_labels'], data=stats['buckets'],
+                           pass_count=stats['passed'], fail_count=stats['failed'],
+                           stats=stats, total_students=total_students)
+
+
+# API: Thống kê phổ điểm của lớp (cho biểu đồ / so sánh)
+@teacher.route('/class/<int:class_id>/grades/stats', methods=['GET'])
+@login_required
+@teacher_required
+def grade_stats(class_id):
+    current_class = Class.query.get_or_404(class_id)
+    if current_class.teacher_id != current_user.teacher_profile_id:
+        return jsonify({'success': False, 'msg': 'Bạn không phụ trách lớp này!'})
+    return jsonify({'success': True, 'class_id': class_id, **class_stats(class_id)})
+
+
+# --- 5. NHẬP ĐIỂM TỪ FILE CSV/XLSX ---
+@teacher.route('/class/<int:class_id>/grades/import', methods=['POST'])
+@login_required
+@teacher_required
+def import_grades(class_id):
+    """Gửi file lần đầu để xem trước thay đổi; gửi lại kèm confirm=1 để lưu."""
+    current_class = Class.query.get_or_404(class_id)
+    if current_class.teacher_id != current_user.teacher_profile_id:
+        return jsonify({'success': False, 'msg': 'Bạn không phụ trách lớp này!'})
+    if not current_class.semester.is_active or current_class.is_locked:
+        return jsonify({'success': False, 'msg': 'Lớp đã khóa hoặc học kỳ đã kết thúc.'})
+
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'success': False, 'msg': 'Chưa chọn file!'})
+
+    weights = GradeWeight.query.filter_by(subject_id=current_class.subject_id) \
+        .order_by(GradeWeight.order_index).all()
+    try:
+        df = read_grade_file(upload, current_class.name)
+        report, changes, columns = preview_grades(class_id, weights, df)
+    except GradeImportError as e:
+        return jsonify({'success': False, 'msg': str(e)})
+
+    confirm = request.form.get('confirm') == '1'
+    if confirm and changes:
+        apply_grade_changes(class_id, weights, changes)
+        db.session.commit()
+
+    msg = f'Đã cập nhật {len(changes)} ô điểm.' if confirm else \
+        f'{len(changes)} ô điểm sẽ thay đổi, {len(report)} dòng bị loại.'
+    return jsonify({
+        'success': True,
+        'msg': msg,
+        'preview': not confirm,
+        'columns': columns,
+        'changes': changes,
+        'report': report
+    })
+
+
+# --- 6. XUẤT BẢNG ĐIỂM LỚP (CSV / XLSX) ---
+@teacher.route('/class/<int:class_id>/grades/export')
+@login_required
+@teacher_required
+def export_grades(class_id):
+    current_class = Class.query.get_or_404(class_id)
+    if current_class.teacher_id != current_user.teacher_profile_id:
+        return redirect(url_for('teacher.dashboard'))
+
+    weights = GradeWeight.query.filter_by(subject_id=current_class.subject_id) \
+        .order_by(GradeWeight.order_index).all()
+    return export_response(class_sheet_rows(class_id, weights), request.args.get('format', 'csv'),
+                           f'bang_diem_lop_{class_id}', current_class.name,
+                           total_rows=current_class.enrolled_count)
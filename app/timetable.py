@@ -0,0 +1,102 @@
+"""
+Lưới thời khóa biểu tuần (7 thứ x 12 tiết) dựng sẵn bằng Python cho trang lịch của SV và GV.
+Mọi buổi học được đọc bằng 1 query (kèm tên lớp, tên môn) rồi xếp vào lưới:
+    grid[tiết - 1][thứ - 2] = None     -> ô trống
+                             = COVERED  -> đã gộp vào ô phía trên (không render <td>)
+                             = dict     -> ô đầu buổi học {'rowspan', 'items': [lớp...]}
+Template chỉ còn 1 vòng lặp qua 84 ô thay vì lồng 4 vòng và lazy-load lịch từng lớp.
+Lưới được cache trong RAM theo (người dùng, học kỳ). Dấu hiệu cũ:
+- version chỉ mục chiếm dụng của học kỳ (app/occupancy.py) tăng khi thêm / xóa lịch;
+- bitmap thời khóa biểu của SV (student_schedule_masks) đổi khi SV đăng ký lớp.
+"""
+import threading
+from . import db
+from .models import Class, Enrollment, Schedule, StudentScheduleMask, Subject
+from .bitmaps import LESSONS_PER_DAY, FIRST_DAY, LAST_DAY
+from .cache import get_version
+from . import occupancy
+
+DAYS = LAST_DAY - FIRST_DAY + 1
+# Ô không vắt qua các dòng ngăn cách "Hết buổi sáng" (sau tiết 5) / "Hết buổi chiều" (sau tiết 10)
+BREAKS = (5, 10)
+COVERED = 0
+MAX_CACHED_GRIDS = 5000
+
+_lock = threading.Lock()
+_grids = {}  # (loại, id hồ sơ, học kỳ) -> (dấu hiệu, lưới)
+
+
+def build_grid(sessions):
+    """sessions: [(thứ, tiết bắt đầu, tiết kết thúc, thông tin lớp)]. Trả về lưới 12 x 7."""
+    grid = [[None] * DAYS for _ in range(LESSONS_PER_DAY)]
+    for day, start, end, info in sorted(sessions, key=lambda s: (s[0], s[1], s[2])):
+        if not (FIRST_DAY <= day <= LAST_DAY):
+            continue
+        col = day - FIRST_DAY
+        lesson, end = max(start, 1), min(end, LESSONS_PER_DAY)
+        while lesson <= end:
+            if grid[lesson - 1][col] is not None:
+                # Trùng với buổi đã xếp (bắt đầu sớm hơn): ghi thêm vào ô đó, phần còn lại xếp tiếp
+                top = lesson
+                while grid[top - 1][col] == COVERED:
+                    top -= 1
+                owner = grid[top - 1][col]
+                if info not in owner['items']:
+                    owner['items'].append(info)
+                lesson = top + owner['rowspan']
+                continue
+            seg_end = min([end] + [b for b in BREAKS if lesson <= b < end])
+            grid[lesson - 1][col] = {'rowspan': seg_end - lesson + 1, 'items': [info]}
+            for row in range(lesson, seg_end):
+                grid[row][col] = COVERED
+            lesson = seg_end + 1
+    return grid
+
+
+def _sessions(query):
+    rows = query.with_entities(Schedule.day_of_week, Schedule.start_lesson, Schedule.end_lesson,
+                               Schedule.room, Class.id, Class.name, Subject.name) \
+        .join(Subject, Subject.id == Class.subject_id) \
+        .filter(Schedule.is_canceled == False).all()
+    return [(day, start, end, {'class_id': cid, 'class_name': name, 'subject_name': subject, 'room': room})
+            for day, start, end, room, cid, name, subject in rows]
+
+
+def _cached(key, fingerprint, build):
+    with _lock:
+        cached = _grids.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+    grid = build()
+    with _lock:
+        if len(_grids) >= MAX_CACHED_GRIDS:
+            _grids.clear()
+        _grids[key] = (fingerprint, grid)
+    return grid
+
+
+def student_grid(student_id, semester_id):
+    """Lưới thời khóa biểu của SV trong học kỳ (2 lần đọc theo khóa chính nếu cache còn mới)."""
+    mask = db.session.get(StudentScheduleMask, (student_id, semester_id))
+    fingerprint = (get_version(occupancy.version_key(semester_id)), mask.mask if mask else None)
+
+    def build():
+        query = db.session.query(Schedule).join(Class, Class.id == Schedule.class_id) \
+            .join(Enrollment, Enrollment.class_id == Class.id) \
+            .filter(Enrollment.student_id == student_id, Class.semester_id == semester_id)
+        return build_grid(_sessions(query))
+    return _cached(('student', student_id, semester_id), fingerprint, build)
+
+
+def teacher_grid(teacher_id, semester_ids):
+    """Lưới lịch dạy của GV trong các học kỳ (thường là các học kỳ đang mở)."""
+    semester_ids = tuple(sorted(semester_ids))
+    fingerprint = tuple(get_version(occupancy.version_key(s)) for s in semester_ids)
+
+    def build():
+        if not semester_ids:
+            return build_grid([])
+        query = db.session.query(Schedule).join(Class, Class.id == Schedule.class_id) \
+            .filter(Class.teacher_id == teacher_id, Class.semester_id.in_(semester_ids))
+        return build_grid(_sessions(query))
+    return _cached(('teacher', teacher_id, semester_ids), fingerprint, build)
@@ -0,0 +1,330 @@
+"""
+Tự động xếp thời khóa biểu cho cả học kỳ.
+Số tiết mỗi tuần của lớp được chia thành các buổi (mỗi buổi tối đa 5 tiết liên tiếp
+trong cùng 1 ca: sáng 1-5, chiều 6-10, tối 11-12), các buổi của 1 lớp ở các ngày
+khác nhau. Ràng buộc cứng: không trùng phòng, không trùng giảng viên. Ràng buộc
+mềm: lịch của giảng viên gọn (ít ngày lên trường, các tiết liền nhau).
+Lớp chỉ được xếp khi đặt được đủ mọi buổi, nếu không thì báo lại kèm lý do.
+Thuật toán:
+1. Greedy: xếp buổi khó trước (GV dạy nhiều, nhiều tiết), chọn ô có chi phí thấp nhất.
+2. Backtracking 1 bước: nếu buổi không còn ô trống, thử dời 1 buổi đang chắn sang ô khác.
+3. Local search: dùng thời gian còn lại để dời từng buổi sang ô rẻ hơn.
+Phòng / GV được biểu diễn bằng bitmap 84 bit (xem app/bitmaps.py) nên mỗi
+phép kiểm tra trùng chỉ là 1 phép AND.
+Xếp lịch cả học kỳ chạy nền qua app/jobs.py (loại việc 'solve_timetable').
+"""
+import time
+from sqlalchemy import select, insert
+from . import db
+from .models import Class, Schedule, Semester, Subject
+from .bitmaps import lesson_bits, refresh_class_mask, LESSONS_PER_DAY, FIRST_DAY
+from .jobs import job_type, JobError
+from . import occupancy
+
+SESSION_BLOCKS = [(1, 5), (6, 10), (11, 12)]
+MAX_SESSION_LESSONS = 5
+DEFAULT_DAYS = range(2, 8)  # Thứ 2 -> Thứ 7, không xếp Chủ Nhật
+
+NEW_DAY_COST = 10.0  # GV phải lên trường thêm 1 ngày
+GAP_COST = 3.0  # Buổi mới không liền với tiết nào khác trong ngày
+FIT_BONUS = 0.5  # Mỗi đầu buổi sát tiết đã dùng / sát đầu-cuối buổi (xếp phòng khít, ít lỗ)
+
+
+def slot_shape(day, start, end):
+    """Bit các tiết liền trước/sau trong cùng buổi và số đầu chạm đầu/cuối buổi ("tường")."""
+    block_start, block_end = next(b for b in SESSION_BLOCKS if b[0] <= start <= b[1])
+    neighbors = lesson_bits(day, start - 1, start - 1) if start > block_start else 0
+    neighbors |= lesson_bits(day, end + 1, end + 1) if end < block_end else 0
+    return neighbors, (start == block_start) + (end == block_end)
+
+
+def split_lessons(total):
+    """Chia số tiết / tuần thành các buổi đều nhau, mỗi buổi tối đa MAX_SESSION_LESSONS tiết."""
+    count = -(-total // MAX_SESSION_LESSONS)
+    base, extra = divmod(total, count)
+    return [base + 1] * extra + [base] * (count - extra)
+
+
+class TimetableSolver:
+    def __init__(self, rooms, days=DEFAULT_DAYS, time_budget=30.0):
+        self.rooms = list(rooms)
+        self.days = list(days)
+        self.time_budget = time_budget
+        self.deadline = None
+
+        self.room_masks = {r: 0 for r in self.rooms}
+        self.teacher_masks = {}
+        # Các buổi đã xếp (không tính lịch cố định), khóa buổi = (class_id, thứ tự buổi):
+        # khóa -> (day, start, end, room, bits)
+        self.assigned = {}
+        # Buổi đã xếp theo phòng / GV để tìm nhanh buổi đang chắn: owner -> {khóa: bits}
+        self.room_owners = {r: {} for r in self.rooms}
+        self.teacher_owners = {}
+        self.tasks = {}  # khóa buổi -> (teacher_id, lessons)
+        self.sessions = {}  # class_id -> [khóa buổi]
+        # lessons -> [(day, start, end, bits, neighbor_bits, walls)]
+        self._candidates = {}
+
+    # --- DỮ LIỆU ĐẦU VÀO ---
+    def fix(self, teacher_id, room, day, start, end):
+        """Lịch đã có sẵn trong DB: chiếm chỗ nhưng không được dời."""
+        bits = lesson_bits(day, start, end)
+        self.room_masks[room] = self.room_masks.get(room, 0) | bits
+        self.teacher_masks[teacher_id] = self.teacher_masks.get(teacher_id, 0) | bits
+
+    def candidates(self, lessons):
+        if lessons not in self._candidates:
+            slots = []
+            for day in self.days:
+                for block_start, block_end in SESSION_BLOCKS:
+                    for start in range(block_start, block_end - lessons + 2):
+                        end = start + lessons - 1
+                        neighbors, walls = slot_shape(day, start, end)
+                        slots.append((day, start, end, lesson_bits(day, start, end), neighbors, walls))
+            self._candidates[lessons] = slots
+        return self._candidates[lessons]
+
+    # --- CHI PHÍ MỀM ---
+    def cost(self, teacher_id, day, start, bits):
+        day_bits = (self.teacher_masks.get(teacher_id, 0) >> ((day - FIRST_DAY) * LESSONS_PER_DAY)) \
+            & ((1 << LESSONS_PER_DAY) - 1)
+        c = start * 0.01  # Ưu tiên nhẹ tiết sớm để kết quả ổn định
+        if day_bits == 0:
+            return c + NEW_DAY_COST
+        teacher_bits = self.teacher_masks[teacher_id]
+        if not ((bits << 1) | (bits >> 1)) & teacher_bits:
+            c += GAP_COST
+        return c
+
+    # --- ĐẶT / GỠ 1 LỚP ---
+    def _place(self, key, day, start, end, room, bits):
+        teacher_id = self.tasks[key][0]
+        self.room_masks[room] |= bits
+        self.teacher_masks[teacher_id] = self.teacher_masks.get(teacher_id, 0) | bits
+        self.room_owners[room][key] = bits
+        self.teacher_owners.setdefault(teacher_id, {})[key] = bits
+        self.assigned[key] = (day, start, end, room, bits)
+
+    def _unplace(self, key):
+        day, start, end, room, bits = self.assigned.pop(key)
+        teacher_id = self.tasks[key][0]
+        self.room_masks[room] &= ~bits
+        self.teacher_masks[teacher_id] &= ~bits
+        del self.room_owners[room][key]
+        del self.teacher_owners[teacher_id][key]
+        return day, start, end, room, bits
+
+    def _sibling_days(self, key):
+        """Các ngày đã có buổi khác của cùng lớp (mỗi ngày tối đa 1 buổi / lớp)."""
+        return {self.assigned[k][0] for k in self.sessions[key[0]] if k != key and k in self.assigned}
+
+    def _free_room(self, bits, neighbors, walls):
+        """Phòng trống khít nhất cho buổi học: (room, fit) hoặc (None, 0)."""
+        best_room, best_fit = None, -1
+        for room in self.rooms:
+            mask = self.room_masks[room]
+            if mask & bits:
+                continue
+            fit = walls + bin(mask & neighbors).count('1')
+            if fit > best_fit:
+                best_room, best_fit = room, fit
+                if fit == 2:
+                    break
+        return best_room, best_fit
+
+    def _best_slot(self, key):
+        """Ô hợp lệ có chi phí thấp nhất: (cost, day, start, end, room, bits) hoặc None."""
+        teacher_id, lessons = self.tasks[key]
+        teacher_mask = self.teacher_masks.get(teacher_id, 0)
+        taken_days = self._sibling_days(key)
+        best = None
+        for day, start, end, bits, neighbors, walls in self.candidates(lessons):
+            if teacher_mask & bits or day in taken_days:
+                continue
+            c = self.cost(teacher_id, day, start, bits)
+            if best is not None and c - 2 * FIT_BONUS >= best[0]:
+                continue
+            room, fit = self._free_room(bits, neighbors, walls)
+            if room is not None and (best is None or c - FIT_BONUS * fit < best[0]):
+                best = (c - FIT_BONUS * fit, day, start, end, room, bits)
+        return best
+
+    def _repair(self, key):
+        """
+        Backtracking 1 bước: tìm ô mà chỉ bị chắn bởi đúng 1 buổi đã xếp,
+        dời buổi đó đi chỗ khác rồi đặt buổi hiện tại vào.
+        """
+        teacher_id, lessons = self.tasks[key]
+        taken_days = self._sibling_days(key)
+        for day, start, end, bits, _, _ in self.candidates(lessons):
+            if self._out_of_time():
+                return False
+            if day in taken_days:
+                continue
+            teacher_blockers = [cid for cid, b in self.teacher_owners.get(teacher_id, {}).items() if b & bits]
+            if len(teacher_blockers) > 1:
+                continue
+            for room in self.rooms:
+                blockers = set(teacher_blockers)
+                blockers.update(cid for cid, b in self.room_owners[room].items() if b & bits)
+                if len(blockers) != 1:
+                    continue
+                blocker = blockers.pop()
+                old = self._unplace(blocker)
+                # Kiểm tra lại phần chắn không thuộc lớp nào (lịch cố định)
+                if (self.room_masks[room] | self.teacher_masks.get(teacher_id, 0)) & bits:
+                    self._place(blocker, *old)
+                    continue
+                self._place(key, day, start, end, room, bits)
+                moved = self._best_slot(blocker)
+                if moved is not None:
+                    self._place(blocker, *moved[1:])
+                    return True
+                self._unplace(key)
+                self._place(blocker, *old)
+        return False
+
+    def _out_of_time(self):
+        return time.monotonic() > self.deadline
+
+    # --- GIẢI ---
+    def solve(self, tasks):
+        """
+        tasks: list (class_id, teacher_id, số tiết / tuần).
+        Trả về: (assigned, unplaced). assigned: class_id -> [(day, start, end, room)] (đủ mọi buổi),
+        unplaced: class_id -> lý do không xếp được.
+        """
+        self.deadline = time.monotonic() + self.time_budget
+        unplaced = {}
+        for class_id, teacher_id, lessons in tasks:
+            if lessons < 1:
+                unplaced[class_id] = 'Số tiết không hợp lệ'
+                continue
+            sizes = split_lessons(lessons)
+            if len(sizes) > len(self.days):
+                unplaced[class_id] = f'Cần {len(sizes)} buổi / tuần, nhiều hơn số ngày được xếp'
+                continue
+            self.sessions[class_id] = [(class_id, i) for i in range(len(sizes))]
+            for key, size in zip(self.sessions[class_id], sizes):
+                self.tasks[key] = (teacher_id, size)
+
+        load = {}
+        for teacher_id, lessons in self.tasks.values():
+            load[teacher_id] = load.get(teacher_id, 0) + lessons
+        order = sorted(self.tasks, key=lambda k: (-load[self.tasks[k][0]], -self.tasks[k][1], k))
+
+        # 1 + 2. Greedy, kẹt thì backtracking
+        failed = set()
+        for key in order:
+            if key[0] in failed:
+                continue
+            best = self._best_slot(key)
+            if best is not None:
+                self._place(key, *best[1:])
+            elif self._out_of_time() or not self._repair(key):
+                failed.add(key[0])
+        # Lớp thiếu buổi: gỡ các buổi đã đặt để nhường chỗ, báo lại
+        for class_id in failed:
+            for key in self.sessions[class_id]:
+                if key in self.assigned:
+                    self._unplace(key)
+            unplaced[class_id] = 'Không còn phòng / giờ trống cho đủ các buổi'
+
+        # 3. Local search cải thiện chi phí mềm
+        improved = True
+        while improved and not self._out_of_time():
+            improved = False
+            for key in list(self.assigned):
+                if self._out_of_time():
+                    break
+                teacher_id = self.tasks[key][0]
+                old = self._unplace(key)
+                neighbors, walls = slot_shape(old[0], old[1], old[2])
+                old_fit = walls + bin(self.room_masks[old[3]] & neighbors).count('1')
+                old_cost = self.cost(teacher_id, old[0], old[1], old[4]) - FIT_BONUS * old_fit
+                best = self._best_slot(key)
+                if best is not None and best[0] < old_cost - 1e-9:
+                    self._place(key, *best[1:])
+                    improved = True
+                else:
+                    self._place(key, *old)
+
+        result = {}
+        for (class_id, _), a in sorted(self.assigned.items()):
+            result.setdefault(class_id, []).append(a[:4])
+        return result, unplaced
+
+
+# --- XẾP LỊCH 1 HỌC KỲ (CHẠY NỀN) ---
+def solve_semester(semester_id, rooms, lessons=None, time_budget=30.0, apply=False):
+    """
+    Xếp lịch các lớp chưa có lịch của học kỳ, lịch đã có giữ nguyên.
+    lessons: {class_id (chuỗi): số tiết / tuần}, mặc định = số tín chỉ của môn.
+    apply=True thì lưu phương án (lớp trùng với lịch vừa được thêm trong lúc giải bị bỏ ra).
+    Trả về {'assignments': [...], 'unplaced': [...], 'total': số lớp cần xếp}.
+    """
+    lessons = lessons or {}
+    solver = TimetableSolver(rooms, time_budget=time_budget)
+    existing = db.session.query(Schedule.day_of_week, Schedule.start_lesson, Schedule.end_lesson,
+                                Schedule.room, Class.teacher_id) \
+        .join(Class, Class.id == Schedule.class_id) \
+        .filter(Class.semester_id == semester_id, Schedule.is_canceled == False).all()
+    for day, start, end, room, teacher_id in existing:
+        solver.fix(teacher_id, room, day, start, end)
+
+    scheduled_ids = select(Schedule.class_id).where(Schedule.is_canceled == False)
+    pending = db.session.query(Class.id, Class.name, Class.teacher_id, Subject.credits) \
+        .join(Subject, Subject.id == Class.subject_id) \
+        .filter(Class.semester_id == semester_id, Class.id.notin_(scheduled_ids)).all()
+    names = {cid: name for cid, name, _, _ in pending}
+    teachers = {cid: teacher_id for cid, _, teacher_id, _ in pending}
+
+    tasks = []
+    for cid, _, teacher_id, credits in pending:
+        try:
+            count = int(lessons.get(str(cid), credits))
+        except (ValueError, TypeError):
+            count = credits
+        tasks.append((cid, teacher_id, count))
+    assigned, unplaced = solver.solve(tasks)
+
+    if apply and assigned:
+        # Lịch có thể đã được thêm tay trong lúc giải: kiểm tra lại với chỉ mục chiếm dụng
+        index = occupancy.get_index(semester_id)
+        for cid in list(assigned):
+            if any(index.find_conflict(teachers[cid], lesson_bits(day, start, end), room)
+                   for day, start, end, room in assigned[cid]):
+                del assigned[cid]
+                unplaced[cid] = 'Trùng với lịch vừa được thêm trong lúc xếp'
+        if assigned:
+            db.session.execute(insert(Schedule), [
+                {'class_id': cid, 'day_of_week': day, 'start_lesson': start, 'end_lesson': end, 'room': room}
+                for cid, sessions in assigned.items() for day, start, end, room in sessions
+            ])
+            for cid in assigned:
+                refresh_class_mask(cid)
+            occupancy.mark_changed(semester_id)
+            db.session.commit()
+
+    return {
+        'total': len(tasks),
+        'applied': bool(apply),
+        'assignments': [
+            {'class_id': cid, 'class_name': names[cid], 'day': day, 'start': start, 'end': end, 'room': room}
+            for cid in sorted(assigned) for day, start, end, room in assigned[cid]
+        ],
+        'unplaced': [{'class_id': cid, 'class_name': names[cid], 'reason': reason}
+                     for cid, reason in sorted(unplaced.items())],
+    }
+
+
+@job_type('solve_timetable', concurrency=1, max_attempts=1)
+def solve_timetable_job(ctx, semester_id, rooms, lessons=None, time_budget=30.0, apply=False):
+    semester = db.session.get(Semester, semester_id)
+    if semester is None or not semester.is_active:
+        raise JobError('Học kỳ không tồn tại hoặc đã kết thúc')
+    ctx.progress(10, 'Đang xếp lịch...')
+    result = solve_semester(semester_id, rooms, lessons, time_budget, apply)
+    ctx.set_result(result)
+    placed = result['total'] - len(result['unplaced'])
+    return f"Đã xếp {placed}/{result['total']} lớp" + (' và lưu lịch.' if apply else ' (chưa lưu).')
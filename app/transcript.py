@@ -0,0 +1,60 @@
+"""
+Bảng điểm tích lũy đã tính sẵn (student_term_gpa).
+Mỗi khi giảng viên lưu điểm làm đổi total_4 của SV, các dòng GPA của SV đó được
+tính lại bằng 1 query GROUP BY (mọi học kỳ của nhóm SV bị ảnh hưởng) rồi ghi đè.
+Trang xem điểm chỉ cần đọc vài dòng này thay vì cộng dồn toàn bộ lịch sử.
+"""
+from sqlalchemy import insert, func, case
+from . import db
+from .models import Class, Enrollment, Semester, Subject, StudentTermGpa
+
+
+def _gpa(points, credits):
+    return round(points / credits, 2) if credits > 0 else 0.0
+
+
+def refresh_student_gpa(student_ids):
+    """Tính lại GPA học kỳ + tích lũy cho các SV. Chưa commit."""
+    student_ids = list(set(student_ids))
+    if not student_ids:
+        return
+
+    # Mọi học kỳ SV có đăng ký (kể cả kỳ chưa có điểm) + điểm/tín chỉ các môn đã có total_4
+    has_grade = Enrollment.total_4.isnot(None)
+    rows = db.session.query(
+        Enrollment.student_id, Class.semester_id, Semester.start_date,
+        func.sum(func.coalesce(Enrollment.total_4, 0) * Subject.credits),
+        func.sum(case((has_grade, Subject.credits), else_=0))
+    ).join(Class, Class.id == Enrollment.class_id) \
+        .join(Semester, Semester.id == Class.semester_id) \
+        .join(Subject, Subject.id == Class.subject_id) \
+        .filter(Enrollment.student_id.in_(student_ids)) \
+        .group_by(Enrollment.student_id, Class.semester_id, Semester.start_date) \
+        .order_by(Enrollment.student_id, Semester.start_date).all()
+
+    new_rows = []
+    cum = {}  # student_id -> (điểm, tín chỉ) cộng dồn theo thứ tự thời gian
+    for sid, sem_id, _, points, credits in rows:
+        points, credits = float(points or 0), int(credits or 0)
+        cum_points, cum_credits = cum.get(sid, (0.0, 0))
+        cum_points, cum_credits = cum_points + points, cum_credits + credits
+        cum[sid] = (cum_points, cum_credits)
+        new_rows.append({
+            'student_id': sid, 'semester_id': sem_id,
+            'term_points': points, 'term_credits': credits, 'term_gpa': _gpa(points, credits),
+            'cumulative_points': cum_points, 'cumulative_credits': cum_credits,
+            'cumulative_gpa': _gpa(cum_points, cum_credits)
+        })
+
+    StudentTermGpa.query.filter(StudentTermGpa.student_id.in_(student_ids)) \
+        .delete(synchronize_session=False)
+    if new_rows:
+        db.session.execute(insert(StudentTermGpa.__table__), new_rows)
+
+
+def rebuild_all_gpa(batch_size=500):
+    """Tính lại toàn bộ bảng student_term_gpa (backfill), theo lô SV."""
+    student_ids = [sid for (sid,) in db.session.query(Enrollment.student_id).distinct().all()]
+    for i in range(0, len(student_ids), batch_size):
+        refresh_student_gpa(student_ids[i:i + batch_size])
+        db.session.commit()
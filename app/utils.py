@@ -3,7 +3,7 @@ from flask import abort
 from flask_login import current_user
 import string
 import secrets
-from datetime import timedelta
+import unicodedata
 
 
 # ---------------------------------------------------------
@@ -54,6 +54,28 @@ def generate_random_password(length=10):
     return password
 
 
+def generate_email_prefix(full_name):
+    """
+    Chuyển "Nguyễn Văn An" -> "annv"
+    """
+    # 1. Chuyển tiếng Việt có dấu thành không dấu
+    text = unicodedata.normalize('NFD', full_name)
+    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+    text = text.replace('đ', 'd').replace('Đ', 'D')
+
+    # 2. Tách từ và xử lý
+    parts = text.lower().split()
+    if not parts: return "student"
+
+    # Tên (từ cuối cùng)
+    first_name = parts[-1]
+
+    # Họ lót (các từ đầu) -> lấy chữ cái đầu
+    initials = "".join([p[0] for p in parts[:-1]])
+
+    return f"{first_name}{initials}"
+
+
 def calculate_gpa_vku(score_10):
     """
     Quy đổi điểm thang 10 sang thang 4 theo quy chế VKU
@@ -91,75 +113,34 @@ def get_letter_grade(score_4):
 
 def get_valid_class_dates(schedule, semester):
     """
-    Trả về danh sách các ngày cụ thể (dd/mm/yyyy) mà lớp này có lịch học
-    trong khoảng thời gian của học kỳ.
+    Trả về danh sách các ngày cụ thể mà lớp này có lịch học
+    trong khoảng thời gian của học kỳ (chưa trừ ngày nghỉ, xem app/class_calendar.py).
     schedule.day_of_week: 2 (Thứ 2) -> 8 (CN)
     """
-    valid_dates = []
-
-    # Python weekday(): 0=Thứ 2, 1=Thứ 3, ..., 6=CN
-    # DB của mình: 2=Thứ 2, ..., 8=CN. => Cần trừ đi 2 để khớp với Python
-    target_weekday = schedule.day_of_week - 2
-
-    current_date = semester.start_date
-    while current_date <= semester.end_date:
-        if current_date.weekday() == target_weekday:
-            valid_dates.append(current_date)
-        current_date += timedelta(days=1)
-
-    return valid_dates
+    from .class_calendar import occurrence_dates
+    return list(occurrence_dates(schedule.day_of_week, semester.start_date, semester.end_date))
 
 
 # ---------------------------------------------------------
 # 3. HÀM KIỂM TRA TRÙNG LỊCH (QUAN TRỌNG)
 # ---------------------------------------------------------
 
-def check_schedule_conflict(class_id, day, start, end, room, semester_id):
+def check_schedule_conflict(class_id, day, start, end, room, semester_id, teacher_id=None):
     """
-    Kiểm tra trùng lịch học.
-    Trả về: True nếu bị trùng, False nếu hợp lệ.
+    Kiểm tra trùng lịch học (trả lời từ chỉ mục trong RAM, xem app/occupancy.py).
+    Trả về: None nếu hợp lệ, hoặc dict {'type': 'room'|'teacher', 'class_id', 'class_name'}
+    mô tả lớp gây trùng.
     Logic:
     1. Trùng PHÒNG (Room Conflict)
     2. Trùng GIẢNG VIÊN (Teacher Conflict)
     """
-    from .models import Schedule, Class  # Import trong hàm để tránh circular import
-
-    # --- BƯỚC 1: KIỂM TRA TRÙNG PHÒNG ---
-    # Tìm lịch khác có: Cùng học kỳ, Cùng thứ, Cùng phòng, và thời gian GIAO NHAU
-    conflict_room = Schedule.query.join(Class).filter(
-        Class.semester_id == semester_id,
-        Schedule.day_of_week == day,
-        Schedule.room == room,
-        Schedule.is_canceled == False,
-
-        # Công thức giao nhau: (StartA <= EndB) và (EndA >= StartB)
-        Schedule.start_lesson <= end,
-        Schedule.end_lesson >= start
-    ).first()
-
-    if conflict_room:
-        return True  # Đã trùng phòng
-
-    # --- BƯỚC 2: KIỂM TRA TRÙNG GIẢNG VIÊN ---
-    # Lấy thông tin lớp để biết GV là ai
-    current_class = Class.query.get(class_id)
-    if current_class:
-        teacher_id = current_class.teacher_id
-
-        # Tìm xem GV này có dạy lớp nào khác vào giờ này không
-        conflict_teacher = Schedule.query.join(Class).filter(
-            Class.semester_id == semester_id,
-            Class.teacher_id == teacher_id,  # Cùng GV
-            Schedule.day_of_week == day,  # Cùng thứ
-            Schedule.is_canceled == False,
-            # Schedule.class_id != class_id,    # (Tùy chọn) Bỏ qua chính lớp này nếu đang sửa
-
-            # Kiểm tra giao nhau
-            Schedule.start_lesson <= end,
-            Schedule.end_lesson >= start
-        ).first()
-
-        if conflict_teacher:
-            return True  # Đã trùng lịch giảng viên
-
-    return False
\ No newline at end of file
+    from .models import Class  # Import trong hàm để tránh circular import
+    from .occupancy import get_index
+    from .bitmaps import lesson_bits
+
+    # Lấy GV của lớp nếu route chưa truyền vào
+    if teacher_id is None:
+        current_class = Class.query.get(class_id)
+        teacher_id = current_class.teacher_id if current_class else None
+
+    return get_index(semester_id).find_conflict(teacher_id, lesson_bits(day, start, end), room)
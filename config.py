@@ -4,4 +4,28 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'vku-super-secret-key-2024'
     # Thay đổi user, password, db_name tương ứng với MySQL của bạn
     SQLALCHEMY_DATABASE_URI = 'mysql+mysqlconnector://root:@localhost/vku_grade_db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Chu kỳ (giây) ghi bộ đệm last_seen xuống DB
+    LAST_SEEN_FLUSH_INTERVAL = int(os.environ.get('LAST_SEEN_FLUSH_INTERVAL', 30))
+    # Cửa sổ (phút) tính là đang online
+    PRESENCE_WINDOW_MINUTES = 5
+    # Chu kỳ (giây) ghi trạng thái online từ RAM xuống file presence
+    PRESENCE_FLUSH_INTERVAL = 5
+    # Thời gian (giây) giữ danh tính user trong cache của mỗi worker
+    IDENTITY_CACHE_TTL = 300
+    # Tham số băm mật khẩu theo định dạng werkzeug (đổi thì hash cũ được băm lại khi đăng nhập)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    # Số process băm (mặc định = số CPU) và số việc tối đa được chờ trước khi từ chối
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 0)) or None
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32))
+    # Giá trị header Retry-After (giây) khi từ chối vì quá tải
+    PASSWORD_HASH_RETRY_AFTER = 5
+    # Chu kỳ (giây) ghi bộ đếm dashboard xuống DB và chu kỳ đối soát với COUNT(*) thật
+    STAT_COUNTERS_FLUSH_INTERVAL = int(os.environ.get('STAT_COUNTERS_FLUSH_INTERVAL', 10))
+    STAT_COUNTERS_RECONCILE_INTERVAL = int(os.environ.get('STAT_COUNTERS_RECONCILE_INTERVAL', 3600))
+    # Hàng đợi việc nền: chạy trong process web (False nếu dùng `flask jobs-worker` riêng),
+    # số thread, chu kỳ (giây) nhận việc và thời gian mất nhịp sống thì coi process đã chết
+    JOB_RUNNER_IN_WEB = os.environ.get('JOB_RUNNER_IN_WEB', '1') == '1'
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_POLL_INTERVAL = int(os.environ.get('JOB_POLL_INTERVAL', 2))
+    JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 300))
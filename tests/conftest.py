@@ -0,0 +1,63 @@
+"""
+Cấu hình chung cho test.
+App dùng SQLite file tạm (đặt TEST_DATABASE_URI để chạy trên MySQL thật), mỗi test
+chạy trên schema trống và các cache trong RAM đã được xóa.
+"""
+import os
+import tempfile
+import pytest
+from config import Config
+
+_tmp = tempfile.mkdtemp(prefix='vku-test-')
+
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URI') or \
+        'sqlite:///' + os.path.join(_tmp, 'test.db')
+    SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30}} \
+        if not os.environ.get('TEST_DATABASE_URI') else {}
+    PRESENCE_DB_PATH = os.path.join(_tmp, 'presence.sqlite3')
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    PASSWORD_HASH_WORKERS = 1
+    # Không để thread nền tự chạy giữa chừng test
+    LAST_SEEN_FLUSH_INTERVAL = 3600
+    PRESENCE_FLUSH_INTERVAL = 3600
+    STAT_COUNTERS_FLUSH_INTERVAL = 3600
+    STAT_COUNTERS_RECONCILE_INTERVAL = 3600 * 24
+    JOB_RUNNER_IN_WEB = False
+
+
+def _reset_memory_caches():
+    from app import occupancy, timetable, grade_analytics, pagination, counters
+    from app import stat_counters, identity_cache
+    for module, name in ((occupancy, '_indexes'), (timetable, '_grids'),
+                         (grade_analytics, '_semesters'), (pagination, '_counts'),
+                         (counters, '_class_semesters')):
+        getattr(module, name).clear()
+    with stat_counters._lock:
+        stat_counters._pending = {}
+        stat_counters._fence = 0
+    identity_cache.clear()
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    return create_app(TestConfig)
+
+
+@pytest.fixture
+def db(app):
+    from app import db as _db
+    with app.app_context():
+        _db.drop_all()
+        _db.create_all()
+        _reset_memory_caches()
+        yield _db
+        _db.session.remove()
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
@@ -0,0 +1,80 @@
+"""Tạo nhanh dữ liệu mẫu cho test (đã flush, chưa commit)."""
+import itertools
+from datetime import date
+from app import db
+from app.models import User, Student, Teacher, Semester, Subject, Class, Schedule, Enrollment
+
+_seq = itertools.count(1)
+
+
+def semester(name='HK1', is_active=True):
+    sem = Semester(name=name, start_date=date(2026, 1, 5), end_date=date(2026, 5, 31), is_active=is_active)
+    db.session.add(sem)
+    db.session.flush()
+    return sem
+
+
+def subject(code=None, name='Lập trình Python', credits=3):
+    sub = Subject(code=code or f'SUB{next(_seq)}', name=name, credits=credits)
+    db.session.add(sub)
+    db.session.flush()
+    return sub
+
+
+def teacher(full_name='Nguyễn Văn Giảng', code=None):
+    n = next(_seq)
+    user = User(email=f'gv{n}@vku.udn.vn', full_name=full_name, role='teacher', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    profile = Teacher(user_id=user.id, teacher_code=code or f'GV{n:03d}')
+    db.session.add(profile)
+    db.session.flush()
+    return profile
+
+
+def student(full_name='Trần Thị Học', code=None):
+    n = next(_seq)
+    user = User(email=f'sv{n}@vku.udn.vn', full_name=full_name, role='student', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    profile = Student(user_id=user.id, student_code=code or f'SV{n:05d}')
+    db.session.add(profile)
+    db.session.flush()
+    return profile
+
+
+def klass(sem=None, sub=None, gv=None, name=None, max_students=60):
+    cls = Class(name=name or f'Lớp {next(_seq)}', semester_id=(sem or semester()).id,
+                subject_id=(sub or subject()).id, teacher_id=(gv or teacher()).id,
+                max_students=max_students)
+    db.session.add(cls)
+    db.session.flush()
+    return cls
+
+
+def schedule(cls, day, start, end, room='A101'):
+    sch = Schedule(class_id=cls.id, day_of_week=day, start_lesson=start, end_lesson=end, room=room)
+    db.session.add(sch)
+    db.session.flush()
+    return sch
+
+
+def enroll(sv, cls):
+    enrollment = Enrollment(student_id=sv.id, class_id=cls.id)
+    db.session.add(enrollment)
+    db.session.flush()
+    return enrollment
+
+
+def admin():
+    user = User(email=f'admin{next(_seq)}@vku.udn.vn', full_name='Quản trị', role='admin', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def login(client, user_id):
+    """Đăng nhập cho test client (ghi thẳng vào session của Flask-Login)."""
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
@@ -0,0 +1,114 @@
+import threading
+import pytest
+from app import db
+from app import occupancy
+from app.bitmaps import lesson_bits, check_lesson_range, get_student_mask, from_hex, refresh_class_mask
+from app.models import Schedule, StudentScheduleMask
+from app.utils import check_schedule_conflict
+from tests import factories
+
+
+def test_lesson_bits_layout():
+    assert lesson_bits(2, 1, 1) == 1
+    assert lesson_bits(2, 1, 3) == 0b111
+    assert lesson_bits(3, 1, 1) == 1 << 12
+    assert lesson_bits(8, 12, 12) == 1 << 83
+    assert lesson_bits(2, 4, 6) & lesson_bits(2, 6, 8)
+    assert not lesson_bits(2, 1, 5) & lesson_bits(2, 6, 10)
+
+
+@pytest.mark.parametrize('day, start, end', [(1, 1, 2), (9, 1, 2), (2, 0, 2), (2, 11, 13), (2, 5, 4)])
+def test_out_of_range_sessions_are_rejected(day, start, end):
+    with pytest.raises(ValueError):
+        check_lesson_range(day, start, end)
+    with pytest.raises(ValueError):
+        lesson_bits(day, start, end)
+
+
+def test_occupancy_finds_room_and_teacher_conflicts(db):
+    sem = factories.semester()
+    gv = factories.teacher()
+    a = factories.klass(sem=sem, gv=gv, name='A')
+    other = factories.klass(sem=sem, name='B')
+    factories.schedule(a, 2, 1, 3, room='A101')
+    db.session.commit()
+
+    conflict = check_schedule_conflict(other.id, 2, 3, 4, 'A101', sem.id, other.teacher_id)
+    assert conflict == {'type': 'room', 'class_id': a.id, 'class_name': 'A'}
+    conflict = check_schedule_conflict(other.id, 2, 2, 2, 'B202', sem.id, gv.id)
+    assert conflict['type'] == 'teacher'
+    assert check_schedule_conflict(other.id, 2, 4, 5, 'A101', sem.id, gv.id) is None
+
+
+def test_occupancy_rebuilds_after_version_bump(db):
+    sem = factories.semester()
+    cls = factories.klass(sem=sem)
+    db.session.commit()
+    assert occupancy.get_index(sem.id).find_conflict(None, lesson_bits(4, 1, 2), 'C1') is None
+
+    # Worker khác thêm lịch: chỉ tăng version trong DB, chỉ mục của worker này phải dựng lại
+    factories.schedule(cls, 4, 1, 2, room='C1')
+    occupancy.mark_changed(sem.id)
+    db.session.commit()
+    assert occupancy.get_index(sem.id).find_conflict(None, lesson_bits(4, 2, 2), 'C1')['class_id'] == cls.id
+
+
+def test_student_mask_follows_class_schedule(db):
+    sem = factories.semester()
+    cls = factories.klass(sem=sem)
+    sv = factories.student()
+    factories.enroll(sv, cls)
+    factories.schedule(cls, 5, 6, 8)
+    refresh_class_mask(cls.id)
+    db.session.commit()
+    row = db.session.get(StudentScheduleMask, (sv.id, sem.id))
+    assert from_hex(row.mask) == lesson_bits(5, 6, 8)
+
+
+def test_first_registrations_create_one_mask_row(app, db):
+    sem = factories.semester()
+    sv = factories.student()
+    db.session.commit()
+    ids = (sv.id, sem.id)
+
+    start = threading.Barrier(8)
+    errors = []
+
+    def first_registration():
+        with app.app_context():
+            try:
+                start.wait()
+                get_student_mask(*ids, for_update=True)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=first_registration) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert StudentScheduleMask.query.count() == 1
+
+
+def test_add_schedule_rejects_out_of_range_lessons(client, db):
+    user = factories.admin()
+    cls = factories.klass()
+    db.session.commit()
+    factories.login(client, user.id)
+
+    res = client.post('/admin/api/schedule/add', json={
+        'class_id': cls.id, 'day': 9, 'start': 1, 'count': 2, 'room': 'A101'})
+    assert res.get_json()['success'] is False
+    res = client.post('/admin/api/schedule/add', json={
+        'class_id': cls.id, 'day': 2, 'start': 11, 'count': 3, 'room': 'A101'})
+    assert res.get_json()['success'] is False
+    assert Schedule.query.count() == 0
+
+    res = client.post('/admin/api/schedule/add', json={
+        'class_id': cls.id, 'day': 2, 'start': 10, 'count': 3, 'room': 'A101'})
+    assert res.get_json()['success'] is True
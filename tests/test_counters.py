@@ -0,0 +1,75 @@
+import time
+from sqlalchemy import insert
+from app.counters import StatCounters, stat_counters, semester_key
+from app.models import Student, StatCounter, User
+from tests import factories
+
+
+def _stored(key):
+    from app import db
+    db.session.expire_all()
+    return db.session.get(StatCounter, key).value
+
+
+def test_orm_events_reach_dashboard_counts(db):
+    sem = factories.semester()
+    stat_counters.reconcile()
+    cls = factories.klass(sem=sem)
+    factories.enroll(factories.student(), cls)
+    db.session.commit()
+
+    counts = stat_counters.read([sem.id])  # gồm cả phần chưa flush của worker này
+    assert counts['students'] == 1 and counts[semester_key(sem.id, 'enrollments')] == 1
+    assert counts[semester_key(sem.id, 'unscheduled_classes')] == 1
+    stat_counters.flush()
+    assert _stored(semester_key(sem.id, 'ungraded')) == 1
+
+    db.session.rollback()
+    factories.student()
+    db.session.rollback()  # rollback không để lại mức thay đổi
+    assert stat_counters.read([sem.id])['students'] == 1
+
+
+def test_update_of_expired_attribute_uses_committed_value(db):
+    sem = factories.semester()
+    enrollment = factories.enroll(factories.student(), factories.klass(sem=sem))
+    enrollment.total_10 = 8.0
+    db.session.commit()
+    stat_counters.reconcile()
+    key = semester_key(sem.id, 'ungraded')
+    assert _stored(key) == 0
+
+    db.session.expire(enrollment)  # gán thẳng mà không nạp giá trị cũ
+    enrollment.total_10 = None
+    db.session.commit()
+    stat_counters.flush()
+    assert _stored(key) == 1
+
+    enrollment.total_10 = None  # không đổi
+    db.session.commit()
+    assert stat_counters.flush() == 0
+
+
+def test_reconcile_fences_deltas_of_other_workers(app, db):
+    other = StatCounters()  # worker khác, giữ mức thay đổi chưa flush
+    other.app = app
+    stat_counters.reconcile()
+    assert _stored('students') == 0
+
+    def add_student(n):
+        # Ghi bằng Core để chỉ "worker khác" giữ mức thay đổi
+        db.session.execute(insert(User.__table__), [{'email': f'x{n}@vku.udn.vn', 'password_hash': 'x',
+                                                     'full_name': 'X', 'role': 'student'}])
+        uid = db.session.query(User.id).filter_by(email=f'x{n}@vku.udn.vn').scalar()
+        db.session.execute(insert(Student.__table__), [{'user_id': uid, 'student_code': f'X{n}'}])
+        db.session.commit()
+        other.merge({'students': 1, 'users': 1})
+
+    add_student(1)
+    time.sleep(0.01)
+    stat_counters.reconcile()  # COUNT đã gồm SV 1
+    assert _stored('students') == 1
+    time.sleep(0.01)
+    add_student(2)
+    other.flush()  # bỏ mức của SV 1 (trước mốc), cộng mức của SV 2
+    assert _stored('students') == 2 and _stored('users') == 2
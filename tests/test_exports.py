@@ -0,0 +1,89 @@
+import csv
+import io
+from openpyxl import load_workbook
+import pytest
+from flask import g
+from app.exports import sheet_title
+from app.models import GradeScore, GradeWeight, StudentTermGpa
+from tests import factories
+
+
+@pytest.fixture
+def graded(db):
+    sem = factories.semester(name='HK1 2023/2024')
+    sub = factories.subject(code='PY101')
+    weights = [GradeWeight(subject_id=sub.id, name='Giữa kỳ', weight_percent=40, order_index=1),
+               GradeWeight(subject_id=sub.id, name='Cuối kỳ', weight_percent=60, order_index=2)]
+    db.session.add_all(weights)
+    cls = factories.klass(sem=sem, sub=sub, name='PY-01/A')
+    sv = factories.student(full_name='Lê Văn An', code='SV/001')
+    enrollment = factories.enroll(sv, cls)
+    enrollment.total_10, enrollment.total_4, enrollment.letter_grade, enrollment.is_passed = 8.0, 3.5, 'B+', True
+    db.session.flush()
+    db.session.add_all([GradeScore(enrollment_id=enrollment.id, grade_weight_id=weights[0].id, value=7.0),
+                        GradeScore(enrollment_id=enrollment.id, grade_weight_id=weights[1].id, value=8.5),
+                        StudentTermGpa(student_id=sv.id, semester_id=sem.id, term_credits=3, term_gpa=3.5,
+                                       cumulative_credits=3, cumulative_gpa=3.5)])
+    admin = factories.admin()
+    db.session.commit()
+    return sem, cls, sv, admin
+
+
+def _csv_rows(res):
+    return list(csv.reader(io.StringIO(res.get_data(as_text=True).lstrip('﻿'))))
+
+
+def _xlsx(res):
+    workbook = load_workbook(io.BytesIO(res.get_data()), read_only=True)
+    sheet = workbook.worksheets[0]
+    return sheet.title, [list(row) for row in sheet.iter_rows(values_only=True)]
+
+
+def _switch_user(client, user_id):
+    # Flask-Login giữ user trong g của app context dùng chung với test: xóa đi rồi đăng nhập lại
+    g.pop('_login_user', None)
+    factories.login(client, user_id)
+
+
+def test_sheet_title_replaces_invalid_characters():
+    assert sheet_title('HK1 2023/2024') == 'HK1 2023-2024'
+    assert sheet_title('a\\b*c?d:e[f]') == 'a-b-c-d-e-f-'
+    assert sheet_title('x' * 40) == 'x' * 31
+    assert sheet_title('') == 'Sheet1' and sheet_title("''") == 'Sheet1'
+
+
+def test_csv_exports(client, graded):
+    sem, cls, sv, admin = graded
+    factories.login(client, admin.id)
+    semester = client.get(f'/admin/semester/{sem.id}/export?format=csv')
+    assert semester.status_code == 200 and semester.headers['X-Total-Rows'] == '1'
+    rows = _csv_rows(semester)
+    assert rows[0][:5] == ['Lớp học phần', 'Mã môn', 'Tên môn', 'Tín chỉ', 'MSSV']
+    assert rows[1][0] == 'PY-01/A' and rows[1][4] == 'SV/001' and rows[1][-2:] == ['B+', 'Đạt']
+
+    transcript = _csv_rows(client.get(f'/admin/student/{sv.id}/transcript/export'))
+    assert transcript[1][0] == 'HK1 2023/2024' and transcript[1][-1] == 'Đạt'
+    assert transcript[-1] == ['HK1 2023/2024', '3', '3.5', '3', '3.5']
+
+    _switch_user(client, cls.teacher.user_id)
+    sheet = _csv_rows(client.get(f'/teacher/class/{cls.id}/grades/export?format=csv'))
+    assert sheet[0][3:5] == ['Giữa kỳ (40%)', 'Cuối kỳ (60%)']
+    assert sheet[1][:5] == ['1', 'SV/001', 'Lê Văn An', '7.0', '8.5']
+
+
+def test_xlsx_exports_with_slash_in_names(client, graded):
+    sem, cls, sv, admin = graded
+    factories.login(client, admin.id)
+    res = client.get(f'/admin/semester/{sem.id}/export?format=xlsx')
+    assert res.status_code == 200 and res.headers['Content-Disposition'].endswith('.xlsx"')
+    title, rows = _xlsx(res)
+    assert title == 'HK1 2023-2024'
+    assert rows[1][0] == 'PY-01/A' and rows[1][4] == 'SV/001'
+
+    title, rows = _xlsx(client.get(f'/admin/student/{sv.id}/transcript/export?format=xlsx'))
+    assert title == 'SV-001' and rows[1][0] == 'HK1 2023/2024'
+
+    _switch_user(client, cls.teacher.user_id)
+    title, rows = _xlsx(client.get(f'/teacher/class/{cls.id}/grades/export?format=xlsx'))
+    assert title == 'PY-01-A'
+    assert rows[1][:5] == [1, 'SV/001', 'Lê Văn An', 7.0, 8.5] and rows[1][-2:] == ['B+', 'Đạt']
@@ -0,0 +1,65 @@
+from app.grade_analytics import class_stats, semester_stats, summarize
+from app.grading import save_class_grades
+from app.models import CacheVersion, ClassGradeStats, GradeWeight
+from tests import factories
+
+
+def _class_with_scores(db, sem, sub, weight, values, name=None):
+    cls = factories.klass(sem=sem, sub=sub, name=name)
+    form = {}
+    for value in values:
+        enrollment = factories.enroll(factories.student(), cls)
+        form[f'score_{enrollment.id}_{weight.id}'] = str(value)
+    db.session.commit()
+    return cls, form
+
+
+def test_summarize_histogram():
+    stats = summarize({300: 1, 500: 2, 900: 1}, 4, 3)
+    assert (stats['mean'], stats['median'], stats['pass_rate']) == (5.5, 5.0, 0.75)
+    assert stats['buckets'] == [1, 2, 0, 0, 1]
+
+
+def test_reads_do_not_write_and_saves_bump_only_their_class(db):
+    sem, sub = factories.semester(), factories.subject()
+    weight = GradeWeight(subject_id=sub.id, name='Cuối kỳ', weight_percent=100, order_index=1)
+    db.session.add(weight)
+    cls_a, form_a = _class_with_scores(db, sem, sub, weight, [8, 3], name='A')
+    cls_b, form_b = _class_with_scores(db, sem, sub, weight, [6], name='B')
+
+    # Chưa lưu điểm lần nào: tính tạm, không ghi dòng thống kê
+    assert class_stats(cls_a.id)['graded'] == 0
+    assert semester_stats(sem.id)['summary']['graded'] == 0
+    assert ClassGradeStats.query.count() == 0 and CacheVersion.query.count() == 0
+
+    save_class_grades(cls_a.id, [weight], form_a)
+    db.session.commit()
+    assert {v.key for v in CacheVersion.query} == {f'grade_stats:{sem.id}:{cls_a.id}'}
+    stats = semester_stats(sem.id)
+    assert stats['summary']['graded'] == 2 and [c['class_name'] for c in stats['classes']] == ['A', 'B']
+
+    save_class_grades(cls_b.id, [weight], form_b)
+    db.session.commit()
+    stats = semester_stats(sem.id)
+    assert stats['summary']['graded'] == 3 and stats['subjects'][0]['passed'] == 2
+    assert class_stats(cls_b.id)['mean'] == 6.0
+
+    # Lớp mới trong học kỳ -> cache theo học kỳ được làm mới
+    factories.klass(sem=sem, sub=sub, name='C')
+    db.session.commit()
+    assert [c['class_name'] for c in semester_stats(sem.id)['classes']] == ['A', 'B', 'C']
+
+
+def test_teacher_grades_page_reads_without_writing(client, db):
+    from app.seats import reserve_seat
+    cls = factories.klass()
+    for _ in range(3):
+        reserve_seat(cls.id)
+        factories.enroll(factories.student(), cls)
+    db.session.commit()
+    factories.login(client, cls.teacher.user_id)
+
+    page = client.get(f'/teacher/class/{cls.id}/grades').get_data(as_text=True)
+    assert 'Tổng số SV: <strong>3</strong>' in page
+    assert client.get(f'/teacher/class/{cls.id}/grades/stats').get_json()['graded'] == 0
+    assert ClassGradeStats.query.count() == 0
@@ -0,0 +1,88 @@
+"""So khớp grade_engine (NumPy) với bản scalar trong app/utils.py và benchmark thông lượng."""
+import math
+import random
+import time
+import numpy as np
+import pytest
+from app.grade_engine import LETTER_BINS, compute_totals, gpa_4, letter_grades, round2
+from app.utils import calculate_gpa_vku, get_letter_grade
+
+# Các ngưỡng quy đổi thang 10 và giá trị sát x.xx5 dễ lệch khi làm tròn
+GPA_EDGES = [0.0, 3.99, 4.0, 5.49, 5.5, 6.49, 6.5, 6.99, 7.0, 7.25, 7.5, 7.75, 7.99, 8.0, 8.49, 8.5, 10.0]
+HALF_CASES = [0.005, 0.015, 0.125, 0.675, 1.005, 2.675, 4.345, 5.555, 6.125, 7.005, 7.125, 8.495, 9.995]
+
+
+def scalar_totals(row, weight_percents):
+    """Cách tính cũ của trang nhập điểm: cộng từng cột có điểm, round(), quy đổi."""
+    total = 0
+    for value, percent in zip(row, weight_percents):
+        if value is not None:
+            total += value * (percent / 100)
+    t10 = round(total, 2)
+    t4 = calculate_gpa_vku(t10)
+    return t10, t4, get_letter_grade(t4), t4 >= 1.0
+
+
+def random_weights(rng, k):
+    cuts = sorted(rng.sample(range(1, 100), k - 1))
+    return [b - a for a, b in zip([0] + cuts, cuts + [100])]
+
+
+def random_score(rng):
+    kind = rng.random()
+    if kind < 0.15:
+        return None
+    if kind < 0.5:
+        return rng.randint(0, 40) / 4  # bước 0.25 như thực tế
+    if kind < 0.8:
+        return rng.randint(0, 100) / 10
+    return round(rng.uniform(0, 10), 3)
+
+
+def test_round2_matches_python_round():
+    rng = random.Random(1)
+    values = HALF_CASES + [v + d for v in HALF_CASES for d in (-1e-9, 1e-9)] + \
+        [rng.uniform(0, 10) for _ in range(5000)] + [rng.randint(0, 10000) / 1000 for _ in range(5000)]
+    assert round2(values).tolist() == [round(v, 2) for v in values]
+
+
+def test_gpa_and_letters_match_scalar_at_edges():
+    values = GPA_EDGES + [math.nextafter(v, -1) for v in GPA_EDGES[1:]] + [i / 100 for i in range(1001)]
+    assert gpa_4(values).tolist() == [calculate_gpa_vku(v) for v in values]
+
+    edges_4 = LETTER_BINS.tolist()
+    scores_4 = [0.0] + edges_4 + [math.nextafter(v, 0) for v in edges_4] + gpa_4(values).tolist()
+    assert letter_grades(scores_4).tolist() == [get_letter_grade(v) for v in scores_4]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_compute_totals_matches_scalar_on_random_classes(seed):
+    rng = random.Random(seed)
+    k = rng.randint(1, 6)
+    weights = random_weights(rng, k)
+    rows = [[random_score(rng) for _ in range(k)] for _ in range(2000)]
+    matrix = [[np.nan if v is None else v for v in row] for row in rows]
+
+    result = list(zip(*(arr.tolist() for arr in compute_totals(matrix, weights))))
+    assert result == [scalar_totals(row, weights) for row in rows]
+
+
+def test_benchmark_throughput():
+    rng = np.random.default_rng(0)
+    n, weights = 200_000, [10, 20, 20, 50]
+    matrix = np.round(rng.uniform(0, 10, (n, len(weights))) * 4) / 4
+    matrix[rng.random(matrix.shape) < 0.1] = np.nan
+
+    started = time.perf_counter()
+    compute_totals(matrix, weights)
+    vector_time = time.perf_counter() - started
+
+    sample = matrix[:20_000].tolist()
+    started = time.perf_counter()
+    for row in sample:
+        scalar_totals([None if math.isnan(v) else v for v in row], weights)
+    scalar_time = (time.perf_counter() - started) * n / len(sample)
+
+    print(f'\n{n} SV: vector {vector_time:.3f}s ({n / vector_time:,.0f} SV/s), '
+          f'scalar ~{scalar_time:.2f}s, nhanh hơn {scalar_time / vector_time:.0f} lần')
+    assert vector_time < scalar_time
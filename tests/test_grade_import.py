@@ -0,0 +1,119 @@
+import io
+import pandas as pd
+import pytest
+from werkzeug.datastructures import FileStorage
+from app.models import Enrollment, GradeScore, GradeWeight
+from app.grade_import import GradeImportError, read_grade_file, preview_grades, apply_grade_changes
+from tests import factories
+
+
+def _upload(filename, sheets=None, text=None):
+    if text is not None:
+        return FileStorage(io.BytesIO(text.encode('utf-8')), filename=filename)
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer) as writer:
+        for name, rows in sheets.items():
+            pd.DataFrame(rows[1:], columns=rows[0]).to_excel(writer, sheet_name=name, index=False)
+    buffer.seek(0)
+    return FileStorage(buffer, filename=filename)
+
+
+@pytest.fixture
+def graded_class(db):
+    sub = factories.subject()
+    weights = [GradeWeight(subject_id=sub.id, name='Giữa kỳ', weight_percent=40, order_index=1),
+               GradeWeight(subject_id=sub.id, name='Cuối kỳ', weight_percent=60, order_index=2)]
+    db.session.add_all(weights)
+    cls = factories.klass(sub=sub, name='PY-01')
+    a, b = factories.student(code='SV001'), factories.student(code='SV002')
+    factories.enroll(a, cls)
+    enroll_b = factories.enroll(b, cls)
+    factories.student(code='SV999')  # không thuộc lớp
+    db.session.add(GradeScore(enrollment_id=enroll_b.id, grade_weight_id=weights[0].id, value=7.0))
+    db.session.commit()
+    return cls, weights
+
+
+def test_preview_reports_bad_rows_and_only_changed_cells(graded_class):
+    cls, weights = graded_class
+    df = read_grade_file(_upload('diem.csv', text=(
+        'MSSV,Giữa kỳ,Cuối kỳ\n'
+        'SV001,8,9.5\n'
+        'SV002,7,\n'        # điểm cũ giữ nguyên, ô trống bỏ qua -> không đổi
+        'SV999,5,5\n'
+        ',5,5\n'
+        'SV001,x,11\n'
+    )))
+    report, changes, columns = preview_grades(cls.id, weights, df)
+    assert columns == ['Giữa kỳ', 'Cuối kỳ']
+    errors = {r['row']: r['errors'] for r in report}
+    assert errors['4'] == ['Sinh viên không thuộc lớp']
+    assert errors['5'] == ['Thiếu mã sinh viên']
+    assert 'Mã sinh viên bị lặp trong file' in errors['2'] and 'Cột "Giữa kỳ": không phải số' in errors['6']
+    assert 'Cột "Cuối kỳ": điểm phải từ 0 tới 10' in errors['6']
+    assert changes == []  # SV001 bị lặp -> cả 2 dòng bị loại
+
+
+def test_apply_saves_changes_and_totals(graded_class):
+    cls, weights = graded_class
+    df = read_grade_file(_upload('diem.csv', text='mssv,Giữa kỳ,Cuối kỳ\nSV001,8,9.5\nSV002,7,6\n'))
+    report, changes, _ = preview_grades(cls.id, weights, df)
+    assert report == []
+    assert sorted((c['student_code'], c['column'], c['old_value'], c['new_value']) for c in changes) == [
+        ('SV001', 'Cuối kỳ', None, 9.5), ('SV001', 'Giữa kỳ', None, 8.0), ('SV002', 'Cuối kỳ', None, 6.0)]
+    apply_grade_changes(cls.id, weights, changes)
+    from app import db
+    db.session.commit()
+    totals = dict(db.session.query(Enrollment.student_id, Enrollment.total_10)
+                  .filter(Enrollment.class_id == cls.id).all())
+    assert sorted(totals.values()) == [6.4, 8.9]
+
+
+def test_xlsx_uses_sheet_named_after_class(graded_class):
+    cls, weights = graded_class
+    df = read_grade_file(_upload('diem.xlsx', {
+        'PY-02': [['MSSV', 'Giữa kỳ'], ['SV777', '1']],
+        'py-01': [['MSSV', 'Giữa kỳ'], ['SV001', '9']],
+    }), cls.name)
+    assert df['student_code'].tolist() == ['SV001']
+    assert df['_row'].tolist() == ['py-01!2']
+
+
+def test_xlsx_with_several_class_sheets_is_rejected(graded_class):
+    cls, _ = graded_class
+    upload = _upload('diem.xlsx', {
+        'Nhóm 1': [['MSSV', 'Giữa kỳ'], ['SV001', '9']],
+        'Nhóm 2': [['MSSV', 'Giữa kỳ'], ['SV002', '9']],
+        'Ghi chú': [['Nội dung'], ['...']],
+    })
+    with pytest.raises(GradeImportError, match='2 sheet bảng điểm'):
+        read_grade_file(upload, cls.name)
+
+
+def test_single_grade_sheet_is_accepted_and_xls_rejected(graded_class):
+    cls, _ = graded_class
+    df = read_grade_file(_upload('diem.xlsx', {
+        'Ghi chú': [['Nội dung'], ['...']],
+        'Bảng điểm': [['Mã SV', 'Cuối kỳ'], ['SV002', '8']],
+    }), cls.name)
+    assert df['student_code'].tolist() == ['SV002']
+    with pytest.raises(GradeImportError, match='.xls'):
+        read_grade_file(_upload('diem.xls', text='x'), cls.name)
+
+
+def test_import_route_previews_then_confirms(client, graded_class):
+    from app import db
+    cls, _ = graded_class
+    factories.login(client, cls.teacher.user_id)
+    csv = 'MSSV,Cuối kỳ\nSV001,9\n'
+
+    preview = client.post(f'/teacher/class/{cls.id}/grades/import',
+                          data={'file': (io.BytesIO(csv.encode()), 'diem.csv')}).get_json()
+    assert preview['success'] and preview['preview'] and len(preview['changes']) == 1
+    assert GradeScore.query.count() == 1
+
+    saved = client.post(f'/teacher/class/{cls.id}/grades/import',
+                        data={'file': (io.BytesIO(csv.encode()), 'diem.csv'), 'confirm': '1'}).get_json()
+    assert saved['success'] and not saved['preview']
+    db.session.expire_all()
+    assert GradeScore.query.filter(GradeScore.value.isnot(None)).count() == 2
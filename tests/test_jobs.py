@@ -0,0 +1,130 @@
+import json
+import threading
+import pytest
+from app.jobs import JobRunner, JobError, job_type, enqueue, job_dict, JOB_TYPES
+from app.models import Enrollment, GradeScore, GradeWeight, Job
+from tests import factories
+
+calls = []
+gate = threading.Event()
+
+
+@job_type('test_echo', concurrency=3, max_attempts=2)
+def _echo(ctx, value):
+    calls.append(value)
+    if value == 'boom':
+        raise RuntimeError('hỏng')
+    if value == 'refuse':
+        raise JobError('không hợp lệ')
+    ctx.set_result({'value': value})
+    return f'ok {value}'
+
+
+@job_type('test_single', concurrency=1, max_attempts=1)
+def _single(ctx, value):
+    gate.wait(5)
+    return value
+
+
+@pytest.fixture
+def runner(app, db):
+    r = JobRunner()
+    r.app = app
+    r.workers = 4
+    r._start_pool()
+    calls.clear()
+    gate.clear()
+    yield r
+    gate.set()
+    r._pool.shutdown(wait=True)
+
+
+def _run_round(runner):
+    runner.dispatch()
+    runner._pool.shutdown(wait=True)
+    runner._pid = None
+    runner._start_pool()
+
+
+def _job(job_id):
+    from app import db
+    db.session.expire_all()
+    return db.session.get(Job, job_id)
+
+
+def test_job_result_and_failures(runner):
+    ok, boom, refuse = (enqueue('test_echo', {'value': v}).id for v in ('a', 'boom', 'refuse'))
+    _run_round(runner)
+
+    done = job_dict(_job(ok))
+    assert done['status'] == 'done' and done['message'] == 'ok a' and done['result'] == {'value': 'a'}
+    assert _job(boom).status == 'queued' and _job(boom).attempts == 1  # lỗi bất ngờ -> thử lại sau
+    assert _job(refuse).status == 'failed' and _job(refuse).message == 'không hợp lệ'
+    assert job_dict(_job(refuse))['result'] is None
+
+
+def test_concurrency_limit_is_checked_when_claiming(app, runner):
+    first, second = enqueue('test_single', {'value': 1}).id, enqueue('test_single', {'value': 2}).id
+    runner.dispatch()
+    assert _job(first).status == 'running' and _job(second).status == 'queued'
+
+    # Process khác: số đếm lọc nhanh đã cũ nhưng lúc nhận việc vẫn thấy loại việc đã đủ chỗ
+    other = JobRunner()
+    other.app = app
+    assert other._claim(second, JOB_TYPES['test_single'], _job(second).run_after) is False
+    assert _job(second).status == 'queued'
+
+    gate.set()
+    runner._pool.shutdown(wait=True)
+    assert _job(first).status == 'done'
+    assert other._claim(second, JOB_TYPES['test_single'], _job(second).run_after) is True
+
+
+@pytest.fixture
+def semester_with_grades(db):
+    sem = factories.semester()
+    sub = factories.subject()
+    weight = GradeWeight(subject_id=sub.id, name='Cuối kỳ', weight_percent=100, order_index=1)
+    db.session.add(weight)
+    db.session.flush()
+    enrollments = []
+    for locked in (False, True):
+        cls = factories.klass(sem=sem, sub=sub)
+        cls.is_locked = locked
+        enrollment = factories.enroll(factories.student(), cls)
+        db.session.add(GradeScore(enrollment_id=enrollment.id, grade_weight_id=weight.id, value=8.0))
+        enrollments.append(enrollment)
+    db.session.commit()
+    return sem, enrollments
+
+
+def test_recompute_job_skips_locked_classes(runner, semester_with_grades):
+    from app import db
+    sem, (open_enroll, locked_enroll) = semester_with_grades
+    job_id = enqueue('recompute_grades', {'semester_id': sem.id}).id
+    _run_round(runner)
+    assert _job(job_id).status == 'done'
+    assert db.session.get(Enrollment, open_enroll.id).total_10 == 8.0
+    assert db.session.get(Enrollment, locked_enroll.id).total_10 is None
+
+    sem.is_active = False
+    db.session.commit()
+    job_id = enqueue('recompute_grades', {'semester_id': sem.id}).id
+    _run_round(runner)
+    assert _job(job_id).status == 'failed'
+
+
+def test_recompute_route_rejects_closed_semester(client, semester_with_grades):
+    from app import db
+    sem, _ = semester_with_grades
+    sem.is_active = False
+    admin = factories.admin()
+    db.session.commit()
+    factories.login(client, admin.id)
+    client.post(f'/admin/semester/{sem.id}/recompute')
+    assert Job.query.count() == 0
+
+    sem.is_active = True
+    db.session.commit()
+    client.post(f'/admin/semester/{sem.id}/recompute')
+    assert json.loads(Job.query.one().params) == {'semester_id': sem.id}
@@ -0,0 +1,80 @@
+import io
+import pandas as pd
+import pytest
+from werkzeug.datastructures import FileStorage
+from app.models import CodeSequence, Student, User
+from app.onboarding import (OnboardingError, allocate_codes, onboard_students, read_student_file)
+from app.utils import generate_email_prefix
+from tests import factories
+
+MAJORS = {'GIT': 'CNTT - Kỹ sư phần mềm', 'GBA': 'Quản trị kinh doanh'}
+
+
+def _csv(text, filename='sv.csv'):
+    return FileStorage(io.BytesIO(text.encode('utf-8')), filename=filename)
+
+
+def _last_value(prefix):
+    seq = CodeSequence.query.filter_by(prefix=prefix).first()
+    return seq.last_value if seq else None
+
+
+def test_allocate_codes_continues_from_existing_codes(db):
+    factories.student(code='GIT007')
+    db.session.commit()
+    assert allocate_codes('GIT', 3) == 8
+    assert allocate_codes('GIT', 1) == 11
+    assert _last_value('GIT') == 11
+
+
+def test_onboard_students_assigns_code_blocks_and_unique_emails(db):
+    taken = f"{generate_email_prefix('Lê Văn An')}.git001@vku.udn.vn"
+    db.session.add(User(email=taken, full_name='Người cũ', role='teacher', password_hash='x'))
+    db.session.commit()
+
+    df = read_student_file(_csv('full_name,major_code,cohort,class_name\n'
+                                'Lê Văn An,git,k24,\n'
+                                'Phạm Thị Bình,GBA,K24,24GBA2\n'
+                                'Lê Văn An,GIT,K24,\n'))
+    records = onboard_students(df, MAJORS)
+    assert [r['student_code'] for r in records] == ['GIT001', 'GBA001', 'GIT002']
+    assert records[0]['email'] != taken and records[0]['email'].endswith('.git001@vku.udn.vn')
+    assert [r['class_name'] for r in records] == ['24GIT', '24GBA2', '24GIT']
+    assert Student.query.count() == 3
+    assert User.query.filter_by(role='student').count() == 3
+
+
+def test_invalid_rows_reject_file_before_allocating_codes(db):
+    df = read_student_file(_csv('full_name,major_code,cohort\nA,GIT,K24\n,GIT,K24\nB,XYZ,K24\n'))
+    with pytest.raises(OnboardingError, match='Dòng 3: Thiếu họ tên; Dòng 4: Mã ngành không hợp lệ'):
+        onboard_students(df, MAJORS)
+    assert _last_value('GIT') is None
+    assert Student.query.count() == 0
+
+
+def test_read_student_file_errors(db):
+    with pytest.raises(OnboardingError, match='Thiếu cột: cohort'):
+        read_student_file(_csv('full_name,major_code\nA,GIT\n'))
+    with pytest.raises(OnboardingError, match='.xls'):
+        read_student_file(_csv('x', filename='sv.xls'))
+    buffer = io.BytesIO()
+    pd.DataFrame([['A', 'GIT', 'K24']], columns=['Full_Name', 'Major_Code', 'Cohort']).to_excel(buffer, index=False)
+    buffer.seek(0)
+    assert read_student_file(FileStorage(buffer, filename='sv.xlsx'))['full_name'].tolist() == ['A']
+
+
+def test_admin_form_validates_before_allocating_code(client, db):
+    factories.login(client, factories.admin().id)
+    db.session.commit()
+
+    client.post('/admin/students', data={'full_name': ' ', 'major_code': 'GIT', 'cohort': 'K24'})
+    client.post('/admin/students', data={'full_name': 'Lê Văn An', 'major_code': 'XYZ', 'cohort': 'K24'})
+    assert _last_value('GIT') is None and _last_value('XYZ') is None
+
+    taken = f"{generate_email_prefix('Lê Văn An')}.git001@vku.udn.vn"
+    db.session.add(User(email=taken, full_name='Người cũ', role='teacher', password_hash='x'))
+    db.session.commit()
+    client.post('/admin/students', data={'full_name': 'Lê Văn An', 'major_code': 'GIT', 'cohort': 'K24',
+                                         'class_name': '24GIT'})
+    created = Student.query.filter_by(student_code='GIT001').one()
+    assert created.user.email != taken and _last_value('GIT') == 1
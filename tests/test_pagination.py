@@ -0,0 +1,34 @@
+import base64
+import json
+from app.models import Student
+from app.pagination import encode_cursor, decode_cursor, keyset_page
+from tests import factories
+
+
+def _raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+def test_decode_cursor_rejects_wrong_types():
+    assert decode_cursor(encode_cursor('GIT001')) == 'GIT001'
+    assert decode_cursor(encode_cursor(42)) == 42
+    assert decode_cursor(encode_cursor(42), str) is None
+    for value in ([1, 2], {'a': 1}, True, None, 1.5):
+        assert decode_cursor(_raw_cursor(value)) is None
+    assert decode_cursor('!!!') is None
+
+
+def test_tampered_cursor_falls_back_to_first_page(client, db):
+    for i in range(3):
+        factories.student(code=f'GIT00{i}')
+    admin = factories.admin()
+    db.session.commit()
+
+    items, next_cursor = keyset_page(Student.query, Student.student_code, per_page=2)
+    assert [s.student_code for s in items] == ['GIT000', 'GIT001'] and decode_cursor(next_cursor) == 'GIT001'
+    items, _ = keyset_page(Student.query, Student.student_code, _raw_cursor(['GIT001']), per_page=2)
+    assert [s.student_code for s in items] == ['GIT000', 'GIT001']
+
+    factories.login(client, admin.id)
+    res = client.get('/admin/api/students', query_string={'cursor': _raw_cursor({'x': 1})})
+    assert res.status_code == 200 and len(res.get_json()['items']) == 3
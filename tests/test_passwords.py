@@ -0,0 +1,27 @@
+import pytest
+from werkzeug.security import generate_password_hash
+from app.passwords import PasswordHasher
+
+
+class _App:
+    def __init__(self, method):
+        self.config = {'PASSWORD_HASH_METHOD': method}
+
+
+@pytest.mark.parametrize('method', ['scrypt', 'pbkdf2', 'pbkdf2:sha256', 'pbkdf2:sha256:1000', 'scrypt:16384:8:1'])
+def test_hash_made_with_configured_method_needs_no_rehash(method):
+    hasher = PasswordHasher()
+    hasher.init_app(_App(method))
+    assert not hasher.needs_rehash(generate_password_hash('secret', method=method))
+
+
+@pytest.mark.parametrize('configured, old', [
+    ('scrypt', 'pbkdf2:sha256:600000'),
+    ('scrypt', 'scrypt:16384:8:1'),
+    ('pbkdf2', 'pbkdf2:sha256:1000'),
+    ('pbkdf2:sha256:1000', 'scrypt'),
+])
+def test_hash_with_other_parameters_needs_rehash(configured, old):
+    hasher = PasswordHasher()
+    hasher.init_app(_App(configured))
+    assert hasher.needs_rehash(generate_password_hash('secret', method=old))
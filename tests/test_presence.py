@@ -0,0 +1,56 @@
+import sqlite3
+import pytest
+from app.presence import PresenceTracker
+from tests import factories
+
+
+@pytest.fixture
+def tracker(app, tmp_path):
+    old_path = app.config['PRESENCE_DB_PATH']
+    app.config['PRESENCE_DB_PATH'] = str(tmp_path / 'presence.sqlite3')
+    try:
+        t = PresenceTracker()
+        t.init_app(app)
+    finally:
+        app.config['PRESENCE_DB_PATH'] = old_path
+    return t
+
+
+def test_touch_only_buffers_until_flush(tracker):
+    tracker.touch(1, 'student')
+    tracker.touch(1, 'student')
+    tracker.touch(2, 'teacher')
+    assert tracker.counts()['total'] == 0
+    assert tracker.flush() == 2
+    assert tracker.counts() == {'admin': 0, 'teacher': 1, 'student': 1, 'total': 2}
+    assert {row[0] for row in tracker.online('student')} == {1}
+
+
+def test_locked_file_is_logged_and_retried(tracker, caplog):
+    tracker.timeout = 0.05
+    tracker._local.conn = None  # mở lại connection với timeout ngắn
+    blocker = sqlite3.connect(tracker.path)
+    blocker.execute('BEGIN EXCLUSIVE')
+    try:
+        tracker.touch(7, 'admin')
+        tracker.flush_logged()
+        assert 'Ghi trạng thái online thất bại' in caplog.text
+    finally:
+        blocker.rollback()
+        blocker.close()
+    assert tracker.flush() == 1
+    assert tracker.counts()['admin'] == 1
+
+
+def test_request_does_not_write_presence_file(client, db, monkeypatch):
+    from app.presence import presence_tracker
+    sv = factories.student()
+    db.session.commit()
+    factories.login(client, sv.user_id)
+
+    def fail(*args, **kwargs):
+        raise sqlite3.OperationalError('database is locked')
+    monkeypatch.setattr(presence_tracker, '_conn', fail)
+    monkeypatch.setattr(presence_tracker, '_seen', set())
+    assert client.get('/').status_code < 500
+    assert any(uid == sv.user_id for _, uid in presence_tracker._pending)
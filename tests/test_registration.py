@@ -0,0 +1,19 @@
+from app.models import Enrollment, StudentTermGpa
+from tests import factories
+
+
+def test_registration_shows_new_semester_without_gpa_rows(client, db):
+    sem = factories.semester('HK Mới')
+    cls = factories.klass(sem=sem, name='PY-01')
+    factories.schedule(cls, 2, 1, 3)
+    sv = factories.student()
+    db.session.commit()
+    factories.login(client, sv.user_id)
+
+    client.post('/student/registration', data={'class_id': cls.id})
+    assert Enrollment.query.filter_by(student_id=sv.id, class_id=cls.id).count() == 1
+    # Đăng ký không ghi bảng GPA (chỉ lưu điểm mới ghi)
+    assert StudentTermGpa.query.filter_by(student_id=sv.id).count() == 0
+
+    page = client.get('/student/grades').get_data(as_text=True)
+    assert 'HK Mới' in page and 'PY-01' in page
@@ -0,0 +1,81 @@
+import io
+import pandas as pd
+import pytest
+from werkzeug.datastructures import FileStorage
+from app.models import Schedule
+from app.schedule_import import read_schedule_file, import_schedules, ImportFormatError
+from tests import factories
+
+
+def _frame(rows):
+    return pd.DataFrame(rows, columns=['class', 'day', 'start', 'count', 'room']).astype(str)
+
+
+@pytest.fixture
+def semester_classes(db):
+    sem = factories.semester()
+    busy, free = factories.teacher(), factories.teacher()
+    classes = {
+        'existing': factories.klass(sem=sem, gv=busy, name='Cũ'),
+        'busy': factories.klass(sem=sem, gv=busy, name='GV bận'),
+        'free': factories.klass(sem=sem, gv=free, name='GV rảnh'),
+        'other': factories.klass(sem=sem, name='Khác'),
+    }
+    factories.schedule(classes['existing'], 2, 1, 3, room='B1')
+    db.session.commit()
+    return sem, classes
+
+
+def test_row_rejected_for_teacher_does_not_block_its_room(db, semester_classes):
+    sem, _ = semester_classes
+    report, inserted, _ = import_schedules(_frame([
+        ['GV bận', '2', '1', '3', 'A1'],   # GV đang dạy lớp "Cũ" ở B1 -> loại
+        ['GV rảnh', '2', '2', '2', 'A1'],  # Cùng phòng A1 nhưng dòng trên không được nhận -> hợp lệ
+    ]), sem.id)
+    assert report[0]['errors'] == ['Trùng giảng viên với lớp "Cũ"']
+    assert report[1]['status'] == 'ok'
+    assert inserted == 1
+
+
+def test_room_and_teacher_conflicts_with_accepted_rows(db, semester_classes):
+    sem, _ = semester_classes
+    report, inserted, class_ids = import_schedules(_frame([
+        ['GV rảnh', '3', '1', '3', 'A1'],
+        ['Khác', '3', '3', '2', 'A1'],    # Trùng phòng với dòng 1
+        ['GV rảnh', '3', '2', '1', 'C9'],  # Trùng GV với dòng 1
+        ['Khác', '3', '4', '2', 'A1'],     # Nối tiếp dòng 1 -> hợp lệ
+    ]), sem.id)
+    assert [r['status'] for r in report] == ['ok', 'error', 'error', 'ok']
+    assert report[1]['errors'] == ['Trùng phòng với lớp "GV rảnh"']
+    assert report[2]['errors'] == ['Trùng giảng viên với lớp "GV rảnh"']
+    assert inserted == 2 and len(class_ids) == 2
+    assert Schedule.query.count() == 3
+
+
+@pytest.mark.parametrize('day, start, count', [
+    ('2.5', '1', '2'), ('2', '1.5', '2'), ('2', '1', '2.5'),
+    ('9', '1', '2'), ('1', '1', '2'), ('2', '0', '2'), ('2', '11', '3'), ('2', '1', '0'), ('x', '1', '2'),
+])
+def test_invalid_day_and_lessons_are_reported(db, semester_classes, day, start, count):
+    sem, _ = semester_classes
+    report, inserted, _ = import_schedules(_frame([['Khác', day, start, count, 'A1']]), sem.id)
+    assert report[0]['status'] == 'error'
+    assert inserted == 0
+
+
+def test_unknown_class_and_missing_room(db, semester_classes):
+    sem, _ = semester_classes
+    report, inserted, _ = import_schedules(_frame([['Không có', '2', '6', '2', 'A1'],
+                                                   ['Khác', '2', '6', '2', '']]), sem.id)
+    assert report[0]['errors'] == ['Lớp không tồn tại trong học kỳ']
+    assert report[1]['errors'] == ['Thiếu phòng']
+    assert inserted == 0
+
+
+def test_read_schedule_file_formats():
+    csv = FileStorage(io.BytesIO(b'Class,Day,Start,Count,Room\nL1,2,1,3,A1\n'), filename='tkb.csv')
+    assert list(read_schedule_file(csv).columns) == ['class', 'day', 'start', 'count', 'room']
+    with pytest.raises(ImportFormatError):
+        read_schedule_file(FileStorage(io.BytesIO(b'class,day\n'), filename='tkb.csv'))
+    with pytest.raises(ImportFormatError):
+        read_schedule_file(FileStorage(io.BytesIO(b'\xd0\xcf\x11\xe0'), filename='tkb.xls'))
@@ -0,0 +1,65 @@
+import pytest
+from datetime import date
+from sqlalchemy import text, inspect
+from app.models import AttendanceLog, AttendanceSummary, Class, StudentScheduleMask, UserSearchToken
+from app.schema_upgrade import upgrade_schema
+from tests import factories
+
+
+def _downgrade_to_baseline(db):
+    """Đưa DB test về schema bản gốc: bỏ cột / khóa / bảng mà các thay đổi sau đã thêm."""
+    with db.engine.begin() as conn:
+        conn.execute(text('ALTER TABLE classes DROP COLUMN enrolled_count'))
+        conn.execute(text('ALTER TABLE classes DROP COLUMN schedule_mask'))
+        conn.execute(text('DROP TABLE attendance_logs'))
+        conn.execute(text('CREATE TABLE attendance_logs (id INTEGER PRIMARY KEY, class_id INTEGER NOT NULL, '
+                          'student_id INTEGER NOT NULL, date DATE NOT NULL, status VARCHAR(20))'))
+        for table in ('attendance_summaries', 'student_term_gpa', 'user_search_tokens', 'student_schedule_masks'):
+            conn.execute(text(f'DROP TABLE {table}'))
+    # Connection SQLite cũ trong pool còn giữ schema trước khi DROP -> như process mới khởi động
+    db.engine.dispose()
+
+
+@pytest.fixture
+def old_db(db):
+    if db.engine.dialect.name != 'sqlite':
+        pytest.skip('Dựng schema cũ bằng DDL của SQLite')
+    sem = factories.semester()
+    cls = factories.klass(sem=sem, max_students=5)
+    factories.schedule(cls, 2, 1, 3)
+    students = [factories.student() for _ in range(3)]
+    for sv in students:
+        factories.enroll(sv, cls)
+    db.session.commit()
+    ids = {'class': cls.id, 'students': [sv.id for sv in students]}
+    db.session.remove()
+    _downgrade_to_baseline(db)
+    with db.engine.begin() as conn:
+        day = date(2026, 1, 5).isoformat()
+        for status in ('present', 'absent', 'late'):  # 3 lần lưu trùng cùng 1 ngày
+            conn.execute(text('INSERT INTO attendance_logs (class_id, student_id, date, status) '
+                              'VALUES (:c, :s, :d, :st)'),
+                         {'c': ids['class'], 's': ids['students'][0], 'd': day, 'st': status})
+    return ids
+
+
+def test_upgrade_adds_columns_and_backfills(db, old_db):
+    steps = upgrade_schema()
+    assert steps
+
+    cls = db.session.get(Class, old_db['class'])
+    assert cls.enrolled_count == 3
+    assert cls.schedule_mask != '0'
+    assert StudentScheduleMask.query.count() == 3
+
+    logs = AttendanceLog.query.all()
+    assert [log.status for log in logs] == ['late']  # Giữ bản ghi mới nhất
+    summary = AttendanceSummary.query.one()
+    assert (summary.present, summary.absent, summary.late) == (0, 0, 1)
+    assert any(i['name'] == 'unique_attendance' for i in inspect(db.engine).get_indexes('attendance_logs'))
+    assert UserSearchToken.query.count() > 0
+
+
+def test_upgrade_is_idempotent(db, old_db):
+    upgrade_schema()
+    assert upgrade_schema() == []
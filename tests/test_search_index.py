@@ -0,0 +1,92 @@
+from sqlalchemy import insert
+from app.models import Student, User, UserSearchToken
+from app.search_index import normalize, tokens_for, search_users, search_user_ids, reindex_users
+from tests import factories
+
+
+def test_normalize_and_tokens():
+    assert normalize('Nguyễn Văn Đạt') == 'nguyen van dat'
+    assert tokens_for('Lê Thị Ánh', 'anhlt.git001@vku.udn.vn', 'GIT001') == \
+        {'le', 'thi', 'anh', 'anhlt', 'git001', 'it001', 't001', '001', '01', '1'}
+
+
+def test_search_users_ranks_exact_words_and_tracks_updates(db):
+    dat = factories.student('Nguyễn Văn Đạt', code='GIT001')
+    factories.student('Nguyễn Văn Đạtt', code='GIT002')
+    factories.teacher('Nguyễn Đạt', code='GV001')
+    db.session.commit()
+
+    results = search_users('dat nguyen', role='student')
+    assert [r['code'] for r in results] == ['GIT001', 'GIT002']
+    assert results[0]['score'] > results[1]['score']
+    assert {r['role'] for r in search_users('đạt')} == {'student', 'teacher'}
+
+    dat.user.full_name = 'Trần Minh'
+    db.session.commit()
+    assert [r['code'] for r in search_users('dat', role='student')] == ['GIT002']
+    assert [r['code'] for r in search_users('tran minh')] == ['GIT001']
+    assert search_users('!!!') == []
+
+
+def test_search_user_ids_ranks_and_limits_in_sql(db):
+    _bulk_students(db, 30)
+    exact = factories.student('Nguyễn Ng', code='GBA001')
+    single = factories.student('Lê N', code='GBA002')
+    db.session.commit()
+    ranked = search_user_ids('ng', role='student', limit=5)
+    assert len(ranked) == 5
+    assert ranked[0] == (exact.user_id, 2)  # khớp trọn token 'ng' xếp trên khớp tiền tố 'nguyen'
+    assert {score for _, score in ranked[1:]} == {1}
+    assert search_user_ids('n') == [(single.user_id, 2)]  # 1 ký tự: chỉ khớp trọn token
+    an17 = db.session.query(User.id).filter_by(email='an17@vku.udn.vn').scalar()
+    assert search_user_ids('nguyen an 17') == [(an17, 6)]
+    assert search_user_ids('nguyen binh') == []
+
+
+def _bulk_students(db, n):
+    """Ghi bằng Core như app/onboarding.py (chỉ mục cập nhật qua reindex_users)."""
+    db.session.execute(insert(User.__table__), [
+        {'email': f'an{i}@vku.udn.vn', 'password_hash': 'x', 'full_name': f'Nguyễn Văn An {i}', 'role': 'student'}
+        for i in range(n)])
+    ids = [uid for (uid,) in db.session.query(User.id).filter(User.email.like('an%')).order_by(User.id)]
+    db.session.execute(insert(Student.__table__), [
+        {'user_id': uid, 'student_code': f'GIT{i:04d}'} for i, uid in enumerate(ids)])
+    reindex_users(ids)
+    db.session.commit()
+
+
+def test_student_list_search_pages_through_every_match(client, db):
+    _bulk_students(db, 620)
+    factories.student('Lê Bình', code='GBA001')
+    admin = factories.admin()
+    db.session.commit()
+    factories.login(client, admin.id)
+
+    codes, cursor = [], None
+    while True:
+        page = client.get('/admin/api/students', query_string={'search': 'nguyen an', 'cursor': cursor}).get_json()
+        codes += [item['student_code'] for item in page['items']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert len(codes) == len(set(codes)) == 620
+    assert page['approx_total'] == 620
+    assert UserSearchToken.query.filter_by(token='nguyen').count() == 620
+
+
+def test_student_list_search_keeps_substring_code_match(client, db):
+    factories.student('Lê Bình', code='GIT001')
+    factories.student('Trần An', code='GBA001')
+    factories.student('Phạm Cường', code='GIT010')
+    factories.teacher('Ngô Tú', code='GV001')
+    admin = factories.admin()
+    db.session.commit()
+    factories.login(client, admin.id)
+
+    page = client.get('/admin/api/students', query_string={'search': '001'}).get_json()
+    assert sorted(item['student_code'] for item in page['items']) == ['GBA001', 'GIT001']
+    page = client.get('/admin/api/teachers', query_string={'search': 'V00'}).get_json()
+    assert [item['teacher_code'] for item in page['items']] == ['GV001']
+    page = client.get('/admin/api/students', query_string={'search': 'binh'}).get_json()
+    assert [item['student_code'] for item in page['items']] == ['GIT001']
+    assert client.get('/admin/api/students', query_string={'search': '%%'}).get_json()['items'] == []
@@ -0,0 +1,69 @@
+import threading
+from app import db
+from app.models import Class
+from app.seats import reserve_seat, rebuild_seat_counts
+from tests import factories
+
+
+def test_reserve_seat_stops_at_capacity(db):
+    cls = factories.klass(max_students=2)
+    db.session.commit()
+    assert reserve_seat(cls.id) and reserve_seat(cls.id)
+    assert not reserve_seat(cls.id)
+    db.session.commit()
+    db.session.refresh(cls)
+    assert cls.enrolled_count == 2
+
+
+def test_rollback_returns_the_seat(db):
+    cls = factories.klass(max_students=1)
+    db.session.commit()
+    assert reserve_seat(cls.id)
+    db.session.rollback()
+    assert db.session.get(Class, cls.id).enrolled_count == 0
+
+
+def test_concurrent_reservations_never_oversell(app, db):
+    """Nhiều thread cùng giành chỗ trong 1 lớp: đúng max_students lượt thành công."""
+    capacity, attempts = 10, 40
+    cls = factories.klass(max_students=capacity)
+    db.session.commit()
+    class_id = cls.id
+
+    start = threading.Barrier(attempts)
+    results, errors = [], []
+
+    def register():
+        with app.app_context():
+            try:
+                start.wait()
+                ok = reserve_seat(class_id)
+                db.session.commit()
+                results.append(ok)
+            except Exception as e:  # pragma: no cover - báo lỗi rõ trong assert bên dưới
+                db.session.rollback()
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=register) for _ in range(attempts)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert results.count(True) == capacity
+    db.session.expire_all()
+    assert db.session.get(Class, class_id).enrolled_count == capacity
+
+
+def test_rebuild_seat_counts(db):
+    cls = factories.klass()
+    for _ in range(3):
+        factories.enroll(factories.student(), cls)
+    cls.enrolled_count = 0
+    db.session.commit()
+    rebuild_seat_counts()
+    db.session.expire_all()
+    assert db.session.get(Class, cls.id).enrolled_count == 3
@@ -0,0 +1,57 @@
+import pytest
+from app.counters import stat_counters
+from app.models import Class, Semester
+from app.semester_close import SemesterCloseError, close_semester
+from tests import factories
+
+
+@pytest.fixture
+def semester(db):
+    sem = factories.semester()
+    classes = [factories.klass(sem=sem, name=name) for name in ('PY-01', 'PY-02')]
+    enrollments = [factories.enroll(factories.student(), cls) for cls in classes for _ in range(2)]
+    factories.klass(name='Lớp học kỳ khác')
+    db.session.commit()
+    stat_counters.reconcile()
+    return sem, enrollments
+
+
+def _reload(db, sem):
+    db.session.expire_all()
+    return db.session.get(Semester, sem.id), \
+        {cls.name: cls.is_locked for cls in Class.query.filter_by(semester_id=sem.id)}
+
+
+def test_ungraded_enrollment_rejects_and_unlocks_classes(db, semester):
+    sem, enrollments = semester
+    for enrollment in enrollments[:-1]:
+        enrollment.total_10 = 7.0
+    db.session.commit()
+
+    progress = []
+    with pytest.raises(SemesterCloseError, match=r'PY-02 \(1 SV chưa điểm\)'):
+        close_semester(sem.id, lambda percent, message: progress.append(percent))
+    assert progress == [20, 50]
+
+    sem, locked = _reload(db, sem)
+    assert sem.is_active is True
+    assert locked == {'PY-01': False, 'PY-02': False}
+    assert stat_counters.read()['active_semesters'] == 2
+
+
+def test_graded_semester_is_closed(db, semester):
+    sem, enrollments = semester
+    for enrollment in enrollments:
+        enrollment.total_10 = 7.0
+    db.session.commit()
+
+    assert close_semester(sem.id) == 2
+    sem, locked = _reload(db, sem)
+    assert sem.is_active is False
+    assert locked == {'PY-01': True, 'PY-02': True}
+    assert Class.query.filter_by(name='Lớp học kỳ khác').one().is_locked is False
+    assert stat_counters.read()['active_semesters'] == 1
+
+    with pytest.raises(SemesterCloseError, match='đã kết thúc'):
+        close_semester(sem.id)
+    assert stat_counters.read()['active_semesters'] == 1
@@ -0,0 +1,75 @@
+from app.bitmaps import refresh_class_mask
+from app.models import Schedule
+from app.timetable import COVERED, build_grid, student_grid, teacher_grid
+from tests import factories
+
+
+def _column(grid, day):
+    return [row[day - 2] for row in grid]
+
+
+def test_overlapping_sessions_share_the_first_cell():
+    a, b = {'class_name': 'A'}, {'class_name': 'B'}
+    col = _column(build_grid([(2, 2, 4, b), (2, 1, 3, a), (2, 1, 3, a), (9, 1, 2, b)]), 2)
+    assert col[0] == {'rowspan': 3, 'items': [a, b]}  # A bắt đầu sớm hơn, B gộp vào (A lặp chỉ ghi 1 lần)
+    assert col[1:3] == [COVERED, COVERED]
+    assert col[3] == {'rowspan': 1, 'items': [b]}  # phần còn lại của B
+    assert col[4:] == [None] * 8
+
+
+def test_session_is_split_at_lesson_breaks():
+    info = {'class_name': 'C'}
+    grid = build_grid([(3, 4, 11, info)])
+    col = _column(grid, 3)
+    assert [cell['rowspan'] if isinstance(cell, dict) else cell for cell in col] == \
+        [None, None, None, 2, COVERED, 5, COVERED, COVERED, COVERED, COVERED, 1, None]
+    assert all(cell is None for day in (2, 4, 5, 6, 7, 8) for cell in _column(grid, day))
+
+
+def _classes(grid):
+    return sorted(item['class_name'] for row in grid for cell in row if isinstance(cell, dict)
+                  for item in cell['items'])
+
+
+def test_student_grid_refreshes_after_registration(client, db):
+    sem = factories.semester()
+    first, second = factories.klass(sem=sem, name='PY-01'), factories.klass(sem=sem, name='PY-02')
+    factories.schedule(first, 2, 1, 3)
+    factories.schedule(second, 4, 6, 8)
+    for cls in (first, second):
+        refresh_class_mask(cls.id)
+    sv = factories.student()
+    db.session.commit()
+    factories.login(client, sv.user_id)
+
+    client.post('/student/registration', data={'class_id': first.id})
+    grid = student_grid(sv.id, sem.id)
+    assert _classes(grid) == ['PY-01']
+    assert student_grid(sv.id, sem.id) is grid  # không đổi gì -> dùng lưới đã cache
+
+    client.post('/student/registration', data={'class_id': second.id})
+    assert _classes(student_grid(sv.id, sem.id)) == ['PY-01', 'PY-02']
+
+
+def test_teacher_grid_refreshes_after_schedule_changes(client, db):
+    sem = factories.semester()
+    gv = factories.teacher()
+    cls = factories.klass(sem=sem, gv=gv, name='PY-01')
+    factories.schedule(cls, 2, 1, 3, room='A101')
+    admin = factories.admin()
+    db.session.commit()
+    factories.login(client, admin.id)
+
+    grid = teacher_grid(gv.id, [sem.id])
+    assert _classes(grid) == ['PY-01'] and teacher_grid(gv.id, [sem.id]) is grid
+
+    res = client.post('/admin/api/schedule/add', json={
+        'class_id': cls.id, 'day': 5, 'start': 7, 'count': 2, 'room': 'B202'}).get_json()
+    assert res['success']
+    grid = teacher_grid(gv.id, [sem.id])
+    assert _classes(grid) == ['PY-01', 'PY-01'] and grid[6][3]['rowspan'] == 2
+
+    added = Schedule.query.filter_by(room='B202').one()
+    assert client.post('/admin/api/schedule/delete', json={'schedule_id': added.id}).get_json()['success']
+    grid = teacher_grid(gv.id, [sem.id])
+    assert _classes(grid) == ['PY-01'] and grid[6][3] is None
@@ -0,0 +1,109 @@
+"""Kiểm tra tính đúng của bộ xếp lịch và benchmark trên học kỳ sinh ngẫu nhiên."""
+import random
+import time
+import pytest
+from app.bitmaps import lesson_bits
+from app.models import Class, Job, Schedule
+from app.timetable_solver import TimetableSolver, split_lessons, solve_semester, MAX_SESSION_LESSONS
+from tests import factories
+
+
+def synthetic_semester(n_classes, seed=1):
+    """~10 lớp / phòng, ~4 lớp / GV, 2-8 tiết / tuần."""
+    rnd = random.Random(seed)
+    rooms = [f'R{i}' for i in range(max(4, n_classes // 10))]
+    tasks = [(cid, rnd.randrange(max(1, n_classes // 4)), rnd.choice([2, 3, 3, 4, 6, 8]))
+             for cid in range(n_classes)]
+    return rooms, tasks
+
+
+def assert_valid(assigned, tasks, fixed=()):
+    """Không trùng phòng / GV (kể cả lịch cố định), đủ số tiết, mỗi ngày tối đa 1 buổi / lớp."""
+    lessons = {cid: (teacher_id, count) for cid, teacher_id, count in tasks}
+    rooms, teachers = {}, {}
+    for teacher_id, room, day, start, end in fixed:
+        bits = lesson_bits(day, start, end)
+        rooms[room] = rooms.get(room, 0) | bits
+        teachers[teacher_id] = teachers.get(teacher_id, 0) | bits
+    for cid, sessions in assigned.items():
+        teacher_id, count = lessons[cid]
+        assert sum(end - start + 1 for _, start, end, _ in sessions) == count
+        assert len({day for day, _, _, _ in sessions}) == len(sessions)
+        for day, start, end, room in sessions:
+            assert end - start + 1 <= MAX_SESSION_LESSONS
+            bits = lesson_bits(day, start, end)
+            assert not rooms.get(room, 0) & bits, f'trùng phòng {room}'
+            assert not teachers.get(teacher_id, 0) & bits, f'trùng GV {teacher_id}'
+            rooms[room] = rooms.get(room, 0) | bits
+            teachers[teacher_id] = teachers.get(teacher_id, 0) | bits
+
+
+@pytest.mark.parametrize('total, sizes', [(1, [1]), (3, [3]), (5, [5]), (6, [3, 3]), (8, [4, 4]), (11, [4, 4, 3])])
+def test_split_lessons(total, sizes):
+    assert split_lessons(total) == sizes
+
+
+def test_long_classes_get_every_lesson():
+    tasks = [(1, 'gv', 8), (2, 'gv', 3), (3, 'gv2', 10)]
+    assigned, unplaced = TimetableSolver(['A', 'B'], time_budget=2).solve(tasks)
+    assert unplaced == {}
+    assert len(assigned[1]) == 2 and len(assigned[3]) == 2
+    assert_valid(assigned, tasks)
+
+
+def test_fixed_schedules_are_respected():
+    solver = TimetableSolver(['A'], days=[2], time_budget=2)
+    solver.fix('gv', 'A', 2, 1, 5)
+    tasks = [(1, 'gv', 3), (2, 'gv2', 2)]
+    assigned, unplaced = solver.solve(tasks)
+    assert unplaced == {}
+    assert_valid(assigned, tasks, fixed=[('gv', 'A', 2, 1, 5)])
+
+
+def test_classes_that_cannot_fit_are_reported_whole():
+    # 1 phòng, 1 ngày: chỉ đủ chỗ cho 12 tiết
+    tasks = [(1, 'a', 5), (2, 'b', 5), (3, 'c', 4), (4, 'd', 0), (5, 'e', 12)]
+    assigned, unplaced = TimetableSolver(['A'], days=[2], time_budget=2).solve(tasks)
+    assert unplaced[4] == 'Số tiết không hợp lệ'
+    assert 'nhiều hơn số ngày' in unplaced[5]
+    assert len(unplaced) == 3 and set(assigned) | set(unplaced) == {1, 2, 3, 4, 5}
+    assert_valid(assigned, tasks)
+
+
+@pytest.mark.parametrize('n_classes', [200, 1000])
+def test_benchmark_synthetic_semester(n_classes):
+    rooms, tasks = synthetic_semester(n_classes)
+    started = time.monotonic()
+    assigned, unplaced = TimetableSolver(rooms, time_budget=50).solve(tasks)
+    elapsed = time.monotonic() - started
+    print(f'\n{n_classes} lớp, {len(rooms)} phòng: xếp {len(assigned)}, còn {len(unplaced)}, {elapsed:.2f}s')
+    assert elapsed < 60
+    assert len(assigned) >= 0.99 * n_classes
+    assert_valid(assigned, tasks)
+
+
+def test_solve_semester_applies_plan(db):
+    sem = factories.semester()
+    gv = factories.teacher()
+    fixed = factories.klass(sem=sem, gv=gv)
+    factories.schedule(fixed, 2, 1, 5, room='A')
+    pending = [factories.klass(sem=sem, gv=gv, sub=factories.subject(credits=3)) for _ in range(3)]
+    db.session.commit()
+
+    result = solve_semester(sem.id, ['A', 'B'], {str(pending[0].id): 8}, time_budget=2, apply=True)
+    assert result['total'] == 3 and result['unplaced'] == []
+    assert Schedule.query.filter_by(class_id=pending[0].id).count() == 2
+    assert all(db.session.get(Class, c.id).schedule_mask != '0' for c in pending)
+
+
+def test_solve_route_enqueues_job(client, db):
+    user = factories.admin()
+    sem = factories.semester()
+    db.session.commit()
+    factories.login(client, user.id)
+
+    res = client.post('/admin/api/schedule/solve', json={'semester_id': sem.id, 'rooms': ['A'], 'apply': True})
+    data = res.get_json()
+    assert data['success'] is True
+    job = db.session.get(Job, data['job_id'])
+    assert job.type == 'solve_timetable' and job.status == 'queued'